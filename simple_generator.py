@@ -5,271 +5,230 @@ Creates one presentation from kumpulan_lagu_ekklesia.txt with clean, simple slid
 """
 
 from pptx import Presentation
-from pptx.util import Inches, Pt
-from pptx.enum.text import PP_ALIGN, MSO_ANCHOR
-from pptx.dml.color import RGBColor
-from pptx.enum.dml import MSO_THEME_COLOR
-import re
+from pptx.opc.packuri import PackURI
 import argparse
-import math
+import os
+import sys
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
 
+# Parsing, rendering and packaging live in webapp/ and are shared with the
+# web app; this script only adds the command line and --watch
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'webapp'))
+from generator import (generate_presentation, extract_setlist, template_info, create_slide, create_toc_slides,
+                       save_presentation, COMPRESSION_PROFILES)
+from songs import (parse_songs, song_slides, plan_toc_layout, compile_song_corpus, validate_song_file,
+                   format_validation_report)
+from profiling import StageProfiler
 
-def parse_songs(file_path):
-    """Parse songs from text file."""
-    with open(file_path, 'r', encoding='utf-8') as file:
-        content = file.read()
-    
-    # Split by song markers (lines starting with #)
-    song_sections = re.split(r'\n(?=#)', content)
-    songs = []
-    
-    for section in song_sections:
-        if section.strip() and section.startswith('#'):
-            lines = section.split('\n')
-            
-            if lines:
-                # Extract title (remove #)
-                title = lines[0].replace('#', '').strip()
-                
-                # Get lyrics (everything after title), preserving empty lines
-                lyrics = lines[1:] if len(lines) > 1 else []
-                
-                if title:  # Only add if we have a title
-                    songs.append({
-                        'title': title,
-                        'lyrics': lyrics
-                    })
-    
-    return songs
+# inotify event masks (see <sys/inotify.h>)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
 
 
-def split_lyrics_into_slides(lyrics):
-    """Split lyrics into slides at paragraph breaks (empty lines)."""
-    slides = []
-    current_slide = []
-    
-    for line in lyrics:
-        if line.strip():  # Non-empty line
-            current_slide.append(line)
-        else:  # Empty line - natural paragraph break
-            if current_slide:  # Only create slide if we have content
-                slides.append(current_slide.copy())
-                current_slide = []
-    
-    # Add remaining content if any
-    if current_slide:
-        slides.append(current_slide)
-    
-    return slides
+def _song_key(song):
+    """Identity of a song's rendered output (title plus exact lyrics)."""
+    return (song['title'], tuple(song['lyrics']))
 
 
-def create_slide(prs, title, content_lines, slide_number=None, total_slides=None):
-    """Create a simple slide with title and content."""
-    # Use a simple blank layout to avoid placeholder conflicts
-    # This ensures consistent behavior across different templates
-    try:
-        # Use blank layout (index 6) or last available layout
-        if len(prs.slide_layouts) > 6:
-            layout = prs.slide_layouts[6]  # Blank layout
-        else:
-            layout = prs.slide_layouts[-1]  # Last available layout
-    except (IndexError, AttributeError):
-        # Fallback to first available layout
-        layout = prs.slide_layouts[0]
-    
-    slide = prs.slides.add_slide(layout)
-    
-    # Always use manual text boxes for consistent positioning
-    # This avoids conflicts with template placeholders
-    
-    # Add title at top-left, with distance from red line
-    title_box = slide.shapes.add_textbox(
-        Inches(0.5), Inches(0.6),  # More distance from red line at top
-        prs.slide_width - Inches(1.8), Inches(1.0)  # Leave minimal space for narrow slide counter
-    )
-    title_frame = title_box.text_frame
-    title_frame.margin_left = Inches(0.2)
-    title_frame.margin_right = Inches(0.2)
-    title_frame.vertical_anchor = MSO_ANCHOR.TOP
-    title_frame.word_wrap = True
-    
-    title_p = title_frame.paragraphs[0]
-    title_p.text = title
-    title_p.font.size = Pt(32)  # Reduced from 40 to 32
-    title_p.font.name = "Calibri"
-    title_p.font.bold = True
-    title_p.font.color.rgb = RGBColor(0, 0, 0)  # Black
-    title_p.alignment = PP_ALIGN.LEFT
-    
-    # Add slide counter (e.g., "1/4") in top-right if provided
-    if slide_number is not None and total_slides is not None:
-        counter_box = slide.shapes.add_textbox(
-            prs.slide_width - Inches(1.3), Inches(0.6),  # Top-right position, narrower
-            Inches(1.0), Inches(1.0)  # Narrower width for compact counter
-        )
-        counter_frame = counter_box.text_frame
-        counter_frame.margin_left = Inches(0.1)
-        counter_frame.margin_right = Inches(0.1)
-        counter_frame.vertical_anchor = MSO_ANCHOR.TOP
-        counter_frame.word_wrap = False
-        
-        counter_p = counter_frame.paragraphs[0]
-        counter_p.text = f"{slide_number}/{total_slides}"
-        counter_p.font.size = Pt(24)
-        counter_p.font.name = "Calibri"
-        counter_p.font.bold = True
-        counter_p.font.color.rgb = RGBColor(139, 69, 19)  # Brown
-        counter_p.alignment = PP_ALIGN.RIGHT
-    
-    # Add content below title, positioned much closer
-    if content_lines:
-        content_box = slide.shapes.add_textbox(
-            Inches(0.5), Inches(1.4),  # Much closer to title (reduced from 1.8 to 1.4)
-            prs.slide_width - Inches(1.0), prs.slide_height - Inches(1.9)  # Adjusted height accordingly
-        )
-        content_frame = content_box.text_frame
-        content_frame.margin_left = Inches(0.2)  # Match title margin
-        content_frame.margin_right = Inches(0.2)
-        content_frame.vertical_anchor = MSO_ANCHOR.TOP
-        content_frame.word_wrap = True
-        
-        # Add each line with left alignment
-        for i, line in enumerate(content_lines):
-            if i == 0:
-                p = content_frame.paragraphs[0]
+class IncrementalDeck:
+    """Keep a rendered presentation in memory and re-render only changed songs.
+
+    Slides of songs whose title and lyrics did not change are reused as-is;
+    new or edited songs are rendered and the slide order is fixed up to match
+    the song file. The TOC is rebuilt only when titles or positions change.
+    """
+
+    def __init__(self, master_file=None, generate_toc=False, alphabetical_index=False):
+        self.generate_toc = generate_toc
+        self.alphabetical_index = alphabetical_index
+        self.prs = Presentation(master_file) if master_file else Presentation()
+        self._sld_id_lst = self.prs.slides._sldIdLst
+        self._last_part_number = len(self._sld_id_lst)
+        if generate_toc:
+            # Same as a full run: the TOC must be the first slide
+            for sld_id in list(self._sld_id_lst):
+                self._drop_slides([sld_id])
+        self._rendered = {}  # song key -> list of slide id lists
+        self._toc_ids = []
+        self._toc_entries = None
+
+    def _drop_slides(self, sld_ids):
+        for sld_id in sld_ids:
+            self.prs.part.drop_rel(sld_id.rId)
+            self._sld_id_lst.remove(sld_id)
+
+    def _new_slide_ids(self, start):
+        """Slide ids added since start, each given a part name never used before.
+
+        python-pptx names a new slide after the current slide count, which
+        collides once slides have been dropped; existing parts must keep
+        their names because relationship targets are cached after a save.
+        """
+        sld_ids = list(self._sld_id_lst)[start:]
+        for sld_id in sld_ids:
+            self._last_part_number += 1
+            slide_part = self.prs.part.related_part(sld_id.rId)
+            slide_part.partname = PackURI(f"/ppt/slides/slide{self._last_part_number}.xml")
+        return sld_ids
+
+    def _render_song(self, song):
+        start = len(self._sld_id_lst)
+        lyric_slides = song_slides(song)
+        total_song_slides = len(lyric_slides)
+        for slide_index, slide_content in enumerate(lyric_slides):
+            create_slide(self.prs, song['title'], slide_content, slide_index + 1, total_song_slides)
+        return self._new_slide_ids(start)
+
+    def update(self, songs):
+        """Bring the deck in line with songs. Returns (rendered, reused) song counts."""
+        previous = self._rendered
+        self._rendered = {}
+        rendered = reused = 0
+        ordered = []  # (title, slide ids) in song file order
+
+        for song in songs:
+            key = _song_key(song)
+            if previous.get(key):
+                sld_ids = previous[key].pop()
+                reused += 1
             else:
-                p = content_frame.add_paragraph()
-            
-            p.text = line
-            p.font.size = Pt(28)  # Reduced from 32 to 28
-            p.font.name = "Calibri"
-            p.font.color.rgb = RGBColor(0, 0, 0)  # Black
-            p.alignment = PP_ALIGN.LEFT
-            p.space_after = Pt(16)
-
-
-def create_toc_slides(prs, songs_with_slides, songs_per_toc_slide=20):
-    """Create Table of Contents slides with clickable links to songs."""
-    if not songs_with_slides:
-        return []
-    
-    toc_slides = []
-    total_songs = len(songs_with_slides)
-    total_toc_slides = math.ceil(total_songs / songs_per_toc_slide)
-    
-    for toc_page in range(total_toc_slides):
-        # Use same layout as song slides
+                sld_ids = self._render_song(song)
+                rendered += 1
+            self._rendered.setdefault(key, []).append(sld_ids)
+            ordered.append((song['title'], sld_ids))
+
+        # Songs that were removed or edited
+        for stale in previous.values():
+            for sld_ids in stale:
+                self._drop_slides(sld_ids)
+
+        if self.generate_toc:
+            template = template_info(self.prs)
+            toc_layout = plan_toc_layout([title for title, _ in ordered], self.prs.slide_width,
+                                         self.prs.slide_height, self.alphabetical_index,
+                                         top_offset=template['top_offset'], bottom_limit=template['bottom_limit'])
+            toc_entries = []
+            position = toc_layout['slide_count']
+            for title, sld_ids in ordered:
+                toc_entries.append((title, position))
+                position += len(sld_ids)
+
+            if toc_entries != self._toc_entries:
+                self._drop_slides(self._toc_ids)
+                start = len(self._sld_id_lst)
+                create_toc_slides(self.prs, toc_entries, toc_layout)
+                self._toc_ids = self._new_slide_ids(start)
+                self._toc_entries = toc_entries
+
+        # Re-append in final order (lxml moves existing elements)
+        for sld_id in self._toc_ids:
+            self._sld_id_lst.append(sld_id)
+        for _, sld_ids in ordered:
+            for sld_id in sld_ids:
+                self._sld_id_lst.append(sld_id)
+
+        return rendered, reused
+
+
+def _file_signature(path):
+    """Return (mtime_ns, size) for path, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _open_inotify(path):
+    """Watch the directory containing path. Returns an inotify fd or None if unavailable."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        directory = os.path.dirname(os.path.abspath(path))
+        # Editors often save via rename, so watch the directory rather than the file
+        if libc.inotify_add_watch(fd, directory.encode(), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+
+def _inotify_changes(fd, path, debounce=0.05):
+    """Yield once per save of path, coalescing bursts of events."""
+    name = os.path.basename(path).encode()
+    while True:
+        data = os.read(fd, 64 * 1024)
+        changed = False
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = struct.unpack_from('iIII', data, offset)
+            event_name = data[offset + 16:offset + 16 + length].rstrip(b'\0')
+            offset += 16 + length
+            if event_name == name:
+                changed = True
+        if changed:
+            while select.select([fd], [], [], debounce)[0]:
+                os.read(fd, 64 * 1024)
+            yield
+
+
+def _poll_changes(path, interval):
+    """Yield whenever the mtime or size of path changes."""
+    last = _file_signature(path)
+    while True:
+        time.sleep(interval)
+        current = _file_signature(path)
+        if current != last:
+            last = current
+            yield
+
+
+def watch_and_rebuild(input_file, output_file, master_file=None, generate_toc=False, poll_interval=0.5,
+                      alphabetical_index=False, compression='balanced'):
+    """Rebuild output_file every time input_file is saved, until interrupted."""
+    deck = IncrementalDeck(master_file, generate_toc, alphabetical_index)
+
+    def rebuild():
+        started = time.perf_counter()
         try:
-            if len(prs.slide_layouts) > 6:
-                layout = prs.slide_layouts[6]  # Blank layout
-            else:
-                layout = prs.slide_layouts[-1]  # Last available layout
-        except (IndexError, AttributeError):
-            layout = prs.slide_layouts[0]
-        
-        slide = prs.slides.add_slide(layout)
-        toc_slides.append(slide)
-        
-        # Add TOC title
-        title_text = f"Table of Contents"
-        if total_toc_slides > 1:
-            title_text += f" ({toc_page + 1}/{total_toc_slides})"
-            
-        title_box = slide.shapes.add_textbox(
-            Inches(0.5), Inches(0.6),
-            prs.slide_width - Inches(1.0), Inches(1.0)
-        )
-        title_frame = title_box.text_frame
-        title_frame.margin_left = Inches(0.2)
-        title_frame.margin_right = Inches(0.2)
-        title_frame.vertical_anchor = MSO_ANCHOR.TOP
-        title_frame.word_wrap = True
-        
-        title_p = title_frame.paragraphs[0]
-        title_p.text = title_text
-        title_p.font.size = Pt(32)
-        title_p.font.name = "Calibri"
-        title_p.font.bold = True
-        title_p.font.color.rgb = RGBColor(0, 0, 0)
-        title_p.alignment = PP_ALIGN.LEFT
-        
-        # Add songs list for this TOC page in 2 columns
-        start_idx = toc_page * songs_per_toc_slide
-        end_idx = min(start_idx + songs_per_toc_slide, total_songs)
-        songs_on_this_page = songs_with_slides[start_idx:end_idx]
-        
-        # Calculate columns (10 songs per column)
-        col1_songs = songs_on_this_page[:10]  # First 10 songs
-        col2_songs = songs_on_this_page[10:]  # Remaining songs
-        
-        # Create left column (first 10 songs)
-        left_column_box = slide.shapes.add_textbox(
-            Inches(0.5), Inches(1.6),  # Start below title, left side
-            Inches(4.5), prs.slide_height - Inches(2.8)  # Half width, leave space for bottom border
-        )
-        left_frame = left_column_box.text_frame
-        left_frame.margin_left = Inches(0.2)
-        left_frame.margin_right = Inches(0.2)
-        left_frame.vertical_anchor = MSO_ANCHOR.TOP
-        left_frame.word_wrap = True
-        
-        # Add songs to left column
-        for i, (song_title, first_slide_index) in enumerate(col1_songs):
-            if i == 0:
-                p = left_frame.paragraphs[0]
-            else:
-                p = left_frame.add_paragraph()
-            
-            # Add song number and title
-            song_number = start_idx + i + 1
-            p.text = f"{song_number:2d}. {song_title}"
-            p.font.size = Pt(20)  # Larger font for better readability in columns
-            p.font.name = "Calibri"
-            p.font.color.rgb = RGBColor(0, 0, 139)  # Dark blue for links
-            p.alignment = PP_ALIGN.LEFT
-            p.space_after = Pt(6)  # Moderate space between lines
-            
-            # Add hyperlink to the song's first slide
-            if p.runs:
-                run = p.runs[0]
-                hlink = run.hyperlink
-                hlink.address = f"#{first_slide_index + 1}"
-        
-        # Create right column (next 10 songs) if there are more songs
-        if col2_songs:
-            right_column_box = slide.shapes.add_textbox(
-                Inches(5.2), Inches(1.6),  # Start below title, right side
-                Inches(4.3), prs.slide_height - Inches(2.8)  # Half width, leave space for bottom border
-            )
-            right_frame = right_column_box.text_frame
-            right_frame.margin_left = Inches(0.2)
-            right_frame.margin_right = Inches(0.2)
-            right_frame.vertical_anchor = MSO_ANCHOR.TOP
-            right_frame.word_wrap = True
-            
-            # Add songs to right column
-            for i, (song_title, first_slide_index) in enumerate(col2_songs):
-                if i == 0:
-                    p = right_frame.paragraphs[0]
-                else:
-                    p = right_frame.add_paragraph()
-                
-                # Add song number and title
-                song_number = start_idx + len(col1_songs) + i + 1
-                p.text = f"{song_number:2d}. {song_title}"
-                p.font.size = Pt(20)  # Larger font for better readability in columns
-                p.font.name = "Calibri"
-                p.font.color.rgb = RGBColor(0, 0, 139)  # Dark blue for links
-                p.alignment = PP_ALIGN.LEFT
-                p.space_after = Pt(6)  # Moderate space between lines
-                
-                # Add hyperlink to the song's first slide
-                if p.runs:
-                    run = p.runs[0]
-                    hlink = run.hyperlink
-                    hlink.address = f"#{first_slide_index + 1}"
-    
-    return toc_slides
+            songs = parse_songs(input_file)
+            rendered, reused = deck.update(songs)
+            save_presentation(deck.prs, output_file, compression)
+        except Exception as e:
+            print(f"Error rebuilding presentation: {e}")
+            return
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"Rebuilt {output_file}: {len(deck.prs.slides)} slides, "
+              f"{rendered} songs rendered, {reused} reused ({elapsed:.0f} ms)")
+
+    rebuild()
+
+    fd = _open_inotify(input_file)
+    if fd is not None:
+        print(f"Watching {input_file} for changes (inotify)... Press Ctrl+C to stop.")
+        changes = _inotify_changes(fd, input_file)
+    else:
+        print(f"Watching {input_file} for changes (polling every {poll_interval}s)... Press Ctrl+C to stop.")
+        changes = _poll_changes(input_file, poll_interval)
+
+    try:
+        for _ in changes:
+            if _file_signature(input_file) is not None:
+                rebuild()
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+    finally:
+        if fd is not None:
+            os.close(fd)
 
 
 def main():
@@ -286,134 +245,135 @@ def main():
   python3 simple_generator.py songs.txt --master template.pptx
   python3 simple_generator.py songs.txt output.pptx --master "Master Folie Natal.pptx"
   python3 simple_generator.py songs.txt --toc
-  python3 simple_generator.py songs.txt --master template.pptx --toc"""
+  python3 simple_generator.py songs.txt --master template.pptx --toc
+  python3 simple_generator.py songs.txt --toc --toc-index
+  python3 simple_generator.py songs.txt --toc --watch
+  python3 simple_generator.py songs.txt --toc --validate
+  python3 simple_generator.py merged.txt --toc --dedupe
+  python3 simple_generator.py hymnal.txt sunday.pptx --select "Amazing Grace" --select Doxology
+  python3 simple_generator.py hymnal.pptx sunday.pptx --toc --select "Amazing Grace" --select Doxology
+  python3 simple_generator.py songs.txt --toc --profile
+  python3 simple_generator.py hymnal.txt --compile hymnal.songs
+  python3 simple_generator.py hymnal.songs --toc"""
     )
     
-    parser.add_argument('input_file', help='Input text file containing songs')
+    parser.add_argument('input_file', help='Input text file containing songs (or a compiled .songs corpus, '
+                       'or a deck generated earlier to copy a --select setlist out of)')
     parser.add_argument('output_file', nargs='?', default='songs_presentation.pptx',
                        help='Output PowerPoint file (default: songs_presentation.pptx)')
     parser.add_argument('--master', metavar='TEMPLATE', 
                        help='Use existing PowerPoint file as template')
     parser.add_argument('--toc', action='store_true',
                        help='Generate Table of Contents with clickable links to songs')
+    parser.add_argument('--toc-index', action='store_true',
+                       help='Sort the TOC alphabetically and add an A-Z index slide with letter links (implies --toc)')
+    parser.add_argument('--compression', choices=sorted(COMPRESSION_PROFILES), default='balanced',
+                       help='Output compression: fast (quick save, larger file), balanced, or smallest (default: balanced)')
+    parser.add_argument('--watch', action='store_true',
+                       help='Keep running and rebuild the presentation whenever the input file is saved')
+    parser.add_argument('--validate', action='store_true',
+                       help='Only check the song file and report slide counts and problems (no output is written)')
+    parser.add_argument('--dedupe', action='store_true',
+                       help='Render duplicate and near-duplicate songs once; with --validate, list them')
+    parser.add_argument('--select', action='append', metavar='TITLE',
+                       help='Only include this song (repeat for a setlist, in order); large files are read by index')
+    parser.add_argument('--compile', metavar='CORPUS',
+                       help='Compile the song file into a binary .songs corpus that loads without parsing, then exit')
+    parser.add_argument('--profile', nargs='?', const='', metavar='BASE',
+                       help='Profile the run: writes BASE.prof (pstats, plus one per stage) and BASE.collapsed '
+                            '(flamegraph stacks); BASE defaults to the output name + .profile')
+    parser.add_argument('--poll-interval', type=float, default=0.5, metavar='SECONDS',
+                       help='Polling interval for --watch when inotify is unavailable (default: 0.5)')
     
     args = parser.parse_args()
     
     input_file = args.input_file
     output_file = args.output_file
     master_file = args.master
-    generate_toc = args.toc
+    alphabetical_index = args.toc_index
+    generate_toc = args.toc or alphabetical_index
     
     # Ensure output file has .pptx extension
     if not output_file.endswith('.pptx'):
         output_file += '.pptx'
     
-    # Parse songs
-    print(f"Reading songs from {input_file}...")
-    try:
-        songs = parse_songs(input_file)
-        print(f"Found {len(songs)} songs")
-    except FileNotFoundError:
-        print(f"Error: {input_file} not found!")
-        return
-    except Exception as e:
-        print(f"Error reading file: {e}")
+    if args.compile:
+        try:
+            song_count = compile_song_corpus(input_file, args.compile)
+        except FileNotFoundError:
+            print(f"Error: {input_file} not found!")
+            sys.exit(1)
+        print(f"✅ Compiled {song_count} songs into {args.compile}")
         return
     
-    # Create presentation
-    if master_file:
-        print(f"Creating PowerPoint presentation using template: {master_file}")
+    if master_file and not os.path.exists(master_file):
+        print(f"Error: Template file '{master_file}' not found!")
+        sys.exit(1)
+    
+    if args.validate:
+        # Dry run: no slides are built; a --master template only supplies its geometry
         try:
-            prs = Presentation(master_file)
-        except FileNotFoundError:
-            print(f"Error: Template file '{master_file}' not found!")
+            template = template_info(Presentation(master_file)) if master_file else None
+            report = validate_song_file(input_file, generate_toc, alphabetical_index,
+                                        find_duplicates=args.dedupe, template=template)
+        except FileNotFoundError as e:
+            print(f"Error: {e.filename} not found!")
+            sys.exit(1)
+        print(format_validation_report(report))
+        if not report['songs']:
+            sys.exit(1)
+        return
+    
+    if args.watch:
+        if args.dedupe or args.select or args.profile is not None:
+            print("Error: --dedupe, --select and --profile cannot be combined with --watch")
             return
-        except Exception as e:
-            print(f"Error loading template: {e}")
+        watch_and_rebuild(input_file, output_file, master_file, generate_toc, args.poll_interval,
+                          alphabetical_index, args.compression)
+        return
+    
+    if input_file.lower().endswith('.pptx'):
+        # Setlist from a rendered master deck: slides are copied, not re-rendered
+        if not args.select:
+            print("Error: choose the songs to copy out of the deck with --select")
             return
-    else:
-        print("Creating PowerPoint presentation...")
-        prs = Presentation()
+        print(f"Copying {len(args.select)} songs out of {input_file}...")
+        success, message, slide_count = extract_setlist(input_file, args.select, output_file, generate_toc,
+                                                        args.compression)
+        if not success:
+            print(f"Error: {message}")
+            sys.exit(1)
+        print("✅ Success!")
+        print(f"Created {output_file}: {message}")
+        return
     
-    total_slides = 0
-    songs_with_slide_positions = []  # Track song titles and their first slide positions
+    profiler = None
+    if args.profile is not None:
+        profiler = StageProfiler().start()
     
-    # If TOC is requested, we need to calculate TOC slides first to adjust positions
-    toc_slides_count = 0
-    if generate_toc:
-        # First pass: collect song titles
-        temp_songs = []
-        for song in songs:
-            temp_songs.append(song['title'])
-        # Calculate how many TOC slides we'll need
-        toc_slides_count = math.ceil(len(temp_songs) / 20)  # 20 songs per TOC slide (2 columns x 10 rows)
-    
-    for song in songs:
-        title = song['title']
-        lyrics = song['lyrics']
-        
-        # Split lyrics into slides
-        lyric_slides = split_lyrics_into_slides(lyrics)
-        
-        # Record the first slide position for this song (adjust for TOC at beginning)
-        first_slide_position = total_slides + toc_slides_count
-        songs_with_slide_positions.append((title, first_slide_position))
-        
-        # Create slides for this song with numbering
-        total_song_slides = len(lyric_slides)
-        for slide_index, slide_content in enumerate(lyric_slides):
-            create_slide(prs, title, slide_content, slide_index + 1, total_song_slides)
-            total_slides += 1
+    print(f"Reading songs from {input_file}...")
+    if master_file:
+        print(f"Creating PowerPoint presentation using template: {master_file}")
+    else:
+        print("Creating PowerPoint presentation...")
+    success, message, slide_count = generate_presentation(
+        input_file, output_file, master_file, generate_toc, alphabetical_index,
+        compression=args.compression, collapse_duplicates=args.dedupe, song_titles=args.select,
+        profiler=profiler)
     
-    # Generate Table of Contents if requested - create at beginning
-    if generate_toc and songs_with_slide_positions:
-        print("Generating Table of Contents...")
-        
-        # Create new presentation with TOC first
-        if master_file:
-            final_prs = Presentation(master_file)
-        else:
-            final_prs = Presentation()
-        
-        # Remove default slides
-        slide_count = len(final_prs.slides)
-        for i in range(slide_count):
-            rId = final_prs.slides._sldIdLst[0].rId
-            final_prs.part.drop_rel(rId)
-            del final_prs.slides._sldIdLst[0]
-        
-        # Create TOC slides first
-        create_toc_slides(final_prs, songs_with_slide_positions)
-        
-        # Add song slides after TOC - recreate them with slide numbering
-        for song in songs:
-            title = song['title']
-            lyrics = song['lyrics']
-            
-            # Split lyrics into slides
-            lyric_slides = split_lyrics_into_slides(lyrics)
-            total_song_slides = len(lyric_slides)
-            
-            # Create slides for this song with numbering
-            for slide_index, slide_content in enumerate(lyric_slides):
-                create_slide(final_prs, title, slide_content, slide_index + 1, total_song_slides)
-
-        
-        prs = final_prs
-        total_slides += toc_slides_count
+    if profiler is not None:
+        profiler.stop()
+        profile_base = args.profile or os.path.splitext(output_file)[0] + '.profile'
+        print(profiler.format_summary())
+        for path in profiler.write(profile_base):
+            print(f"📊 Profile written to {path}")
     
-    # Save presentation
-    try:
-        prs.save(output_file)
-        print(f"✅ Success!")
-        if generate_toc and toc_slides_count > 0:
-            print(f"Created {output_file} with {total_slides} slides from {len(songs)} songs + {toc_slides_count} TOC slides")
-            print(f"TOC with clickable links is included at the end of the presentation!")
-        else:
-            print(f"Created {output_file} with {total_slides} slides from {len(songs)} songs")
-        print(f"Ready to use for church service!")
-    except Exception as e:
-        print(f"Error saving presentation: {e}")
+    if not success:
+        print(f"Error: {message}")
+        sys.exit(1)
+    print("✅ Success!")
+    print(f"Created {output_file}: {message}")
+    print("Ready to use for church service!")
 
 
 if __name__ == "__main__":
@@ -4,17 +4,36 @@ Flask Web App for PowerPoint Song Generator
 Allows users to upload song files and generate PowerPoint presentations through a web interface.
 """
 
+import io
 import os
 import uuid
 import time
+import glob
+import hmac
+import shutil
+import socket
+import itertools
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, send_file, jsonify, flash, redirect, url_for
+from flask import Flask, render_template, request, send_file, jsonify, flash, redirect, url_for, abort
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import FileWrapper
+from werkzeug.middleware.proxy_fix import ProxyFix
 import threading
 import json
+from concurrent.futures import ThreadPoolExecutor
+from pptx import Presentation
 
 # Import our generator
-from generator import generate_presentation
+from generator import (generate_presentation, parse_songs, load_template_info, template_info,
+                       COMPRESSION_PROFILES)
+from html_export import generate_html_bundle, build_slide_manifest
+from previews import cached_slide_preview, DEFAULT_SLIDE_WIDTH, DEFAULT_SLIDE_HEIGHT
+from songs import (validate_song_file, validate_song_text, decode_song_bytes, find_duplicate_songs,
+                   collapse_duplicate_songs, SongCorpus, SONG_CORPUS_MAGIC)
+from songs import validate_songs as validate_parsed_songs
+from job_queue import RateLimiter, FairScheduler
+from profiling import StageProfiler, profile_stage
+from storage import LocalStorage, S3Storage, CHUNK_SIZE
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'powerpoint-song-generator-secret-key-2024')
@@ -22,10 +41,85 @@ app.secret_key = os.environ.get('SECRET_KEY', 'powerpoint-song-generator-secret-
 # Configuration
 UPLOAD_FOLDER = 'uploads'
 GENERATED_FOLDER = 'generated'
+PREVIEW_FOLDER = 'previews'
+TEMPLATE_CACHE_FOLDER = 'template_cache'  # template analysis by file hash, kept across cleanups
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
-ALLOWED_TEXT_EXTENSIONS = {'txt'}
+ALLOWED_TEXT_EXTENSIONS = {'txt', 'songs'}  # song text or a compiled .songs corpus
 ALLOWED_PPTX_EXTENSIONS = {'pptx'}
+OUTPUT_FORMATS = {'pptx': '.pptx', 'html': '.html'}
 FILE_CLEANUP_HOURS = 2  # Clean up files after 2 hours
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600  # downloads whose URL carries the content hash (?v=)
+
+# Where uploads, generated files and job records are kept: 'local' (the
+# folders above, one instance) or 's3' (an S3-compatible bucket such as AWS
+# S3 or MinIO, shared so every instance can serve every job's output).
+# With s3 the local folders only hold working copies.
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+UPLOAD_PREFIX = UPLOAD_FOLDER + '/'
+GENERATED_PREFIX = GENERATED_FOLDER + '/'
+JOB_PREFIX = 'jobs/'  # job status records, readable by every instance
+CHECKPOINT_FOLDER = 'checkpoints'  # songs rendered so far by running jobs, one folder per job
+CHECKPOINT_PREFIX = CHECKPOINT_FOLDER + '/'
+STORAGE_CLEANUP_INTERVAL = 600  # seconds between cleanup passes over the bucket
+
+# Job scheduling and rate limiting (per client IP address)
+GENERATION_WORKERS = int(os.environ.get('GENERATION_WORKERS', 2))
+RATE_LIMIT_PER_MINUTE = float(os.environ.get('RATE_LIMIT_PER_MINUTE', 6))
+RATE_LIMIT_BURST = int(os.environ.get('RATE_LIMIT_BURST', 3))
+MAX_QUEUED_JOBS_PER_CLIENT = int(os.environ.get('MAX_QUEUED_JOBS_PER_CLIENT', 3))
+# The limits above are for the whole app, but every gunicorn worker process
+# keeps its own buckets and queue, so each one enforces an even share.
+# WEB_CONCURRENCY is the worker count gunicorn is started with (Procfile)
+SERVER_PROCESSES = max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+PROCESS_RATE_LIMIT_PER_MINUTE = RATE_LIMIT_PER_MINUTE / SERVER_PROCESSES
+PROCESS_RATE_LIMIT_BURST = max(1, RATE_LIMIT_BURST // SERVER_PROCESSES)
+PROCESS_MAX_QUEUED_JOBS_PER_CLIENT = max(1, MAX_QUEUED_JOBS_PER_CLIENT // SERVER_PROCESSES)
+
+# Clients are identified by the address the trusted proxies in front of the app
+# saw (Railway's edge adds one X-Forwarded-For hop); 0 when clients connect directly
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', 1))
+# Load tests only: take the client identity from an X-Load-Test-Client header so
+# load_test.py can simulate many clients from one machine. Never set in production
+LOAD_TEST_CLIENT_HEADER = os.environ.get('LOAD_TEST_CLIENT_HEADER') == '1'
+
+# Cancellation: jobs stop between songs once past their deadline or once
+# nobody has polled their status for a while (tab closed)
+JOB_TIMEOUT_SECONDS = int(os.environ.get('JOB_TIMEOUT_SECONDS', 600))
+ABANDONED_JOB_SECONDS = int(os.environ.get('ABANDONED_JOB_SECONDS', 90))
+
+# Crash recovery: every process refreshes the heartbeat in the records of its
+# queued and running jobs. A job whose heartbeat is older than the lease lost
+# its worker (recycled or killed); the first process to notice claims it and
+# runs it again from its last checkpoint, up to MAX_JOB_ATTEMPTS runs in all.
+JOB_HEARTBEAT_SECONDS = int(os.environ.get('JOB_HEARTBEAT_SECONDS', 15))
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 60))
+MAX_JOB_ATTEMPTS = int(os.environ.get('MAX_JOB_ATTEMPTS', 3))
+JOB_CLAIM_SETTLE_SECONDS = 1  # wait before re-reading a claimed record, so racing claims settle
+JOB_SEEN_INTERVAL = 10  # seconds between status-poll notes for jobs run by another process
+
+# Output compression profile for saved decks: fast, balanced or smallest
+OUTPUT_COMPRESSION = os.environ.get('OUTPUT_COMPRESSION', 'balanced')
+if OUTPUT_COMPRESSION not in COMPRESSION_PROFILES:
+    # Fail at startup rather than in every job, after its deck has been rendered
+    raise ValueError(f"OUTPUT_COMPRESSION must be one of {', '.join(COMPRESSION_PROFILES)}, "
+                     f"not '{OUTPUT_COMPRESSION}'")
+
+# Slide thumbnail previews, rendered on demand and cached by content hash
+PREVIEW_WORKERS = int(os.environ.get('PREVIEW_WORKERS', 2))
+PREVIEW_PREFETCH = 12  # render the first slides as soon as a job finishes
+
+# Opt-in job profiling: cProfile for 1 in PROFILE_EVERY_N_JOBS jobs, and a
+# cheap stack sampler on every job so slow ones can be kept too (0 = off).
+# Profiles are listed at /admin/profiles?token=ADMIN_TOKEN
+PROFILE_EVERY_N_JOBS = int(os.environ.get('PROFILE_EVERY_N_JOBS', 0))
+PROFILE_SLOW_JOB_SECONDS = float(os.environ.get('PROFILE_SLOW_JOB_SECONDS', 0))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 50))
+PROFILE_FOLDER = 'profiles'
+SLOW_JOB_SAMPLE_INTERVAL = 0.005  # seconds between stack samples on unsampled jobs
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+if TRUSTED_PROXY_HOPS > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['GENERATED_FOLDER'] = GENERATED_FOLDER
@@ -34,19 +128,200 @@ app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 # Ensure directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(GENERATED_FOLDER, exist_ok=True)
+os.makedirs(PREVIEW_FOLDER, exist_ok=True)
+os.makedirs(TEMPLATE_CACHE_FOLDER, exist_ok=True)
+os.makedirs(PROFILE_FOLDER, exist_ok=True)
+os.makedirs(CHECKPOINT_FOLDER, exist_ok=True)
+
+if STORAGE_BACKEND == 's3':
+    storage = S3Storage(
+        os.environ['S3_BUCKET'],
+        os.environ.get('S3_ENDPOINT_URL'),  # e.g. http://minio:9000; AWS S3 when unset
+        os.environ.get('S3_REGION', 'us-east-1'),
+        os.environ.get('S3_ACCESS_KEY_ID', os.environ.get('AWS_ACCESS_KEY_ID', '')),
+        os.environ.get('S3_SECRET_ACCESS_KEY', os.environ.get('AWS_SECRET_ACCESS_KEY', '')),
+        os.environ.get('S3_PREFIX', '')
+    )
+else:
+    storage = LocalStorage()
 
 # Global job tracking
 processing_jobs = {}
+rate_limiter = RateLimiter(PROCESS_RATE_LIMIT_PER_MINUTE, PROCESS_RATE_LIMIT_BURST)
+scheduler = FairScheduler(GENERATION_WORKERS)
+preview_pool = ThreadPoolExecutor(max_workers=PREVIEW_WORKERS)
+profile_job_counter = itertools.count(1)
+last_storage_cleanup = 0.0
+job_seen_notes = {}  # job_id -> when a poll was last noted for another process's job
+finished_job_records = set()  # records the supervisor no longer needs to read
+supervisor_thread = None
+supervisor_lock = threading.Lock()
 
 def allowed_file(filename, extensions):
     """Check if file has allowed extension."""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in extensions
 
+def client_id_for_request():
+    """Identify the client for rate limiting (its address as seen by the trusted proxy, see ProxyFix)."""
+    if LOAD_TEST_CLIENT_HEADER and request.headers.get('X-Load-Test-Client'):
+        return request.headers['X-Load-Test-Client']
+    return request.remote_addr or 'unknown'
+
+def store_generated_file(filename):
+    """Put a file written to GENERATED_FOLDER into storage and return its StoredFile."""
+    path = os.path.join(GENERATED_FOLDER, filename)
+    stored = storage.put_file(GENERATED_PREFIX + filename, path)
+    if not storage.is_local:
+        os.remove(path)  # the bucket copy is the one served
+    return stored
+
+def local_upload_path(filename):
+    """Local path of an uploaded file, fetched from storage if this instance does not have it."""
+    path = os.path.join(UPLOAD_FOLDER, filename)
+    if not os.path.exists(path):
+        storage.fetch(UPLOAD_PREFIX + filename, path)
+    return path
+
+def instance_id():
+    """Names this worker process in job records (gunicorn gives a replacement worker a new pid)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def write_job_record(job_id, record):
+    try:
+        storage.put_bytes(f"{JOB_PREFIX}{job_id}.json", json.dumps(record).encode('utf-8'))
+    except OSError as e:
+        print(f"Could not save record of job {job_id}: {e}")
+
+def save_job_record(job_id):
+    """
+    Write the job's status where any instance can answer /status for it,
+    with what is needed to run it again and this process's heartbeat.
+    """
+    job = processing_jobs[job_id]
+    record = {field: job[field] for field in
+              ('status', 'message', 'output_file', 'output_format', 'output_etag', 'manifest_etag', 'slide_count',
+               'params', 'client_id', 'cost', 'attempts', 'last_seen')
+              if field in job}
+    record['owner'] = instance_id()
+    record['heartbeat'] = time.time()
+    write_job_record(job_id, record)
+
+def load_job_record(job_id):
+    """Status record of a job run by another instance (or worker process), or None."""
+    try:
+        uuid.UUID(job_id)
+        data = storage.get_bytes(f"{JOB_PREFIX}{job_id}.json")
+    except (ValueError, OSError):
+        return None
+    return json.loads(data) if data else None
+
+def note_job_seen(job_id):
+    """Record a status poll for a job run by another process, so it is not cancelled as abandoned."""
+    now = time.time()
+    if now - job_seen_notes.get(job_id, 0) < JOB_SEEN_INTERVAL:
+        return
+    if len(job_seen_notes) > 1000:
+        job_seen_notes.clear()
+    job_seen_notes[job_id] = now
+    try:
+        storage.put_bytes(f"{JOB_PREFIX}{job_id}.seen", str(now).encode('ascii'))
+    except OSError as e:
+        print(f"Could not note poll of job {job_id}: {e}")
+
+def job_last_seen(job_id):
+    """When another process last noted a status poll for the job (0 if never)."""
+    try:
+        data = storage.get_bytes(f"{JOB_PREFIX}{job_id}.seen")
+        return float(data) if data else 0.0
+    except (OSError, ValueError):
+        return 0.0
+
+def checkpoint_writer(job_id):
+    """Callback copying a job's checkpoint files to storage as they are written (None for local storage)."""
+    if storage.is_local:
+        return None  # the checkpoint folder already is the storage location
+    return lambda path: storage.put_file(f"{CHECKPOINT_PREFIX}{job_id}/{os.path.basename(path)}", path)
+
+def fetch_checkpoint(job_id):
+    """Bring the job's checkpoint from storage into CHECKPOINT_FOLDER; returns the local folder."""
+    folder = os.path.join(CHECKPOINT_FOLDER, job_id)
+    if not storage.is_local:
+        os.makedirs(folder, exist_ok=True)
+        for stored in storage.list(f"{CHECKPOINT_PREFIX}{job_id}/"):
+            storage.fetch(stored.key, os.path.join(folder, os.path.basename(stored.key)))
+    return folder
+
+def discard_checkpoint(job_id):
+    """Delete a finished job's checkpoint, locally and in storage."""
+    shutil.rmtree(os.path.join(CHECKPOINT_FOLDER, job_id), ignore_errors=True)
+    if not storage.is_local:
+        try:
+            for stored in storage.list(f"{CHECKPOINT_PREFIX}{job_id}/"):
+                storage.delete(stored.key)
+        except OSError as e:
+            print(f"Could not delete checkpoint of job {job_id}: {e}")
+
+def send_generated_file(stored, **kwargs):
+    """
+    Send a stored generated file with its content-hash ETag. Werkzeug answers
+    If-None-Match with 304 and Range/If-Range with 206, so repeat and resumed
+    downloads only transfer what is missing. URLs carrying the hash (?v=)
+    can never point at other content and are cached for a year; plain URLs
+    must revalidate, since a later job may reuse the file name.
+    """
+    if storage.is_local:
+        response = send_file(os.path.abspath(storage.path(stored.key)), etag=stored.etag, conditional=True,
+                             **kwargs)
+    else:
+        # Streamed from the bucket; werkzeug's own wrapper can seek, so a
+        # Range turns into a ranged GET instead of reading past skipped bytes
+        file = storage.open(stored.key)
+        response = send_file(file, etag=False, conditional=False, **kwargs)
+        response.response = FileWrapper(file, CHUNK_SIZE)
+        response.content_length = stored.size
+        response.last_modified = stored.modified
+        response.set_etag(stored.etag)
+        response.make_conditional(request.environ, accept_ranges=True, complete_length=stored.size)
+    if request.args.get('v') == stored.etag:
+        response.cache_control.no_cache = None
+        response.cache_control.private = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+def forget_finished_jobs():
+    """
+    Drop finished jobs (with their preview slide plans) from memory once
+    their files have expired; /status then answers from the stored record.
+    """
+    cutoff_time = datetime.now() - timedelta(hours=FILE_CLEANUP_HOURS)
+    for job_id, job in list(processing_jobs.items()):
+        if job['status'] not in ('queued', 'processing') and job['created_at'] < cutoff_time:
+            processing_jobs.pop(job_id, None)
+
 def cleanup_old_files():
-    """Clean up old uploaded and generated files."""
+    """Clean up old uploaded and generated files, in storage and in the local folders."""
+    global last_storage_cleanup
     cutoff_time = datetime.now() - timedelta(hours=FILE_CLEANUP_HOURS)
+    forget_finished_jobs()
     
-    for folder in [UPLOAD_FOLDER, GENERATED_FOLDER]:
+    # Listing a bucket is a network call, so it is not repeated on every visit
+    if storage.is_local or time.time() - last_storage_cleanup >= STORAGE_CLEANUP_INTERVAL:
+        last_storage_cleanup = time.time()
+        try:
+            for prefix in (UPLOAD_PREFIX, GENERATED_PREFIX, JOB_PREFIX, CHECKPOINT_PREFIX):
+                for stored in storage.list(prefix):
+                    if datetime.fromtimestamp(stored.modified) < cutoff_time:
+                        storage.delete(stored.key)
+                        print(f"Cleaned up old file: {stored.key}")
+        except OSError as e:
+            print(f"Could not clean up storage: {e}")
+    
+    # Previews, plus the working copies of uploads and outputs with remote storage
+    local_folders = [PREVIEW_FOLDER] if storage.is_local else [UPLOAD_FOLDER, GENERATED_FOLDER, PREVIEW_FOLDER]
+    for folder in local_folders:
         for filename in os.listdir(folder):
             file_path = os.path.join(folder, filename)
             if os.path.isfile(file_path):
@@ -57,27 +332,185 @@ def cleanup_old_files():
                         print(f"Cleaned up old file: {file_path}")
                     except OSError:
                         pass
+    
+    # Checkpoints left by jobs that were never resumed
+    for job_id in os.listdir(CHECKPOINT_FOLDER):
+        folder = os.path.join(CHECKPOINT_FOLDER, job_id)
+        if os.path.isdir(folder) and datetime.fromtimestamp(os.path.getmtime(folder)) < cutoff_time:
+            shutil.rmtree(folder, ignore_errors=True)
+            print(f"Cleaned up old checkpoint: {folder}")
+
+def job_cancel_reason(job):
+    """Return why a job should stop, or None to keep going."""
+    if job['cancel_event'].is_set():
+        return 'Cancelled by user'
+    if job.get('deadline') and time.time() > job['deadline']:
+        return f'Generation took longer than {JOB_TIMEOUT_SECONDS} seconds and was stopped'
+    if time.time() - job['last_seen'] > ABANDONED_JOB_SECONDS:
+        return 'Cancelled because the status page was closed'
+    return None
+
+def render_job_preview(job, index):
+    """Render (or fetch from cache) the preview of one song slide of a finished job."""
+    preview = job['preview']
+    manifest = preview['manifest']
+    song = manifest['songs'][preview['song_of_slide'][index]]
+    return cached_slide_preview(
+        PREVIEW_FOLDER,
+        song['title'],
+        manifest['slides'][index],
+        index - song['first_slide'] + 1,
+        song['slide_count'],
+        preview['slide_width'],
+        preview['slide_height'],
+        top_offset=preview['top_offset'],
+        bottom_limit=preview['bottom_limit']
+    )
+
+def prepare_job_preview(job, song_file_path, template_file_path, collapse_duplicates=False):
+    """Record the slide plan of a finished job so previews can be rendered later."""
+    songs = parse_songs(song_file_path)
+    if collapse_duplicates:
+        songs, _ = collapse_duplicate_songs(songs, find_duplicate_songs(songs))
+    manifest = build_slide_manifest(songs)
+    # Same text offset and bottom limit create_slide used (analysis cached by template hash)
+    slide_width, slide_height = DEFAULT_SLIDE_WIDTH, DEFAULT_SLIDE_HEIGHT
+    top_offset, bottom_limit = 0, slide_height
+    if template_file_path and os.path.exists(template_file_path):
+        template = load_template_info(Presentation(template_file_path), template_file_path, TEMPLATE_CACHE_FOLDER)
+        slide_width, slide_height = template['slide_width'], template['slide_height']
+        top_offset, bottom_limit = template['top_offset'], template['bottom_limit']
+    
+    song_of_slide = []
+    for song_index, song in enumerate(manifest['songs']):
+        song_of_slide.extend([song_index] * song['slide_count'])
+    
+    job['preview'] = {
+        'manifest': manifest,
+        'song_of_slide': song_of_slide,
+        'slide_width': slide_width,
+        'slide_height': slide_height,
+        'top_offset': top_offset,
+        'bottom_limit': bottom_limit
+    }
+    for index in range(min(PREVIEW_PREFETCH, len(song_of_slide))):
+        preview_pool.submit(render_job_preview, job, index)
+
+def start_job_profiler():
+    """Return (profiler or None, whether the job was picked for a full profile)."""
+    if PROFILE_EVERY_N_JOBS > 0 and next(profile_job_counter) % PROFILE_EVERY_N_JOBS == 0:
+        return StageProfiler().start(), True
+    if PROFILE_SLOW_JOB_SECONDS > 0:
+        return StageProfiler(deterministic=False, sample_interval=SLOW_JOB_SAMPLE_INTERVAL).start(), False
+    return None, False
+
+def finish_job_profile(job_id, job, profiler, sampled):
+    """Stop the job's profiler and keep its profile if it was sampled or slow."""
+    profiler.stop()
+    seconds = profiler.total_time
+    slow = PROFILE_SLOW_JOB_SECONDS > 0 and seconds >= PROFILE_SLOW_JOB_SECONDS
+    if not (sampled or slow):
+        return
+    
+    base_path = os.path.join(PROFILE_FOLDER, job_id)
+    files = [os.path.basename(path) for path in profiler.write(base_path)]
+    with open(base_path + '.json', 'w', encoding='utf-8') as file:
+        json.dump({
+            'job_id': job_id,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'reason': 'sampled' if sampled else 'slow',
+            'status': job['status'],
+            'output_format': job.get('output_format'),
+            'slide_count': job.get('slide_count'),
+            'seconds': round(seconds, 3),
+            'stages': {stage: round(value, 3) for stage, value in profiler.stage_times.items()},
+            'files': files
+        }, file)
+    
+    # Keep only the newest profiles
+    kept = sorted(glob.glob(os.path.join(PROFILE_FOLDER, '*.json')), key=os.path.getmtime, reverse=True)
+    for meta_path in kept[PROFILE_KEEP:]:
+        for path in glob.glob(os.path.splitext(meta_path)[0] + '.*'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
 
-def process_files_async(job_id, song_file_path, template_file_path, generate_toc, output_filename):
-    """Process files in background thread."""
+def process_files_async(job_id, song_filename, template_filename, generate_toc, output_filename,
+                        output_format='pptx', alphabetical_index=False, collapse_duplicates=False):
+    """Process uploaded files (names under UPLOAD_FOLDER) in background thread."""
+    job = processing_jobs[job_id]
+    
+    def should_cancel():
+        job['cancel_reason'] = job_cancel_reason(job)
+        return job['cancel_reason'] is not None
+    
+    profiler = None
     try:
+        # Skip jobs cancelled or abandoned while waiting in the queue
+        if should_cancel():
+            processing_jobs[job_id]['status'] = 'cancelled'
+            processing_jobs[job_id]['message'] = job['cancel_reason']
+            return
+        
         processing_jobs[job_id]['status'] = 'processing'
-        processing_jobs[job_id]['message'] = 'Parsing songs...'
+        if job.get('attempts', 1) > 1:
+            processing_jobs[job_id]['message'] = 'Resuming from the last checkpoint...'
+        else:
+            processing_jobs[job_id]['message'] = 'Parsing songs...'
+        processing_jobs[job_id]['deadline'] = time.time() + JOB_TIMEOUT_SECONDS
+        save_job_record(job_id)
+        profiler, profile_sampled = start_job_profiler()
+        
+        song_file_path = local_upload_path(song_filename)
+        template_file_path = local_upload_path(template_filename) if template_filename else None
         
         # Generate the presentation
         output_path = os.path.join(GENERATED_FOLDER, output_filename)
         
-        success, message, slide_count = generate_presentation(
-            song_file_path, 
-            output_path, 
-            template_file_path, 
-            generate_toc
-        )
+        if output_format == 'html':
+            # Browser viewer + JSON manifest, no python-pptx rendering needed
+            profile_stage(profiler, 'html')
+            success, message, slide_count = generate_html_bundle(
+                song_file_path,
+                output_path,
+                generate_toc,
+                collapse_duplicates
+            )
+        else:
+            success, message, slide_count = generate_presentation(
+                song_file_path, 
+                output_path, 
+                template_file_path, 
+                generate_toc,
+                alphabetical_index,
+                should_cancel,
+                OUTPUT_COMPRESSION,
+                TEMPLATE_CACHE_FOLDER,
+                collapse_duplicates,
+                profiler=profiler,
+                checkpoint_folder=fetch_checkpoint(job_id),
+                checkpoint_on_write=checkpoint_writer(job_id)
+            )
         
         if success:
+            # Store outputs now, hashed, so downloads get versioned URLs from any instance
+            processing_jobs[job_id]['output_etag'] = store_generated_file(output_filename).etag
+            if output_format == 'html':
+                manifest_filename = os.path.splitext(output_filename)[0] + '.json'
+                processing_jobs[job_id]['manifest_etag'] = store_generated_file(manifest_filename).etag
             processing_jobs[job_id]['status'] = 'completed'
             processing_jobs[job_id]['message'] = f'Successfully generated {slide_count} slides!'
             processing_jobs[job_id]['output_file'] = output_filename
+            processing_jobs[job_id]['output_format'] = output_format
+            processing_jobs[job_id]['slide_count'] = slide_count
+            try:
+                prepare_job_preview(job, song_file_path, template_file_path, collapse_duplicates)
+            except Exception as e:
+                print(f"Could not prepare previews for job {job_id}: {e}")
+        elif job.get('cancel_reason'):
+            processing_jobs[job_id]['status'] = 'cancelled'
+            processing_jobs[job_id]['message'] = job['cancel_reason']
         else:
             processing_jobs[job_id]['status'] = 'error'
             processing_jobs[job_id]['message'] = f'Error: {message}'
@@ -85,6 +518,108 @@ def process_files_async(job_id, song_file_path, template_file_path, generate_toc
     except Exception as e:
         processing_jobs[job_id]['status'] = 'error'
         processing_jobs[job_id]['message'] = f'Unexpected error: {str(e)}'
+    finally:
+        if job.get('superseded'):
+            # Resumed by another process, which now reports this job
+            processing_jobs.pop(job_id, None)
+        else:
+            save_job_record(job_id)
+            discard_checkpoint(job_id)
+        if profiler is not None:
+            try:
+                finish_job_profile(job_id, job, profiler, profile_sampled)
+            except Exception as e:
+                print(f"Could not save profile for job {job_id}: {e}")
+
+def run_job(job_id):
+    """Scheduler entry point: run a job with the parameters kept in its record."""
+    process_files_async(job_id, **processing_jobs[job_id]['params'])
+
+def heartbeat_jobs():
+    """Refresh the records of this process's queued and running jobs so no other process resumes them."""
+    for job_id, job in list(processing_jobs.items()):
+        if job['status'] not in ('queued', 'processing') or job.get('superseded'):
+            continue
+        record = load_job_record(job_id)
+        if record is not None and record.get('owner') != instance_id():
+            # Taken for dead (this process stalled) and claimed elsewhere: let that run finish it
+            job['superseded'] = True
+            job['cancel_event'].set()
+            if scheduler.cancel(job_id):
+                processing_jobs.pop(job_id, None)
+            continue
+        job['last_seen'] = max(job['last_seen'], job_last_seen(job_id))
+        save_job_record(job_id)
+
+def claim_job(job_id, record):
+    """Take over a dead job's record; True if this process won the claim."""
+    record['owner'] = instance_id()
+    record['heartbeat'] = time.time()
+    record['attempts'] = record.get('attempts', 1) + 1
+    write_job_record(job_id, record)
+    time.sleep(JOB_CLAIM_SETTLE_SECONDS)
+    claimed = load_job_record(job_id)
+    return claimed is not None and claimed.get('owner') == instance_id()
+
+def resume_dead_jobs():
+    """Queue again, here, the jobs whose process stopped sending heartbeats."""
+    if len(finished_job_records) > 10000:
+        finished_job_records.clear()
+    for stored in storage.list(JOB_PREFIX):
+        job_id, extension = os.path.splitext(os.path.basename(stored.key))
+        if extension != '.json' or job_id in processing_jobs or job_id in finished_job_records:
+            continue
+        if time.time() - stored.modified < JOB_LEASE_SECONDS:
+            continue  # written recently, so its owner is alive
+        record = load_job_record(job_id)
+        if record is None:
+            continue
+        if record['status'] not in ('queued', 'processing') or 'params' not in record:
+            finished_job_records.add(job_id)
+            continue
+        if time.time() - record.get('heartbeat', 0) < JOB_LEASE_SECONDS or not claim_job(job_id, record):
+            continue
+        
+        processing_jobs[job_id] = {
+            'status': 'queued',
+            'message': 'Resuming after a server restart...',
+            'created_at': datetime.now(),
+            'last_seen': max(record.get('last_seen', 0), job_last_seen(job_id)),
+            'cancel_event': threading.Event(),
+            'params': record['params'],
+            'client_id': record['client_id'],
+            'cost': record['cost'],
+            'attempts': record['attempts']
+        }
+        if record['attempts'] > MAX_JOB_ATTEMPTS:
+            processing_jobs[job_id]['status'] = 'error'
+            processing_jobs[job_id]['message'] = 'Error: generation was interrupted too many times, please try again'
+            save_job_record(job_id)
+            discard_checkpoint(job_id)
+            continue
+        print(f"Resuming job {job_id} (attempt {record['attempts']} of {MAX_JOB_ATTEMPTS})")
+        save_job_record(job_id)
+        scheduler.submit(record['client_id'], job_id, record['cost'], run_job, job_id)
+
+def supervise_jobs():
+    """Background loop of every process: heartbeats for its jobs, resuming dead ones, forgetting expired ones."""
+    while True:
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+        try:
+            heartbeat_jobs()
+            resume_dead_jobs()
+            forget_finished_jobs()
+        except Exception as e:
+            print(f"Job supervisor error: {e}")
+
+@app.before_request
+def start_job_supervisor():
+    """Start the supervisor on the first request, so gunicorn forks before any threads exist."""
+    global supervisor_thread
+    with supervisor_lock:
+        if supervisor_thread is None:
+            supervisor_thread = threading.Thread(target=supervise_jobs, daemon=True)
+            supervisor_thread.start()
 
 @app.route('/')
 def index():
@@ -96,6 +631,14 @@ def index():
 def upload_files():
     """Handle file upload and start processing."""
     try:
+        client_id = client_id_for_request()
+        if scheduler.pending_jobs(client_id) >= PROCESS_MAX_QUEUED_JOBS_PER_CLIENT:
+            flash('You already have presentations waiting to be generated. Please wait for them to finish.', 'error')
+            return redirect(url_for('index'))
+        if not rate_limiter.allow(client_id):
+            flash('Too many requests. Please wait a minute before generating another presentation.', 'error')
+            return redirect(url_for('index'))
+        
         # Check if files were uploaded
         if 'song_file' not in request.files:
             flash('No song file selected', 'error')
@@ -103,12 +646,20 @@ def upload_files():
         
         song_file = request.files['song_file']
         template_file = request.files.get('template_file')
-        generate_toc = 'generate_toc' in request.form
+        alphabetical_index = 'alphabetical_index' in request.form
+        generate_toc = 'generate_toc' in request.form or alphabetical_index
+        collapse_duplicates = 'collapse_duplicates' in request.form
         output_filename = request.form.get('output_filename', 'songs_presentation.pptx')
+        output_format = request.form.get('output_format', 'pptx')
+        if output_format not in OUTPUT_FORMATS:
+            output_format = 'pptx'
         
-        # Ensure output filename has .pptx extension
-        if not output_filename.endswith('.pptx'):
-            output_filename += '.pptx'
+        # Ensure output filename has the extension of the chosen format
+        output_extension = OUTPUT_FORMATS[output_format]
+        if output_filename.endswith('.pptx') and output_extension != '.pptx':
+            output_filename = output_filename[:-len('.pptx')]
+        if not output_filename.endswith(output_extension):
+            output_filename += output_extension
         
         # Validate song file
         if song_file.filename == '':
@@ -116,10 +667,11 @@ def upload_files():
             return redirect(url_for('index'))
         
         if not allowed_file(song_file.filename, ALLOWED_TEXT_EXTENSIONS):
-            flash('Song file must be a .txt file', 'error')
+            flash('Song file must be a .txt file (or a compiled .songs corpus)', 'error')
             return redirect(url_for('index'))
         
         # Validate template file if provided
+        template_filename = None
         template_file_path = None
         if template_file and template_file.filename != '':
             if not allowed_file(template_file.filename, ALLOWED_PPTX_EXTENSIONS):
@@ -136,21 +688,46 @@ def upload_files():
         song_file_path = os.path.join(app.config['UPLOAD_FOLDER'], song_filename)
         song_file.save(song_file_path)
         
-        # Create job ID and start processing
+        # Dry-run the songs first so empty files never reach a worker
+        report = validate_song_file(song_file_path, generate_toc, alphabetical_index,
+                                    find_duplicates=collapse_duplicates)
+        if not report['songs']:
+            for path in (song_file_path, template_file_path):
+                if path and os.path.exists(path):
+                    os.remove(path)
+            flash('No songs found in the file. Make sure song titles start with #', 'error')
+            return redirect(url_for('index'))
+        
+        # Keep the uploads in storage too, so any instance can run or rerun the job
+        storage.put_file(UPLOAD_PREFIX + song_filename, song_file_path)
+        if template_filename:
+            storage.put_file(UPLOAD_PREFIX + template_filename, template_file_path)
+        
+        # Create job ID and start processing; the record lets another process resume it
         job_id = str(uuid.uuid4())
         processing_jobs[job_id] = {
-            'status': 'starting',
-            'message': 'Starting processing...',
-            'created_at': datetime.now()
+            'status': 'queued',
+            'message': 'Waiting in queue...',
+            'created_at': datetime.now(),
+            'last_seen': time.time(),
+            'cancel_event': threading.Event(),
+            'params': {
+                'song_filename': song_filename,
+                'template_filename': template_filename,
+                'generate_toc': generate_toc,
+                'output_filename': output_filename,
+                'output_format': output_format,
+                'alphabetical_index': alphabetical_index,
+                'collapse_duplicates': collapse_duplicates
+            },
+            'client_id': client_id,
+            'cost': max(1, report['total_slides'] - report.get('duplicate_slide_count', 0)),
+            'attempts': 1
         }
+        save_job_record(job_id)
         
-        # Start background processing
-        thread = threading.Thread(
-            target=process_files_async,
-            args=(job_id, song_file_path, template_file_path, generate_toc, output_filename)
-        )
-        thread.daemon = True
-        thread.start()
+        # Queue for background processing; workers are shared fairly between clients
+        scheduler.submit(client_id, job_id, processing_jobs[job_id]['cost'], run_job, job_id)
         
         return render_template('processing.html', job_id=job_id)
         
@@ -158,33 +735,182 @@ def upload_files():
         flash(f'Error processing files: {str(e)}', 'error')
         return redirect(url_for('index'))
 
+@app.route('/validate', methods=['POST'])
+def validate_songs():
+    """Dry-run a song file and report songs, slide counts and problems without generating."""
+    song_file = request.files.get('song_file')
+    if song_file is not None and song_file.filename != '':
+        data = song_file.read()
+    elif song_file is None and request.content_type and request.content_type.startswith('text/plain'):
+        data = request.get_data()
+    else:
+        return jsonify({'valid': False, 'message': 'No song file selected'}), 400
+    
+    alphabetical_index = 'alphabetical_index' in request.form or request.args.get('alphabetical_index') == '1'
+    generate_toc = ('generate_toc' in request.form or request.args.get('generate_toc') == '1'
+                    or alphabetical_index)
+    find_duplicates = 'find_duplicates' in request.form or request.args.get('find_duplicates') == '1'
+    
+    # With a template, fit is checked against the area its decorations leave free
+    template = None
+    template_file = request.files.get('template_file')
+    if template_file is not None and template_file.filename != '':
+        try:
+            template = template_info(Presentation(io.BytesIO(template_file.read())))
+        except Exception:
+            return jsonify({'valid': False, 'message': 'Template file is not a valid .pptx file'}), 400
+    
+    if data.startswith(SONG_CORPUS_MAGIC):
+        try:
+            corpus = SongCorpus(data)
+        except ValueError as e:
+            return jsonify({'valid': False, 'message': str(e)}), 400
+        report = validate_parsed_songs(corpus.songs, corpus.encoding, generate_toc, alphabetical_index,
+                                       find_duplicates=find_duplicates, template=template)
+    else:
+        content, encoding = decode_song_bytes(data)
+        report = validate_song_text(content, encoding, generate_toc, alphabetical_index,
+                                    find_duplicates=find_duplicates, template=template)
+    report['valid'] = bool(report['songs'])
+    if not report['valid']:
+        report['message'] = 'No songs found in the file. Make sure song titles start with #'
+    return jsonify(report)
+
 @app.route('/status/<job_id>')
 def get_status(job_id):
     """Get processing status for a job."""
-    if job_id not in processing_jobs:
-        return jsonify({'status': 'not_found', 'message': 'Job not found'}), 404
+    job = processing_jobs.get(job_id)
+    if job is None or job.get('superseded'):
+        # Run by another instance: answer from its stored record
+        job = load_job_record(job_id)
+        if job is None:
+            return jsonify({'status': 'not_found', 'message': 'Job not found'}), 404
+        if job['status'] in ('queued', 'processing'):
+            note_job_seen(job_id)
     
-    job = processing_jobs[job_id]
+    job['last_seen'] = time.time()
     response = {
         'status': job['status'],
         'message': job['message']
     }
     
+    if job['status'] == 'queued':
+        position = scheduler.queue_position(job_id)
+        if position is not None:
+            response['message'] = f'Waiting in queue (position {position})...'
+    
     if job['status'] == 'completed' and 'output_file' in job:
-        response['download_url'] = url_for('download_file', filename=job['output_file'])
+        response['download_url'] = url_for('download_file', filename=job['output_file'], v=job['output_etag'])
+        if 'preview' in job:
+            response['preview_url'] = url_for('preview_page', job_id=job_id)
+        if job.get('output_format') == 'html':
+            manifest_filename = os.path.splitext(job['output_file'])[0] + '.json'
+            response['view_url'] = url_for('view_file', filename=job['output_file'], v=job['output_etag'])
+            response['manifest_url'] = url_for('download_file', filename=manifest_filename, v=job['manifest_etag'])
     
     return jsonify(response)
 
+@app.route('/preview/<job_id>')
+def preview_page(job_id):
+    """Scrollable page of slide thumbnails for a finished job."""
+    job = processing_jobs.get(job_id)
+    if not job or 'preview' not in job:
+        flash('Preview not found or has expired', 'error')
+        return redirect(url_for('index'))
+    
+    manifest = job['preview']['manifest']
+    slides = []
+    for song in manifest['songs']:
+        for n in range(song['slide_count']):
+            slides.append({
+                'index': song['first_slide'] + n,
+                'title': song['title'],
+                'label': f"{n + 1}/{song['slide_count']}"
+            })
+    
+    download_url = url_for('download_file', filename=job['output_file'], v=job['output_etag'])
+    return render_template('preview.html', job_id=job_id, slides=slides, download_url=download_url)
+
+@app.route('/preview/<job_id>/<int:index>.png')
+def preview_image(job_id, index):
+    """Thumbnail of one song slide, rendered on the preview worker pool."""
+    job = processing_jobs.get(job_id)
+    if not job or 'preview' not in job or index >= len(job['preview']['song_of_slide']):
+        return jsonify({'status': 'not_found', 'message': 'Preview not found'}), 404
+    
+    path = preview_pool.submit(render_job_preview, job, index).result()
+    return send_file(os.path.abspath(path), mimetype='image/png', max_age=86400)
+
+@app.route('/cancel/<job_id>', methods=['POST'])
+def cancel_job(job_id):
+    """Stop a queued or running job."""
+    if job_id not in processing_jobs:
+        return jsonify({'status': 'not_found', 'message': 'Job not found'}), 404
+    
+    job = processing_jobs[job_id]
+    if job['status'] in ('queued', 'processing'):
+        job['cancel_event'].set()
+        if scheduler.cancel(job_id):
+            # Never started, so the worker slot is free straight away
+            job['status'] = 'cancelled'
+            job['message'] = 'Cancelled by user'
+            save_job_record(job_id)
+        else:
+            job['message'] = 'Cancelling...'
+    
+    return jsonify({'status': job['status'], 'message': job['message']})
+
 @app.route('/download/<filename>')
 def download_file(filename):
     """Download generated PowerPoint file."""
-    file_path = os.path.join(app.config['GENERATED_FOLDER'], filename)
+    stored = storage.stat(GENERATED_PREFIX + filename)
     
-    if not os.path.exists(file_path):
+    if stored is None:
         flash('File not found or has expired', 'error')
         return redirect(url_for('index'))
     
-    return send_file(file_path, as_attachment=True, download_name=filename)
+    return send_generated_file(stored, as_attachment=True, download_name=filename)
+
+@app.route('/view/<filename>')
+def view_file(filename):
+    """Open a generated HTML slide viewer directly in the browser."""
+    stored = storage.stat(GENERATED_PREFIX + filename) if filename.endswith('.html') else None
+    
+    if stored is None:
+        flash('File not found or has expired', 'error')
+        return redirect(url_for('index'))
+    
+    return send_generated_file(stored, mimetype='text/html')
+
+def require_admin():
+    """Admin pages only exist when ADMIN_TOKEN is set and given as ?token=."""
+    token = request.args.get('token', '')
+    if not ADMIN_TOKEN or not hmac.compare_digest(token, ADMIN_TOKEN):
+        abort(404)
+
+@app.route('/admin/profiles')
+def admin_profiles():
+    """List the kept job profiles, newest first."""
+    require_admin()
+    profiles = []
+    for meta_path in glob.glob(os.path.join(PROFILE_FOLDER, '*.json')):
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as file:
+                profiles.append(json.load(file))
+        except (OSError, ValueError):
+            continue
+    profiles.sort(key=lambda profile: profile['created_at'], reverse=True)
+    return render_template('admin_profiles.html', profiles=profiles, token=ADMIN_TOKEN,
+                           every_n_jobs=PROFILE_EVERY_N_JOBS, slow_job_seconds=PROFILE_SLOW_JOB_SECONDS)
+
+@app.route('/admin/profiles/<filename>')
+def admin_profile_file(filename):
+    """Download one profile file (.prof for pstats/snakeviz, .collapsed for flamegraphs)."""
+    require_admin()
+    file_path = os.path.join(PROFILE_FOLDER, secure_filename(filename))
+    if not filename.endswith(('.prof', '.collapsed')) or not os.path.exists(file_path):
+        abort(404)
+    return send_file(os.path.abspath(file_path), as_attachment=True, download_name=filename)
 
 @app.errorhandler(413)
 def too_large(e):
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Benchmark save time against file size for each output compression profile."""
+
+import os
+import sys
+import time
+from pptx import Presentation
+from generator import create_slide, save_presentation, COMPRESSION_PROFILES
+from songs import parse_songs, song_slides
+
+def benchmark_compression(song_file="kumpulan_lagu_ekklesia.txt", template_file=None, repeats=3):
+    """Build one deck, then time saving it with python-pptx and with each profile."""
+    print("⏱️  Benchmarking output compression profiles...")
+    print("=" * 50)
+
+    if not os.path.exists(song_file):
+        print(f"❌ Song file not found: {song_file}")
+        return False
+
+    prs = Presentation(template_file) if template_file else Presentation()
+    slide_count = 0
+    for song in parse_songs(song_file):
+        lyric_slides = song_slides(song)
+        for slide_index, slide_content in enumerate(lyric_slides):
+            create_slide(prs, song['title'], slide_content, slide_index + 1, len(lyric_slides))
+            slide_count += 1
+
+    print(f"📄 Song file: {song_file} ({slide_count} slides)")
+    print(f"🔁 Best of {repeats} runs")
+    print("-" * 50)
+    print(f"{'profile':<12}{'save time':>12}{'file size':>14}")
+
+    output_file = "benchmark_output.pptx"
+    savers = [('prs.save', lambda: prs.save(output_file))]
+    for profile in COMPRESSION_PROFILES:
+        savers.append((profile, lambda profile=profile: save_presentation(prs, output_file, profile)))
+
+    for name, save in savers:
+        best = None
+        for _ in range(repeats):
+            started = time.perf_counter()
+            save()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        file_size = os.path.getsize(output_file) / (1024 * 1024)  # MB
+        print(f"{name:<12}{best * 1000:>10.0f}ms{file_size:>11.2f} MB")
+
+    os.remove(output_file)
+    return True
+
+if __name__ == "__main__":
+    song_file = sys.argv[1] if len(sys.argv) > 1 else "kumpulan_lagu_ekklesia.txt"
+    template_file = sys.argv[2] if len(sys.argv) > 2 else None
+    benchmark_compression(song_file, template_file)
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 PowerPoint Song Generator - Web Version
-Adapted from simple_generator.py for web application use.
+Shared by the web app and the simple_generator.py command line.
 """
 
 from pptx import Presentation
@@ -9,87 +9,205 @@ from pptx.util import Inches, Pt
 from pptx.enum.text import PP_ALIGN, MSO_ANCHOR
 from pptx.dml.color import RGBColor
 from pptx.enum.dml import MSO_THEME_COLOR
-import re
-import math
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.opc.serialized import PackageWriter
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import nsdecls
+from profiling import StageProfiler, profile_stage
+from songs import (parse_songs, song_slides, open_song_archive, plan_toc_layout, find_duplicate_songs,
+                   collapse_duplicate_songs, normalize_song_text, TOC_SPACE_AFTER, TOC_COLUMN_GAP,
+                   TOC_TEXT_MARGIN, DEFAULT_SLIDE_WIDTH, DEFAULT_SLIDE_HEIGHT)
+import hashlib
+import json
 import os
+import posixpath
+import re
+import struct
+import time
+import weakref
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape as xml_escape, unescape as xml_unescape, quoteattr
 
 
-def parse_songs(file_path):
-    """Parse songs from text file."""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-    except UnicodeDecodeError:
-        # Try with different encoding
-        with open(file_path, 'r', encoding='latin-1') as file:
-            content = file.read()
-    
-    # Split by song markers (lines starting with #)
-    song_sections = re.split(r'\n(?=#)', content)
-    songs = []
-    
-    for section in song_sections:
-        if section.strip() and section.startswith('#'):
-            lines = section.split('\n')
-            
-            if lines:
-                # Extract title (remove #)
-                title = lines[0].replace('#', '').strip()
-                
-                # Get lyrics (everything after title), preserving empty lines
-                lyrics = lines[1:] if len(lines) > 1 else []
-                
-                if title:  # Only add if we have a title
-                    songs.append({
-                        'title': title,
-                        'lyrics': lyrics
-                    })
-    
-    return songs
+class GenerationCancelled(Exception):
+    """Raised at a checkpoint when the caller asked generation to stop."""
 
 
-def split_lyrics_into_slides(lyrics):
-    """Split lyrics into slides at paragraph breaks (empty lines)."""
-    slides = []
-    current_slide = []
-    
-    for line in lyrics:
-        if line.strip():  # Non-empty line
-            current_slide.append(line)
-        else:  # Empty line - natural paragraph break
-            if current_slide:  # Only create slide if we have content
-                slides.append(current_slide.copy())
-                current_slide = []
-    
-    # Add remaining content if any
-    if current_slide:
-        slides.append(current_slide)
-    
-    return slides
+def _checkpoint(should_cancel):
+    """Stop generation between songs if should_cancel() says so."""
+    if should_cancel is not None and should_cancel():
+        raise GenerationCancelled()
+
+
+# Template analysis: which layout slides are built on and where decorations sit
+TEMPLATE_INFO_VERSION = 1
+TEMPLATE_CLEARANCE = Inches(0.1)  # gap kept between decorations and text
+TEMPLATE_INFO_MEMORY_LIMIT = 256  # templates whose analysis is kept in memory
+_template_state_by_part = weakref.WeakKeyDictionary()  # presentation part -> (info, layout)
+_template_info_by_hash = {}  # template file sha1 -> info, shared by later jobs
+
+
+def _is_decorative_band(shape, slide_width, slide_height):
+    """Wide, thin non-placeholder shapes (rules, title bars) that text must avoid."""
+    if shape.is_placeholder or None in (shape.left, shape.top, shape.width, shape.height):
+        return False
+    if shape.width >= slide_width * 0.9 and shape.height >= slide_height * 0.9:
+        return False  # full-slide background
+    return shape.width >= slide_width * 0.5 and shape.height <= slide_height * 0.25
+
+
+def analyze_template(prs):
+    """
+    Find the emptiest slide layout and the area clear of decorative shapes.
+
+    The layout with the fewest placeholders that add_slide would copy onto
+    every slide wins, then the one with the fewest shapes; the old choice
+    (layout 6, or the last layout) breaks remaining ties. Wide, thin shapes
+    on that layout and on its master (unless the layout hides master
+    shapes) are decorations: those in the top half, like the red line under
+    the title, push text down and those in the bottom half cap it.
+
+    Returns a JSON-serializable dict.
+    """
+    legacy_index = 6 if len(prs.slide_layouts) > 6 else len(prs.slide_layouts) - 1
+    best = None
+    for master_index, master in enumerate(prs.slide_masters):
+        for layout_index, layout in enumerate(master.slide_layouts):
+            rank = (
+                len(list(layout.iter_cloneable_placeholders())),
+                len(layout.shapes),
+                (master_index, layout_index) != (0, legacy_index),
+                master_index,
+                layout_index,
+            )
+            if best is None or rank < best[0]:
+                best = (rank, master_index, layout_index)
+    rank, master_index, layout_index = best
+    master = prs.slide_masters[master_index]
+    layout = master.slide_layouts[layout_index]
+
+    shapes = list(layout.shapes)
+    if layout._element.get('showMasterSp') not in ('0', 'false'):
+        shapes += list(master.shapes)
+
+    slide_width, slide_height = prs.slide_width, prs.slide_height
+    content_top, content_bottom = 0, slide_height
+    for shape in shapes:
+        if not _is_decorative_band(shape, slide_width, slide_height):
+            continue
+        if shape.top + shape.height / 2 < slide_height / 2:
+            content_top = max(content_top, shape.top + shape.height)
+        else:
+            content_bottom = min(content_bottom, shape.top)
+
+    return {
+        'version': TEMPLATE_INFO_VERSION,
+        'master': master_index,
+        'layout': layout_index,
+        'layout_name': layout.name,
+        'placeholders': rank[0],
+        'slide_width': int(slide_width),
+        'slide_height': int(slide_height),
+        'content_top': int(content_top),
+        'content_bottom': int(content_bottom),
+        # How far text moves down from its usual place, and where it must end
+        'top_offset': int(max(0, content_top + TEMPLATE_CLEARANCE - Inches(0.6))),
+        'bottom_limit': int(content_bottom - TEMPLATE_CLEARANCE) if content_bottom < slide_height
+                        else int(slide_height),
+    }
+
+
+def _register_template_info(prs, info):
+    layout = prs.slide_masters[info['master']].slide_layouts[info['layout']]
+    _template_state_by_part[prs.part] = (info, layout)
+    return info
+
+
+def template_info(prs):
+    """Template analysis for prs, computed on first use and kept for the presentation's lifetime."""
+    state = _template_state_by_part.get(prs.part)
+    if state is None:
+        return _register_template_info(prs, analyze_template(prs))
+    return state[0]
+
+
+def blank_layout(prs):
+    """The layout every generated slide is built on (see analyze_template)."""
+    state = _template_state_by_part.get(prs.part)
+    if state is None:
+        template_info(prs)
+        state = _template_state_by_part[prs.part]
+    return state[1]
+
+
+def add_blank_slide(prs):
+    """Add a slide on the blank layout, dropping any placeholders it copied (text goes in text boxes)."""
+    slide = prs.slides.add_slide(blank_layout(prs))
+    if template_info(prs)['placeholders']:
+        for placeholder in list(slide.placeholders):
+            sp = placeholder._element
+            sp.getparent().remove(sp)
+    return slide
+
+
+def load_template_info(prs, template_file_path=None, cache_folder=None):
+    """
+    Template analysis for prs, looked up by the template file's hash first.
+
+    Results are kept in memory and, if cache_folder is given, as <sha1>.json
+    files there, so later jobs with the same template skip the analysis.
+    """
+    if not template_file_path:
+        return template_info(prs)
+
+    digest = hashlib.sha1()
+    with open(template_file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    key = digest.hexdigest()
+    cache_path = os.path.join(cache_folder, f"{key}.json") if cache_folder else None
+
+    info = _template_info_by_hash.get(key)
+    if info is None and cache_path:
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as file:
+                info = json.load(file)
+        except (OSError, ValueError):
+            info = None
+        if info is not None and info.get('version') != TEMPLATE_INFO_VERSION:
+            info = None
+    if info is None:
+        info = analyze_template(prs)
+        if cache_path:
+            # Write-then-rename so concurrent jobs never read a partial file
+            temp_path = f"{cache_path}.{os.getpid()}.{id(info)}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                json.dump(info, file)
+            os.replace(temp_path, cache_path)
+
+    if key not in _template_info_by_hash and len(_template_info_by_hash) >= TEMPLATE_INFO_MEMORY_LIMIT:
+        _template_info_by_hash.pop(next(iter(_template_info_by_hash)))
+    _template_info_by_hash[key] = info
+    return _register_template_info(prs, info)
 
 
 def create_slide(prs, title, content_lines, slide_number=None, total_slides=None):
     """Create a simple slide with title and content."""
-    # Use a simple blank layout to avoid placeholder conflicts
-    # This ensures consistent behavior across different templates
-    try:
-        # Use blank layout (index 6) or last available layout
-        if len(prs.slide_layouts) > 6:
-            layout = prs.slide_layouts[6]  # Blank layout
-        else:
-            layout = prs.slide_layouts[-1]  # Last available layout
-    except (IndexError, AttributeError):
-        # Fallback to first available layout
-        layout = prs.slide_layouts[0]
-    
-    slide = prs.slides.add_slide(layout)
+    # Use the template's emptiest layout to avoid placeholder conflicts
+    # and keep text clear of its decorations (analyzed once per template)
+    slide = add_blank_slide(prs)
+    info = template_info(prs)
+    shift = info['top_offset']
     
     # Always use manual text boxes for consistent positioning
     # This avoids conflicts with template placeholders
     
     # Add title at top-left, with distance from red line
     title_box = slide.shapes.add_textbox(
-        Inches(0.5), Inches(0.6),  # More distance from red line at top
+        Inches(0.5), Inches(0.6) + shift,  # More distance from red line at top
         prs.slide_width - Inches(1.8), Inches(1.0)  # Leave minimal space for narrow slide counter
     )
     title_frame = title_box.text_frame
@@ -109,7 +227,7 @@ def create_slide(prs, title, content_lines, slide_number=None, total_slides=None
     # Add slide counter (e.g., "1/4") in top-right if provided
     if slide_number is not None and total_slides is not None:
         counter_box = slide.shapes.add_textbox(
-            prs.slide_width - Inches(1.3), Inches(0.6),  # Top-right position, narrower
+            prs.slide_width - Inches(1.3), Inches(0.6) + shift,  # Top-right position, narrower
             Inches(1.0), Inches(1.0)  # Narrower width for compact counter
         )
         counter_frame = counter_box.text_frame
@@ -129,8 +247,9 @@ def create_slide(prs, title, content_lines, slide_number=None, total_slides=None
     # Add content below title, positioned much closer
     if content_lines:
         content_box = slide.shapes.add_textbox(
-            Inches(0.5), Inches(1.4),  # Much closer to title (reduced from 1.8 to 1.4)
-            prs.slide_width - Inches(1.0), prs.slide_height - Inches(1.9)  # Adjusted height accordingly
+            Inches(0.5), Inches(1.4) + shift,  # Much closer to title (reduced from 1.8 to 1.4)
+            prs.slide_width - Inches(1.0),
+            min(prs.slide_height - Inches(1.9), info['bottom_limit'] - Inches(1.4) - shift)  # Adjusted height accordingly
         )
         content_frame = content_box.text_frame
         content_frame.margin_left = Inches(0.2)  # Match title margin
@@ -151,133 +270,775 @@ def create_slide(prs, title, content_lines, slide_number=None, total_slides=None
             p.font.color.rgb = RGBColor(0, 0, 0)  # Black
             p.alignment = PP_ALIGN.LEFT
             p.space_after = Pt(16)
+    
+    return slide
+
+
+def restore_slide(prs, slide_xml):
+    """Add a slide from XML saved by a GenerationCheckpoint (same template) without rendering it again."""
+    slide = prs.slides.add_slide(blank_layout(prs))
+    slide.part._element = parse_xml(slide_xml)
+    return slide
+
+
+TOC_LINK_COLOR = "00008B"  # Dark blue for links
+
+
+def _toc_paragraphs_xml(entries, font_size):
+    """
+    Build <a:p> XML for (label, rId, tooltip) entries in one go. A song
+    entry's tooltip is its full title, shown on hover and read back by
+    extract_setlist when the label was shortened; None adds no tooltip.
+    """
+    size = int(font_size * 100)
+    space_after = int(TOC_SPACE_AFTER * 100)
+    paragraphs = []
+    for label, rId, tooltip in entries:
+        tooltip_attribute = '' if tooltip is None else f' tooltip={quoteattr(tooltip)}'
+        paragraphs.append(
+            f'<a:p><a:pPr algn="l"><a:spcAft><a:spcPts val="{space_after}"/></a:spcAft>'
+            f'<a:defRPr sz="{size}"><a:solidFill><a:srgbClr val="{TOC_LINK_COLOR}"/></a:solidFill>'
+            f'<a:latin typeface="Calibri"/></a:defRPr></a:pPr>'
+            f'<a:r><a:rPr lang="en-US" sz="{size}"><a:solidFill><a:srgbClr val="{TOC_LINK_COLOR}"/>'
+            f'</a:solidFill><a:latin typeface="Calibri"/><a:hlinkClick r:id="{rId}"{tooltip_attribute}/></a:rPr>'
+            f'<a:t>{xml_escape(label)}</a:t></a:r></a:p>'
+        )
+    return ''.join(paragraphs)
+
 
+def _add_toc_column(slide, left, top, width, height, entries, font_size):
+    """Add a text box holding prebuilt, hyperlinked TOC entries."""
+    box = slide.shapes.add_textbox(left, top, width, height)
+    sp = box._element
+    tx_body = parse_xml(
+        f'<p:txBody {nsdecls("p", "a", "r")}>'
+        f'<a:bodyPr wrap="square" lIns="{TOC_TEXT_MARGIN}" rIns="{TOC_TEXT_MARGIN}" anchor="t">'
+        f'<a:spAutoFit/></a:bodyPr><a:lstStyle/>'
+        f'{_toc_paragraphs_xml(entries, font_size)}</p:txBody>'
+    )
+    sp.replace(sp.txBody, tx_body)
+    return box
+
+
+def _add_toc_title(prs, slide, title_text):
+    """Add the heading used on TOC and index slides."""
+    title_box = slide.shapes.add_textbox(
+        Inches(0.5), Inches(0.6) + template_info(prs)['top_offset'],
+        prs.slide_width - Inches(1.0), Inches(1.0)
+    )
+    title_frame = title_box.text_frame
+    title_frame.margin_left = Inches(0.2)
+    title_frame.margin_right = Inches(0.2)
+    title_frame.vertical_anchor = MSO_ANCHOR.TOP
+    title_frame.word_wrap = True
+    
+    title_p = title_frame.paragraphs[0]
+    title_p.text = title_text
+    title_p.font.size = Pt(32)
+    title_p.font.name = "Calibri"
+    title_p.font.bold = True
+    title_p.font.color.rgb = RGBColor(0, 0, 0)
+    title_p.alignment = PP_ALIGN.LEFT
+
+
+def create_toc_slides(prs, songs_with_slides, layout=None, alphabetical_index=False):
+    """
+    Create Table of Contents slides with clickable links to songs.
 
-def create_toc_slides(prs, songs_with_slides, songs_per_toc_slide=20):
-    """Create Table of Contents slides with clickable links to songs."""
+    Uses layout from plan_toc_layout (computed here if not given); the
+    slide positions in songs_with_slides must already account for
+    layout['slide_count'] TOC slides at the start of the deck.
+    """
     if not songs_with_slides:
         return []
     
+    titles = [title for title, _ in songs_with_slides]
+    if layout is None:
+        info = template_info(prs)
+        layout = plan_toc_layout(titles, prs.slide_width, prs.slide_height, alphabetical_index,
+                                 top_offset=info['top_offset'], bottom_limit=info['bottom_limit'])
+    
     toc_slides = []
-    total_songs = len(songs_with_slides)
-    total_toc_slides = math.ceil(total_songs / songs_per_toc_slide)
+    index_slide_count = layout['index_slide_count']
+    total_toc_pages = len(layout['pages'])
+    column_width = layout['column_width']
+    font_size = layout['font_size']
     
-    for toc_page in range(total_toc_slides):
-        # Use same layout as song slides
-        try:
-            if len(prs.slide_layouts) > 6:
-                layout = prs.slide_layouts[6]  # Blank layout
-            else:
-                layout = prs.slide_layouts[-1]  # Last available layout
-        except (IndexError, AttributeError):
-            layout = prs.slide_layouts[0]
+    # Alphabetical index: letters linking to the TOC page they start on
+    if layout['index_letters']:
+        slide = add_blank_slide(prs)
+        toc_slides.append(slide)
+        _add_toc_title(prs, slide, "Index")
         
-        slide = prs.slides.add_slide(layout)
+        letters = layout['index_letters']
+        letter_columns = min(6, len(letters))
+        letter_width = int((prs.slide_width - Inches(1.0)) / letter_columns)
+        rows = [letters[i:i + letter_columns] for i in range(0, len(letters), letter_columns)]
+        for column in range(letter_columns):
+            entries = []
+            for row in rows:
+                if column < len(row):
+                    letter, page_index = row[column]
+                    rId = slide.part.relate_to(
+                        f"#{index_slide_count + page_index + 1}", RT.HYPERLINK, is_external=True
+                    )
+                    entries.append((letter, rId, None))
+            _add_toc_column(
+                slide, layout['left'] + letter_width * column, layout['top'],
+                letter_width, layout['height'], entries, 32
+            )
+    
+    for toc_page, page in enumerate(layout['pages']):
+        slide = add_blank_slide(prs)
         toc_slides.append(slide)
         
         # Add TOC title
-        title_text = f"Table of Contents"
-        if total_toc_slides > 1:
-            title_text += f" ({toc_page + 1}/{total_toc_slides})"
-            
-        title_box = slide.shapes.add_textbox(
-            Inches(0.5), Inches(0.6),
-            prs.slide_width - Inches(1.0), Inches(1.0)
-        )
-        title_frame = title_box.text_frame
-        title_frame.margin_left = Inches(0.2)
-        title_frame.margin_right = Inches(0.2)
-        title_frame.vertical_anchor = MSO_ANCHOR.TOP
-        title_frame.word_wrap = True
-        
-        title_p = title_frame.paragraphs[0]
-        title_p.text = title_text
-        title_p.font.size = Pt(32)
-        title_p.font.name = "Calibri"
-        title_p.font.bold = True
-        title_p.font.color.rgb = RGBColor(0, 0, 0)
-        title_p.alignment = PP_ALIGN.LEFT
+        title_text = "Table of Contents"
+        if total_toc_pages > 1:
+            title_text += f" ({toc_page + 1}/{total_toc_pages})"
+        _add_toc_title(prs, slide, title_text)
         
-        # Add songs list for this TOC page in 2 columns
-        start_idx = toc_page * songs_per_toc_slide
-        end_idx = min(start_idx + songs_per_toc_slide, total_songs)
-        songs_on_this_page = songs_with_slides[start_idx:end_idx]
-        
-        # Calculate columns (10 songs per column)
-        col1_songs = songs_on_this_page[:10]  # First 10 songs
-        col2_songs = songs_on_this_page[10:]  # Remaining songs
-        
-        # Create left column (first 10 songs)
-        left_column_box = slide.shapes.add_textbox(
-            Inches(0.5), Inches(1.6),  # Start below title, left side
-            Inches(4.5), prs.slide_height - Inches(2.8)  # Half width, leave space for bottom border
-        )
-        left_frame = left_column_box.text_frame
-        left_frame.margin_left = Inches(0.2)
-        left_frame.margin_right = Inches(0.2)
-        left_frame.vertical_anchor = MSO_ANCHOR.TOP
-        left_frame.word_wrap = True
-        
-        # Add songs to left column
-        for i, (song_title, first_slide_index) in enumerate(col1_songs):
-            if i == 0:
-                p = left_frame.paragraphs[0]
-            else:
-                p = left_frame.add_paragraph()
-            
-            # Add song number and title
-            song_number = start_idx + i + 1
-            p.text = f"{song_number:2d}. {song_title}"
-            p.font.size = Pt(20)  # Larger font for better readability in columns
-            p.font.name = "Calibri"
-            p.font.color.rgb = RGBColor(0, 0, 139)  # Dark blue for links
-            p.alignment = PP_ALIGN.LEFT
-            p.space_after = Pt(6)  # Moderate space between lines
+        for column_index, column in enumerate(page):
+            entries = []
+            for i in column:
+                song_title, first_slide_index = songs_with_slides[i]
+                # Add hyperlink to the song's first slide
+                rId = slide.part.relate_to(f"#{first_slide_index + 1}", RT.HYPERLINK, is_external=True)
+                entries.append((layout['labels'][i], rId, song_title))
             
-            # Add hyperlink to the song's first slide
-            if p.runs:
-                run = p.runs[0]
-                hlink = run.hyperlink
-                hlink.address = f"#{first_slide_index + 1}"
-        
-        # Create right column (next 10 songs) if there are more songs
-        if col2_songs:
-            right_column_box = slide.shapes.add_textbox(
-                Inches(5.2), Inches(1.6),  # Start below title, right side
-                Inches(4.3), prs.slide_height - Inches(2.8)  # Half width, leave space for bottom border
+            _add_toc_column(
+                slide,
+                layout['left'] + (column_width + TOC_COLUMN_GAP) * column_index, layout['top'],
+                column_width, layout['height'],
+                entries, font_size
             )
-            right_frame = right_column_box.text_frame
-            right_frame.margin_left = Inches(0.2)
-            right_frame.margin_right = Inches(0.2)
-            right_frame.vertical_anchor = MSO_ANCHOR.TOP
-            right_frame.word_wrap = True
-            
-            # Add songs to right column
-            for i, (song_title, first_slide_index) in enumerate(col2_songs):
-                if i == 0:
-                    p = right_frame.paragraphs[0]
-                else:
-                    p = right_frame.add_paragraph()
-                
-                # Add song number and title
-                song_number = start_idx + len(col1_songs) + i + 1
-                p.text = f"{song_number:2d}. {song_title}"
-                p.font.size = Pt(20)  # Larger font for better readability in columns
-                p.font.name = "Calibri"
-                p.font.color.rgb = RGBColor(0, 0, 139)  # Dark blue for links
-                p.alignment = PP_ALIGN.LEFT
-                p.space_after = Pt(6)  # Moderate space between lines
-                
-                # Add hyperlink to the song's first slide
-                if p.runs:
-                    run = p.runs[0]
-                    hlink = run.hyperlink
-                    hlink.address = f"#{first_slide_index + 1}"
     
     return toc_slides
 
 
-def generate_presentation(song_file_path, output_path, template_file_path=None, generate_toc=False):
+# Output compression profiles: (deflate level for XML and other parts,
+# deflate level for already-compressed media or None to store it as-is)
+COMPRESSION_PROFILES = {
+    'fast': (1, None),
+    'balanced': (6, None),
+    'smallest': (9, 9),
+}
+_PRECOMPRESSED_EXTENSIONS = {
+    '.png', '.jpg', '.jpeg', '.gif', '.jfif', '.wdp', '.mp3', '.m4a', '.mp4',
+    '.mov', '.wmv', '.avi', '.zip', '.xlsx', '.docx', '.pptx',
+}
+
+
+class _PartCollector(object):
+    """Stands in for python-pptx's zip writer and just records each member."""
+
+    def __init__(self):
+        self.members = []
+
+    def write(self, pack_uri, blob):
+        self.members.append((pack_uri.membername, blob))
+
+
+class _CollectingPackageWriter(PackageWriter):
+    """Serializes the package like python-pptx does, without writing the zip."""
+
+    def _write(self):
+        collector = _PartCollector()
+        self._write_content_types_stream(collector)
+        self._write_pkg_rels(collector)
+        self._write_parts(collector)
+        self.members = collector.members
+
+
+def _deflate(blob, level):
+    """Raw deflate stream as stored in a zip member (zlib releases the GIL here)."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(blob) + compressor.flush()
+
+
+def _dos_datetime(timestamp):
+    t = time.localtime(timestamp)
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+def _write_zip(stream, entries):
+    """Write (name, crc, size, method, data) entries as a zip archive with precomputed data."""
+    dos_time, dos_date = _dos_datetime(time.time())
+    central_directory = []
+    offset = 0
+    for name, crc, size, method, data in entries:
+        name_bytes = name.encode('utf-8')
+        header = struct.pack(
+            '<IHHHHHIIIHH', 0x04034B50, 20, 0x0800, method, dos_time, dos_date,
+            crc, len(data), size, len(name_bytes), 0
+        )
+        stream.write(header)
+        stream.write(name_bytes)
+        stream.write(data)
+        central_directory.append(struct.pack(
+            '<IHHHHHHIIIHHHHHII', 0x02014B50, 20, 20, 0x0800, method, dos_time, dos_date,
+            crc, len(data), size, len(name_bytes), 0, 0, 0, 0, 0, offset
+        ) + name_bytes)
+        offset += len(header) + len(name_bytes) + len(data)
+
+    directory = b''.join(central_directory)
+    stream.write(directory)
+    stream.write(struct.pack(
+        '<IHHHHIIH', 0x06054B50, 0, 0, len(entries), len(entries), len(directory), offset, 0
+    ))
+
+
+def save_presentation(prs, output_path, compression='balanced', max_workers=None):
+    """
+    Save a presentation using a compression profile.
+
+    'fast' uses light deflate and stores images/media uncompressed (they are
+    already compressed), 'balanced' uses the default deflate level, and
+    'smallest' uses maximum deflate for everything. Parts are compressed in
+    parallel on a thread pool.
+
+    output_path can be a path or a writable binary stream, like prs.save().
+    """
+    if compression not in COMPRESSION_PROFILES:
+        raise ValueError(f"Unknown compression profile '{compression}' "
+                         f"(choose from {', '.join(COMPRESSION_PROFILES)})")
+    level, media_level = COMPRESSION_PROFILES[compression]
+
+    package = prs.part.package
+    writer = _CollectingPackageWriter(output_path, package._rels, tuple(package.iter_parts()))
+    writer._write()
+    members = writer.members
+
+    total_size = sum(len(blob) for _, blob in members)
+    if len(members) >= 0xFFFF or total_size >= 0xFFFFFFFF:
+        # Needs ZIP64; let zipfile handle it on one thread
+        with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=level) as zipf:
+            for name, blob in members:
+                zipf.writestr(name, blob)
+        return
+
+    def compress(member):
+        name, blob = member
+        member_level = level
+        if os.path.splitext(name)[1].lower() in _PRECOMPRESSED_EXTENSIONS:
+            member_level = media_level
+        crc = zlib.crc32(blob) & 0xFFFFFFFF
+        if member_level is None:
+            return name, crc, len(blob), 0, blob  # stored
+        return name, crc, len(blob), 8, _deflate(blob, member_level)
+
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        entries = list(pool.map(compress, members))
+
+    if hasattr(output_path, 'write'):
+        _write_zip(output_path, entries)
+    else:
+        with open(output_path, 'wb') as stream:
+            _write_zip(stream, entries)
+
+
+# Checkpoints: songs rendered so far, saved so an interrupted job can resume
+CHECKPOINT_VERSION = 1
+CHECKPOINT_INTERVAL = 10  # seconds between checkpoint writes
+CHECKPOINT_STATE = 'state.json'
+
+
+def checkpoint_fingerprint(*paths, **options):
+    """sha1 of the input files and generation options a checkpoint belongs to."""
+    digest = hashlib.sha1(json.dumps(options, sort_keys=True).encode('utf-8'))
+    for path in paths:
+        digest.update(b'\0')
+        if path and os.path.exists(path):
+            with open(path, 'rb') as file:
+                for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
+
+class GenerationCheckpoint(object):
+    """
+    Slides of the songs a job has rendered, kept in a folder so a job whose
+    worker died can pick up after the last song saved.
+
+    Completed songs are only remembered by their slides; every few seconds
+    the ones completed since the last write are serialized and appended as
+    a zlib-compressed chunk file of length-prefixed slide XML, then
+    state.json is replaced to list it. A folder left by different inputs
+    (another fingerprint) is ignored and overwritten. on_write(path), if
+    given, is called after each file is written, e.g. to copy it to shared
+    storage.
+    """
+
+    def __init__(self, folder, fingerprint, interval=CHECKPOINT_INTERVAL, on_write=None):
+        self.folder = folder
+        self.fingerprint = fingerprint
+        self.interval = interval
+        self.on_write = on_write
+        self.songs = []  # slide XML of each song restored from the folder, in deck order
+        self._pending = []  # slides of each song completed since the last write
+        self._chunks = []
+        self._last_save = time.monotonic()
+        self._load()
+        self.resumed_count = len(self.songs)
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.folder, CHECKPOINT_STATE), 'r', encoding='utf-8') as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return
+        if state.get('version') != CHECKPOINT_VERSION or state.get('fingerprint') != self.fingerprint:
+            return
+        songs = []
+        try:
+            for name in state['chunks']:
+                with open(os.path.join(self.folder, name), 'rb') as file:
+                    songs.extend(self._decode(zlib.decompress(file.read())))
+        except (OSError, KeyError, zlib.error, struct.error):
+            return  # incomplete checkpoint: start over
+        self.songs = songs
+        self._chunks = list(state['chunks'])
+
+    @staticmethod
+    def _decode(data):
+        songs = []
+        offset = 0
+        while offset < len(data):
+            (slide_count,) = struct.unpack_from('<I', data, offset)
+            offset += 4
+            slides = []
+            for _ in range(slide_count):
+                (length,) = struct.unpack_from('<I', data, offset)
+                offset += 4
+                slides.append(data[offset:offset + length])
+                offset += length
+            songs.append(slides)
+        return songs
+
+    def _write(self, name, data):
+        path = os.path.join(self.folder, name)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+        if self.on_write is not None:
+            self.on_write(path)
+
+    def add_song(self, slides):
+        """Record a completed song's slides; writes a checkpoint when the interval has passed."""
+        self._pending.append(slides)
+        if time.monotonic() - self._last_save >= self.interval:
+            self.save()
+
+    def save(self):
+        """Write the songs completed since the last checkpoint."""
+        if not self._pending:
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        data = bytearray()
+        for slides in self._pending:
+            data += struct.pack('<I', len(slides))
+            for slide in slides:
+                slide_xml = slide.part.blob
+                data += struct.pack('<I', len(slide_xml))
+                data += slide_xml
+        name = f"chunk-{len(self._chunks) + 1:05d}.bin"
+        self._write(name, zlib.compress(bytes(data), 1))
+        self._chunks.append(name)
+        state = {'version': CHECKPOINT_VERSION, 'fingerprint': self.fingerprint, 'chunks': self._chunks}
+        self._write(CHECKPOINT_STATE, json.dumps(state).encode('utf-8'))
+        self._pending = []
+        self._last_save = time.monotonic()
+
+
+# Setlist extraction: slides copied out of an already generated deck
+_SLIDE_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.presentationml.slide+xml'
+_PRESENTATIONML = '{http://schemas.openxmlformats.org/presentationml/2006/main}'
+_DRAWINGML = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+_OFFICE_RELATIONSHIPS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_XML_DECLARATION = "<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n"
+_XML_ATTRIBUTE = re.compile(r'([\w:]+)="([^"]*)"')
+_RELATIONSHIP = re.compile(r'<Relationship\b[^>]*>')
+_SLIDE_ID = re.compile(r'<p:sldId\b[^>]*?(?:/>|>.*?</p:sldId>)', re.S)
+_SECTION_LIST = re.compile(r'<p:ext uri="\{521415D9-36F7-43E2-AB2F-B90AF26B5E84\}">.*?</p:ext>', re.S)
+_TOC_LABEL_NUMBER = re.compile(r'\s*\d+\.\s')
+_SLIDE_COUNTER = re.compile(r'(\d+)/(\d+)')
+
+
+def _xml_attributes(element):
+    return {name: xml_unescape(value, {'&quot;': '"'}) if '&' in value else value
+            for name, value in _XML_ATTRIBUTE.findall(element)}
+
+
+def _rels_name(partname):
+    """Zip member holding the relationships of partname ('' for the package itself)."""
+    directory, filename = posixpath.split(partname)
+    return posixpath.join(directory, '_rels', filename + '.rels')
+
+
+def _parse_rels(xml, partname):
+    """rId -> (type, target, external) from a .rels part; internal targets become zip member names."""
+    rels = {}
+    for match in _RELATIONSHIP.finditer(xml):
+        attributes = _xml_attributes(match.group())
+        target = attributes.get('Target', '')
+        external = attributes.get('TargetMode') == 'External'
+        if not external:
+            if target.startswith('/'):
+                target = target[1:]
+            else:
+                target = posixpath.normpath(posixpath.join(posixpath.dirname(partname), target))
+        rels[attributes['Id']] = (attributes.get('Type'), target, external)
+    return rels
+
+
+def _slide_text_boxes(slide_xml):
+    """[(top, height, text, [(run text, link rId, tooltip)])] for the text shapes of a slide, in order."""
+    boxes = []
+    for sp in ET.fromstring(slide_xml).iter(f'{_PRESENTATIONML}sp'):
+        offset = sp.find(f'{_PRESENTATIONML}spPr/{_DRAWINGML}xfrm/{_DRAWINGML}off')
+        extent = sp.find(f'{_PRESENTATIONML}spPr/{_DRAWINGML}xfrm/{_DRAWINGML}ext')
+        if offset is None or extent is None:
+            continue
+        links = []
+        for run in sp.iter(f'{_DRAWINGML}r'):
+            link = run.find(f'{_DRAWINGML}rPr/{_DRAWINGML}hlinkClick')
+            if link is not None:
+                links.append((run.findtext(f'{_DRAWINGML}t', ''), link.get(f'{_OFFICE_RELATIONSHIPS}id'),
+                              link.get('tooltip')))
+        text = '\n'.join(''.join(t.text or '' for t in p.iter(f'{_DRAWINGML}t'))
+                         for p in sp.iter(f'{_DRAWINGML}p'))
+        boxes.append((int(offset.get('y')), int(extent.get('cy')), text, links))
+    return boxes
+
+
+def _locate_deck_songs(slide_names, read_text, read_rels):
+    """
+    Find the songs in a deck written by generate_presentation.
+
+    With a TOC, its links give each title's first slide and a song runs up
+    to the next linked slide; without one, songs are told apart by the
+    title and "k/n" counter on every slide. Returns (leading TOC and index
+    slide count, [(title, first slide)], {first slide: end slide},
+    (top_offset, bottom_limit) for a new TOC).
+    """
+    toc_count = 0
+    entries = []
+    geometry = None
+    for partname in slide_names:
+        rels = read_rels(partname)
+        if not any(external and target.startswith('#') for _, target, external in rels.values()):
+            break
+        toc_count += 1
+        boxes = _slide_text_boxes(read_text(partname))
+        for _, _, _, links in boxes:
+            for label, rId, tooltip in links:
+                number = _TOC_LABEL_NUMBER.match(label)
+                if number and rId in rels and rels[rId][1][1:].isdigit():
+                    # The tooltip holds the full title when the label was shortened
+                    entries.append((tooltip or label[number.end():], int(rels[rId][1][1:]) - 1))
+        if geometry is None and entries and len(boxes) > 1:
+            # Title and first column of a TOC page, placed clear of the template's decorations
+            geometry = (boxes[0][0] - Inches(0.6), boxes[1][0] + boxes[1][1])
+
+    starts = sorted({first for _, first in entries if toc_count <= first < len(slide_names)})
+    entries = [(title, first) for title, first in entries if toc_count <= first < len(slide_names)]
+    if not entries:
+        # No TOC: a song starts at slide 1/n or wherever the title changes
+        current = None
+        for index in range(toc_count, len(slide_names)):
+            boxes = _slide_text_boxes(read_text(slide_names[index]))
+            title = boxes[0][2] if boxes else ''
+            counter = _SLIDE_COUNTER.fullmatch(boxes[1][2].strip()) if len(boxes) > 1 else None
+            if current is None or title != current or counter is None or counter.group(1) == '1':
+                entries.append((title, index))
+                current = title
+            if geometry is None and len(boxes) > 2:
+                # Song title, counter and lyrics box (which ends at the template's bottom limit)
+                geometry = (boxes[0][0] - Inches(0.6), boxes[-1][0] + boxes[-1][1])
+        starts = [first for _, first in entries]
+
+    ends = dict(zip(starts, starts[1:] + [len(slide_names)]))
+    top_offset, bottom_limit = geometry or (0, None)
+    return toc_count, entries, ends, (max(0, top_offset), bottom_limit)
+
+
+def _text_box_xml(shape_id, left, top, width, height, paragraphs_xml):
+    """A text box <p:sp> as add_textbox() and the TOC code write it."""
+    return (
+        f'<p:sp><p:nvSpPr><p:cNvPr id="{shape_id}" name="TextBox {shape_id - 1}"/><p:cNvSpPr txBox="1"/>'
+        f'<p:nvPr/></p:nvSpPr><p:spPr><a:xfrm><a:off x="{left}" y="{top}"/><a:ext cx="{width}" cy="{height}"/>'
+        f'</a:xfrm><a:prstGeom prst="rect"><a:avLst/></a:prstGeom><a:noFill/></p:spPr>'
+        f'<p:txBody><a:bodyPr wrap="square" lIns="{TOC_TEXT_MARGIN}" rIns="{TOC_TEXT_MARGIN}" anchor="t">'
+        f'<a:spAutoFit/></a:bodyPr><a:lstStyle/>{paragraphs_xml}</p:txBody></p:sp>'
+    )
+
+
+def _toc_slide_parts(songs_with_slides, layout, page, title_text, slide_width, top_offset, layout_target):
+    """Slide XML and relationships XML for one TOC page, built without python-pptx."""
+    shapes = [_text_box_xml(
+        2, Inches(0.5), Inches(0.6) + top_offset, slide_width - Inches(1.0), Inches(1.0),
+        f'<a:p><a:pPr algn="l"><a:defRPr sz="3200" b="1"><a:solidFill><a:srgbClr val="000000"/></a:solidFill>'
+        f'<a:latin typeface="Calibri"/></a:defRPr></a:pPr><a:r><a:t>{xml_escape(title_text)}</a:t></a:r></a:p>'
+    )]
+    rels = [f'<Relationship Id="rId1" Type="{RT.SLIDE_LAYOUT}" Target="{xml_escape(layout_target)}"/>']
+    for column_index, column in enumerate(page):
+        entries = []
+        for i in column:
+            song_title, first_slide_index = songs_with_slides[i]
+            rId = f"rId{len(rels) + 1}"
+            rels.append(f'<Relationship Id="{rId}" Type="{RT.HYPERLINK}" Target="#{first_slide_index + 1}" '
+                        f'TargetMode="External"/>')
+            entries.append((layout['labels'][i], rId, song_title))
+        shapes.append(_text_box_xml(
+            len(shapes) + 2, layout['left'] + (layout['column_width'] + TOC_COLUMN_GAP) * column_index,
+            layout['top'], layout['column_width'], layout['height'],
+            _toc_paragraphs_xml(entries, layout['font_size'])
+        ))
+
+    slide_xml = (
+        f'{_XML_DECLARATION}<p:sld {nsdecls("a", "p", "r")}><p:cSld><p:spTree><p:nvGrpSpPr>'
+        f'<p:cNvPr id="1" name=""/><p:cNvGrpSpPr/><p:nvPr/></p:nvGrpSpPr><p:grpSpPr/>{"".join(shapes)}'
+        f'</p:spTree></p:cSld><p:clrMapOvr><a:masterClrMapping/></p:clrMapOvr></p:sld>'
+    )
+    rels_xml = (
+        f'{_XML_DECLARATION}<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        f'{"".join(rels)}</Relationships>'
+    )
+    return slide_xml.encode('utf-8'), rels_xml.encode('utf-8')
+
+
+def _stored_zip_member(stream, info):
+    """A zip member's data exactly as stored (still compressed), read past its local header."""
+    stream.seek(info.header_offset)
+    name_length, extra_length = struct.unpack('<HH', stream.read(30)[26:30])
+    stream.seek(info.header_offset + 30 + name_length + extra_length)
+    return stream.read(info.compress_size)
+
+
+def extract_setlist(master_deck_path, song_titles, output_path, generate_toc=False, compression='balanced'):
+    """
+    Build a setlist deck from a deck generate_presentation already rendered.
+
+    The chosen songs are located in the master deck (see
+    _locate_deck_songs) and matched by title, exactly first, then
+    normalized. Their slides and every part they use are copied member by
+    member, still compressed, so nothing is re-rendered; only the slide
+    list, relationships, content types and the new TOC (when generate_toc
+    is set) are written fresh, the TOC compressed per the compression
+    profile. A song chosen twice gets a copy of its slides.
+
+    output_path can be a path or a writable binary stream, like prs.save().
+
+    Returns:
+        tuple: (success: bool, message: str, slide_count: int)
+    """
+    try:
+        if compression not in COMPRESSION_PROFILES:
+            raise ValueError(f"Unknown compression profile '{compression}' "
+                             f"(choose from {', '.join(COMPRESSION_PROFILES)})")
+        level = COMPRESSION_PROFILES[compression][0]
+
+        with open(master_deck_path, 'rb') as stream, zipfile.ZipFile(stream) as package:
+            members = {info.filename: info for info in package.infolist()}
+            texts = {}
+            new_parts = {}  # member name -> bytes written fresh
+
+            def read_text(name):
+                if name in new_parts:
+                    return new_parts[name].decode('utf-8')
+                if name not in texts:
+                    texts[name] = package.read(name).decode('utf-8')
+                return texts[name]
+
+            def read_rels(partname):
+                name = _rels_name(partname)
+                if name not in members and name not in new_parts:
+                    return {}
+                return _parse_rels(read_text(name), partname)
+
+            presentation_name = next(target for rel_type, target, _ in read_rels('').values()
+                                     if rel_type == RT.OFFICE_DOCUMENT)
+            presentation_xml = read_text(presentation_name)
+            presentation_rels = read_rels(presentation_name)
+            slides = []  # (sldId element, rId, member name) in deck order
+            for element in _SLIDE_ID.findall(presentation_xml):
+                rId = _xml_attributes(element.split('>', 1)[0])['r:id']
+                slides.append((element, rId, presentation_rels[rId][1]))
+            slide_names = [name for _, _, name in slides]
+
+            toc_count, entries, ends, (top_offset, bottom_limit) = _locate_deck_songs(
+                slide_names, read_text, read_rels)
+            by_title = {}
+            by_normalized_title = {}
+            for entry in entries:
+                by_title.setdefault(entry[0], entry)
+                by_normalized_title.setdefault(normalize_song_text(entry[0]), entry)
+            chosen = []
+            missing = []
+            for title in song_titles:
+                entry = by_title.get(title.strip()) or by_normalized_title.get(normalize_song_text(title))
+                if entry is None:
+                    missing.append(title)
+                else:
+                    chosen.append(entry)
+            if missing:
+                return False, f"Songs not found: {', '.join(missing)}", 0
+            if not chosen:
+                return False, "No songs selected", 0
+
+            slide_folder = posixpath.dirname(slide_names[0])
+            next_number = 1
+
+            def new_slide_name():
+                nonlocal next_number
+                while f"{slide_folder}/slide{next_number}.xml" in members:
+                    next_number += 1
+                next_number += 1
+                return f"{slide_folder}/slide{next_number - 1}.xml"
+
+            # TOC first: its size fixes where every song lands
+            toc_layout = None
+            toc_slides_count = 0
+            size = re.search(r'<p:sldSz\b[^>]*>', presentation_xml)
+            size = _xml_attributes(size.group()) if size else {}
+            slide_width = int(size.get('cx', DEFAULT_SLIDE_WIDTH))
+            slide_height = int(size.get('cy', DEFAULT_SLIDE_HEIGHT))
+            if generate_toc:
+                toc_layout = plan_toc_layout([title for title, _ in chosen], slide_width, slide_height,
+                                             top_offset=top_offset, bottom_limit=bottom_limit)
+                toc_slides_count = toc_layout['slide_count']
+
+            deck = []  # (sldId element or None for new slides, member name)
+            used = set()
+            songs_with_slide_positions = []
+            for title, first in chosen:
+                songs_with_slide_positions.append((title, toc_slides_count + len(deck)))
+                for element, _, name in slides[first:ends[first]]:
+                    if name not in used:
+                        used.add(name)
+                        deck.append((element, name))
+                        continue
+                    # Repeated song: copy the slide, without a second claim on its notes page
+                    copy_name = new_slide_name()
+                    new_parts[copy_name] = package.read(name)
+                    rels_name = _rels_name(name)
+                    if rels_name in members:
+                        new_parts[_rels_name(copy_name)] = _RELATIONSHIP.sub(
+                            lambda match: '' if '/notesSlide"' in match.group() else match.group(),
+                            read_text(rels_name)).encode('utf-8')
+                    deck.append((None, copy_name))
+
+            if generate_toc:
+                layout_target = next(target for rel_type, target, _ in read_rels(deck[0][1]).values()
+                                     if rel_type == RT.SLIDE_LAYOUT)
+                layout_target = posixpath.relpath(layout_target, slide_folder)
+                total_toc_pages = len(toc_layout['pages'])
+                toc_slides = []
+                for toc_page, page in enumerate(toc_layout['pages']):
+                    title_text = "Table of Contents"
+                    if total_toc_pages > 1:
+                        title_text += f" ({toc_page + 1}/{total_toc_pages})"
+                    name = new_slide_name()
+                    new_parts[name], new_parts[_rels_name(name)] = _toc_slide_parts(
+                        songs_with_slide_positions, toc_layout, page, title_text, slide_width, top_offset,
+                        layout_target)
+                    toc_slides.append((None, name))
+                deck = toc_slides + deck
+
+            # New slide list and presentation relationships, keeping ids of copied slides
+            next_slide_id = 1 + max([int(_xml_attributes(element.split('>', 1)[0])['id'])
+                                     for element, _, _ in slides] or [255])
+            next_rId = 1 + max(int(rId[3:]) for rId in presentation_rels if rId[3:].isdigit())
+            kept_rIds = {rId for element, rId, name in slides if name in used}
+            slide_id_list = []
+            new_rels = []
+            for element, name in deck:
+                if element is None:
+                    element = f'<p:sldId id="{next_slide_id}" r:id="rId{next_rId}"/>'
+                    new_rels.append(f'<Relationship Id="rId{next_rId}" Type="{RT.SLIDE}" '
+                                    f'Target="{posixpath.relpath(name, posixpath.dirname(presentation_name))}"/>')
+                    next_slide_id += 1
+                    next_rId += 1
+                slide_id_list.append(element)
+            presentation_xml = re.sub(r'<p:sldIdLst>.*?</p:sldIdLst>',
+                                      lambda match: f'<p:sldIdLst>{"".join(slide_id_list)}</p:sldIdLst>',
+                                      presentation_xml, count=1, flags=re.S)
+            new_parts[presentation_name] = _SECTION_LIST.sub('', presentation_xml).encode('utf-8')
+            dropped_rIds = {rId for _, rId, _ in slides} - kept_rIds
+            presentation_rels_xml = _RELATIONSHIP.sub(
+                lambda match: '' if _xml_attributes(match.group())['Id'] in dropped_rIds else match.group(),
+                read_text(_rels_name(presentation_name)))
+            new_parts[_rels_name(presentation_name)] = presentation_rels_xml.replace(
+                '</Relationships>', ''.join(new_rels) + '</Relationships>').encode('utf-8')
+
+            # Keep only the parts still reachable from the package relationships
+            keep = {'[Content_Types].xml', _rels_name('')}
+            pending = ['']
+            while pending:
+                for _, target, external in read_rels(pending.pop()).values():
+                    if not external and target not in keep and (target in members or target in new_parts):
+                        keep.add(target)
+                        pending.append(target)
+                        if _rels_name(target) in members or _rels_name(target) in new_parts:
+                            keep.add(_rels_name(target))
+
+            content_types = re.sub(
+                r'<Override\b[^>]*>',
+                lambda match: match.group() if _xml_attributes(match.group())['PartName'][1:] in keep else '',
+                read_text('[Content_Types].xml'))
+            new_overrides = ''.join(f'<Override PartName="/{name}" ContentType="{_SLIDE_CONTENT_TYPE}"/>'
+                                    for element, name in deck if name not in members)
+            new_parts['[Content_Types].xml'] = content_types.replace(
+                '</Types>', new_overrides + '</Types>').encode('utf-8')
+
+            # Copied members go out as stored; fresh ones are compressed here
+            names = [name for name in members if name in keep]
+            names += [name for name in new_parts if name in keep and name not in members]
+            total_size = sum(len(new_parts[name]) if name in new_parts else members[name].file_size
+                             for name in names)
+            if len(names) >= 0xFFFF or total_size >= 0xFFFFFFFF:
+                # Needs ZIP64; let zipfile handle it
+                with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=level) as zipf:
+                    for name in names:
+                        zipf.writestr(name, new_parts[name] if name in new_parts else package.read(name))
+            else:
+                zip_entries = []
+                for name in names:
+                    info = members.get(name)
+                    if name in new_parts or info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED) \
+                            or info.flag_bits & 0x1:
+                        blob = new_parts[name] if name in new_parts else package.read(name)
+                        zip_entries.append((name, zlib.crc32(blob) & 0xFFFFFFFF, len(blob), 8,
+                                            _deflate(blob, level)))
+                    else:
+                        zip_entries.append((name, info.CRC, info.file_size, info.compress_type,
+                                            _stored_zip_member(stream, info)))
+                if hasattr(output_path, 'write'):
+                    _write_zip(output_path, zip_entries)
+                else:
+                    with open(output_path, 'wb') as output:
+                        _write_zip(output, zip_entries)
+
+        message = f"Extracted {len(deck) - toc_slides_count} slides for {len(chosen)} songs"
+        if toc_slides_count:
+            message += f" + {toc_slides_count} TOC slides"
+        return True, message, len(deck)
+
+    except FileNotFoundError as e:
+        return False, f"File not found: {str(e)}", 0
+    except (zipfile.BadZipFile, KeyError, StopIteration, ET.ParseError):
+        return False, f"Not a presentation written by this generator: {master_deck_path}", 0
+    except Exception as e:
+        return False, f"Error extracting setlist: {str(e)}", 0
+
+
+def generate_presentation(song_file_path, output_path, template_file_path=None, generate_toc=False,
+                          alphabetical_index=False, should_cancel=None, compression='balanced',
+                          template_cache_folder=None, collapse_duplicates=False, song_titles=None,
+                          profiler=None, checkpoint_folder=None, checkpoint_on_write=None):
     """
     Generate PowerPoint presentation from song file.
     
@@ -286,96 +1047,137 @@ def generate_presentation(song_file_path, output_path, template_file_path=None,
         output_path: Path where to save the generated PowerPoint
         template_file_path: Optional path to PowerPoint template
         generate_toc: Whether to generate table of contents
+        alphabetical_index: Sort the TOC by title and add an A-Z index slide
+        should_cancel: Optional callable checked between songs; when it
+            returns True generation stops and nothing is saved
+        compression: Output compression profile ('fast', 'balanced' or 'smallest')
+        template_cache_folder: Optional folder caching template analysis by
+            template hash, shared between jobs
+        collapse_duplicates: Render duplicate and near-duplicate songs once;
+            their TOC entries link to the song that is kept
+        song_titles: Optional list of titles to build the deck from, in
+            order; only those songs are read from the song file
+        profiler: Optional started StageProfiler; generation marks its
+            parse, template, render, toc and save stages on it
+        checkpoint_folder: Optional folder where rendered songs are
+            checkpointed (see GenerationCheckpoint); a checkpoint left there
+            by an interrupted run with the same inputs is resumed
+        checkpoint_on_write: Optional callable given the path of every
+            checkpoint file written
     
     Returns:
         tuple: (success: bool, message: str, slide_count: int)
     """
     try:
         # Parse songs
-        songs = parse_songs(song_file_path)
+        profile_stage(profiler, 'parse')
+        if song_titles:
+            # Setlist from a large archive: only the chosen songs are decoded
+            with open_song_archive(song_file_path) as archive:
+                songs, missing = archive.get_songs(song_titles)
+            if missing:
+                return False, f"Songs not found: {', '.join(missing)}", 0
+        else:
+            songs = parse_songs(song_file_path)
         if not songs:
             return False, "No songs found in the file. Make sure song titles start with #", 0
         
+        # Render each duplicate group once; toc_entries map TOC titles to rendered songs
+        duplicate_count = 0
+        toc_entries = [(song['title'], index) for index, song in enumerate(songs)]
+        if collapse_duplicates:
+            song_count = len(songs)
+            songs, toc_entries = collapse_duplicate_songs(songs, find_duplicate_songs(songs))
+            duplicate_count = song_count - len(songs)
+        
         # Create presentation
+        profile_stage(profiler, 'template')
         if template_file_path and os.path.exists(template_file_path):
             prs = Presentation(template_file_path)
         else:
+            template_file_path = None
             prs = Presentation()
+        template = load_template_info(prs, template_file_path, template_cache_folder)
         
         total_slides = 0
         songs_with_slide_positions = []  # Track song titles and their first slide positions
         
         # If TOC is requested, we need to calculate TOC slides first to adjust positions
+        toc_layout = None
         toc_slides_count = 0
         if generate_toc:
-            # First pass: collect song titles
-            temp_songs = []
-            for song in songs:
-                temp_songs.append(song['title'])
-            # Calculate how many TOC slides we'll need
-            toc_slides_count = math.ceil(len(temp_songs) / 20)  # 20 songs per TOC slide (2 columns x 10 rows)
+            # Pack the TOC up front so song positions account for its slides
+            toc_layout = plan_toc_layout([title for title, _ in toc_entries], prs.slide_width, prs.slide_height,
+                                         alphabetical_index, top_offset=template['top_offset'],
+                                         bottom_limit=template['bottom_limit'])
+            toc_slides_count = toc_layout['slide_count']
         
+        # Song positions are known before rendering, so the TOC goes in first
         for song in songs:
-            title = song['title']
-            lyrics = song['lyrics']
-            
-            # Split lyrics into slides
-            lyric_slides = split_lyrics_into_slides(lyrics)
-            
-            # Record the first slide position for this song (adjust for TOC at beginning)
-            first_slide_position = total_slides + toc_slides_count
-            songs_with_slide_positions.append((title, first_slide_position))
-            
-            # Create slides for this song with numbering
-            total_song_slides = len(lyric_slides)
-            for slide_index, slide_content in enumerate(lyric_slides):
-                create_slide(prs, title, slide_content, slide_index + 1, total_song_slides)
-                total_slides += 1
+            songs_with_slide_positions.append((song['title'], total_slides + toc_slides_count))
+            total_slides += len(song_slides(song))
+        
+        # Duplicate titles link to the first slide of the song that was kept
+        toc_with_slide_positions = [(title, songs_with_slide_positions[index][1]) for title, index in toc_entries]
         
         # Generate Table of Contents if requested - create at beginning
         if generate_toc and songs_with_slide_positions:
-            # Create new presentation with TOC first
-            if template_file_path and os.path.exists(template_file_path):
-                final_prs = Presentation(template_file_path)
-            else:
-                final_prs = Presentation()
-            
+            profile_stage(profiler, 'toc')
             # Remove default slides
-            slide_count = len(final_prs.slides)
+            slide_count = len(prs.slides)
             for i in range(slide_count):
-                rId = final_prs.slides._sldIdLst[0].rId
-                final_prs.part.drop_rel(rId)
-                del final_prs.slides._sldIdLst[0]
+                rId = prs.slides._sldIdLst[0].rId
+                prs.part.drop_rel(rId)
+                del prs.slides._sldIdLst[0]
             
-            # Create TOC slides first
-            create_toc_slides(final_prs, songs_with_slide_positions)
+            create_toc_slides(prs, toc_with_slide_positions, toc_layout)
+            total_slides += toc_slides_count
+        
+        # Songs saved by an interrupted run of the same job are restored, not rendered
+        progress = None
+        if checkpoint_folder:
+            fingerprint = checkpoint_fingerprint(
+                song_file_path, template_file_path, generate_toc=generate_toc,
+                alphabetical_index=alphabetical_index, collapse_duplicates=collapse_duplicates,
+                song_titles=song_titles)
+            progress = GenerationCheckpoint(checkpoint_folder, fingerprint, on_write=checkpoint_on_write)
+        
+        profile_stage(profiler, 'render')
+        for song_index, song in enumerate(songs):
+            _checkpoint(should_cancel)
+            if progress is not None and song_index < progress.resumed_count:
+                for slide_xml in progress.songs[song_index]:
+                    restore_slide(prs, slide_xml)
+                continue
             
-            # Add song slides after TOC - recreate them with slide numbering
-            for song in songs:
-                title = song['title']
-                lyrics = song['lyrics']
-                
-                # Split lyrics into slides
-                lyric_slides = split_lyrics_into_slides(lyrics)
-                total_song_slides = len(lyric_slides)
-                
-                # Create slides for this song with numbering
-                for slide_index, slide_content in enumerate(lyric_slides):
-                    create_slide(final_prs, title, slide_content, slide_index + 1, total_song_slides)
+            # Split lyrics into slides (pre-split in a compiled corpus)
+            lyric_slides = song_slides(song)
             
-            prs = final_prs
-            total_slides += toc_slides_count
+            # Create slides for this song with numbering
+            total_song_slides = len(lyric_slides)
+            slides = [create_slide(prs, song['title'], slide_content, slide_index + 1, total_song_slides)
+                      for slide_index, slide_content in enumerate(lyric_slides)]
+            if progress is not None:
+                progress.add_song(slides)
+        if progress is not None:
+            progress.save()
         
         # Save presentation
-        prs.save(output_path)
+        _checkpoint(should_cancel)
+        profile_stage(profiler, 'save')
+        save_presentation(prs, output_path, compression)
         
         # Return success
         success_message = f"Generated {total_slides} slides from {len(songs)} songs"
         if generate_toc and toc_slides_count > 0:
             success_message += f" + {toc_slides_count} TOC slides"
+        if duplicate_count:
+            success_message += f" ({duplicate_count} duplicate songs collapsed)"
         
         return True, success_message, total_slides
         
+    except GenerationCancelled:
+        return False, "Generation cancelled", 0
     except FileNotFoundError as e:
         return False, f"File not found: {str(e)}", 0
     except Exception as e:
@@ -386,15 +1188,47 @@ if __name__ == "__main__":
     # Test the generator
     import sys
     if len(sys.argv) < 3:
-        print("Usage: python generator.py <song_file> <output_file> [template_file] [--toc]")
+        print("Usage: python generator.py <song_file> <output_file> [template_file] [--toc] [--toc-index] [--dedupe] [--compression=fast|balanced|smallest] [--select=TITLE ...] [--profile[=BASE]]")
+        print("       python generator.py <master_deck.pptx> <output_file> --select=TITLE ... [--toc] [--compression=...]")
         sys.exit(1)
     
     song_file = sys.argv[1]
     output_file = sys.argv[2]
     template_file = sys.argv[3] if len(sys.argv) > 3 and not sys.argv[3].startswith('--') else None
-    generate_toc = '--toc' in sys.argv
+    alphabetical_index = '--toc-index' in sys.argv
+    generate_toc = '--toc' in sys.argv or alphabetical_index
+    compression = 'balanced'
+    song_titles = []
+    for arg in sys.argv:
+        if arg.startswith('--compression='):
+            compression = arg.split('=', 1)[1]
+        elif arg.startswith('--select='):
+            song_titles.append(arg.split('=', 1)[1])
+    
+    if song_file.lower().endswith('.pptx'):
+        # Setlist from a rendered master deck: slides are copied, not re-rendered
+        success, message, slide_count = extract_setlist(song_file, song_titles, output_file, generate_toc,
+                                                        compression)
+        print(f"✅ {message}" if success else f"❌ {message}")
+        sys.exit(0 if success else 1)
+    
+    profiler = None
+    profile_base = None
+    for arg in sys.argv:
+        if arg == '--profile' or arg.startswith('--profile='):
+            profile_base = arg.split('=', 1)[1] if '=' in arg else os.path.splitext(output_file)[0] + '.profile'
+            profiler = StageProfiler().start()
+    
+    success, message, slide_count = generate_presentation(song_file, output_file, template_file, generate_toc,
+                                                          alphabetical_index, compression=compression,
+                                                          collapse_duplicates='--dedupe' in sys.argv,
+                                                          song_titles=song_titles, profiler=profiler)
     
-    success, message, slide_count = generate_presentation(song_file, output_file, template_file, generate_toc)
+    if profiler is not None:
+        profiler.stop()
+        print(profiler.format_summary())
+        for path in profiler.write(profile_base):
+            print(f"📊 Profile written to {path}")
     
     if success:
         print(f"✅ {message}")
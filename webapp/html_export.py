@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+HTML/JSON Slide Export - Web Version
+Builds a compact JSON slide manifest and a static HTML viewer from the same
+parse_songs -> split_lyrics_into_slides pipeline used for PowerPoint, for
+sites that project from a browser instead of PowerPoint.
+"""
+
+import json
+import os
+
+from songs import parse_songs, song_slides, find_duplicate_songs, collapse_duplicate_songs
+
+MANIFEST_FORMAT = 'slides-kebaktian/1'
+
+
+def build_slide_manifest(songs, generate_toc=False):
+    """
+    Build the slide manifest for a list of parsed songs.
+
+    Song slides are stored once in a flat list; each song records the index
+    of its first slide and its slide count, so the viewer can number slides
+    (1/4, 2/4, ...) and build TOC links without repeating titles.
+    """
+    manifest_songs = []
+    slides = []
+
+    for song in songs:
+        lyric_slides = song_slides(song)
+        manifest_songs.append({
+            'title': song['title'],
+            'first_slide': len(slides),
+            'slide_count': len(lyric_slides)
+        })
+        slides.extend(lyric_slides)
+
+    return {
+        'format': MANIFEST_FORMAT,
+        'toc': bool(generate_toc),
+        'songs': manifest_songs,
+        'slides': slides
+    }
+
+
+def manifest_to_json(manifest):
+    """Serialize a manifest as compact JSON."""
+    return json.dumps(manifest, ensure_ascii=False, separators=(',', ':'))
+
+
+def render_viewer_html(manifest, page_title='Songs'):
+    """Return a self-contained HTML viewer with the manifest embedded."""
+    # Keep the JSON from closing the <script> element early
+    manifest_json = manifest_to_json(manifest).replace('</', '<\\/')
+    safe_title = (page_title.replace('&', '&amp;').replace('<', '&lt;')
+                  .replace('>', '&gt;'))
+    return (VIEWER_TEMPLATE
+            .replace('{{PAGE_TITLE}}', safe_title)
+            .replace('{{MANIFEST_JSON}}', manifest_json))
+
+
+def generate_html_bundle(song_file_path, output_path, generate_toc=False, collapse_duplicates=False):
+    """
+    Generate an HTML slide viewer and JSON manifest from a song file.
+
+    Args:
+        song_file_path: Path to the song text file
+        output_path: Path of the .html viewer; the manifest is written next
+            to it with a .json extension
+        generate_toc: Whether the viewer should start with a table of contents
+        collapse_duplicates: Keep only the first song of each duplicate group
+
+    Returns:
+        tuple: (success: bool, message: str, slide_count: int)
+    """
+    try:
+        songs = parse_songs(song_file_path)
+        if not songs:
+            return False, "No songs found in the file. Make sure song titles start with #", 0
+
+        duplicate_count = 0
+        if collapse_duplicates:
+            song_count = len(songs)
+            songs, _ = collapse_duplicate_songs(songs, find_duplicate_songs(songs))
+            duplicate_count = song_count - len(songs)
+
+        manifest = build_slide_manifest(songs, generate_toc)
+        page_title = os.path.splitext(os.path.basename(output_path))[0]
+
+        with open(output_path, 'w', encoding='utf-8') as file:
+            file.write(render_viewer_html(manifest, page_title))
+
+        manifest_path = os.path.splitext(output_path)[0] + '.json'
+        with open(manifest_path, 'w', encoding='utf-8') as file:
+            file.write(manifest_to_json(manifest))
+
+        slide_count = len(manifest['slides'])
+        message = f"Generated {slide_count} slides from {len(songs)} songs"
+        if duplicate_count:
+            message += f" ({duplicate_count} duplicate songs collapsed)"
+        return True, message, slide_count
+
+    except FileNotFoundError as e:
+        return False, f"File not found: {str(e)}", 0
+    except Exception as e:
+        return False, f"Error generating HTML slides: {str(e)}", 0
+
+
+VIEWER_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="UTF-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<title>{{PAGE_TITLE}}</title>
+<style>
+    html, body { margin: 0; height: 100%; background: #fff; color: #000;
+                 font-family: Calibri, Carlito, 'Segoe UI', Arial, sans-serif; overflow: hidden; }
+    #slide { position: absolute; inset: 0; padding: 5vh 4vw; box-sizing: border-box; }
+    #title { font-size: 5.5vh; font-weight: bold; margin: 0 8vw 3vh 0; }
+    #counter { position: absolute; top: 5vh; right: 4vw; font-size: 4.2vh; font-weight: bold; color: #8b4513; }
+    #lines p { font-size: 4.8vh; margin: 0 0 2.2vh 0; }
+    #toc { column-count: 2; column-gap: 4vw; }
+    #toc a { display: block; font-size: 3.4vh; margin-bottom: 1vh; color: #00008b; text-decoration: none; }
+    #toc a:hover { text-decoration: underline; }
+    #help { position: absolute; bottom: 1.5vh; right: 2vw; font-size: 1.6vh; color: #999; }
+</style>
+</head>
+<body>
+<div id="slide">
+    <div id="title"></div>
+    <div id="counter"></div>
+    <div id="lines"></div>
+    <div id="toc"></div>
+</div>
+<div id="help">&larr;/&rarr; navigate &middot; T contents &middot; F fullscreen</div>
+<script type="application/json" id="manifest">{{MANIFEST_JSON}}</script>
+<script>
+(function () {
+    var manifest = JSON.parse(document.getElementById('manifest').textContent);
+    var songs = manifest.songs, slides = manifest.slides;
+    var perTocPage = 20;
+    var tocPages = manifest.toc && songs.length ? Math.ceil(songs.length / perTocPage) : 0;
+    var total = tocPages + slides.length;
+    var songOfSlide = new Array(slides.length);
+    songs.forEach(function (song, i) {
+        for (var k = 0; k < song.slide_count; k++) { songOfSlide[song.first_slide + k] = i; }
+    });
+    var current = 0;
+
+    var titleEl = document.getElementById('title');
+    var counterEl = document.getElementById('counter');
+    var linesEl = document.getElementById('lines');
+    var tocEl = document.getElementById('toc');
+
+    function text(tag, value) {
+        var el = document.createElement(tag);
+        el.textContent = value;
+        return el;
+    }
+
+    function render() {
+        linesEl.innerHTML = '';
+        tocEl.innerHTML = '';
+        counterEl.textContent = '';
+        if (current < tocPages) {
+            titleEl.textContent = 'Table of Contents' + (tocPages > 1 ? ' (' + (current + 1) + '/' + tocPages + ')' : '');
+            var start = current * perTocPage;
+            songs.slice(start, start + perTocPage).forEach(function (song, i) {
+                var link = text('a', (start + i + 1) + '. ' + song.title);
+                link.href = '#' + (tocPages + song.first_slide + 1);
+                tocEl.appendChild(link);
+            });
+        } else if (slides.length) {
+            var index = current - tocPages;
+            var song = songs[songOfSlide[index]];
+            titleEl.textContent = song.title;
+            counterEl.textContent = (index - song.first_slide + 1) + '/' + song.slide_count;
+            slides[index].forEach(function (line) { linesEl.appendChild(text('p', line)); });
+        }
+        if (location.hash !== '#' + (current + 1)) {
+            history.replaceState(null, '', '#' + (current + 1));
+        }
+    }
+
+    function go(index) {
+        current = Math.max(0, Math.min(total - 1, index));
+        render();
+    }
+
+    function fromHash() {
+        var n = parseInt(location.hash.slice(1), 10);
+        go(isNaN(n) ? 0 : n - 1);
+    }
+
+    document.addEventListener('keydown', function (e) {
+        switch (e.key) {
+            case 'ArrowRight': case 'ArrowDown': case 'PageDown': case ' ': case 'Enter':
+                go(current + 1); break;
+            case 'ArrowLeft': case 'ArrowUp': case 'PageUp': case 'Backspace':
+                go(current - 1); break;
+            case 'Home': go(0); break;
+            case 'End': go(total - 1); break;
+            case 't': case 'T': go(0); break;
+            case 'f': case 'F':
+                if (document.fullscreenElement) { document.exitFullscreen(); }
+                else { document.documentElement.requestFullscreen(); }
+                break;
+            default: return;
+        }
+        e.preventDefault();
+    });
+    window.addEventListener('hashchange', fromHash);
+    fromHash();
+})();
+</script>
+</body>
+</html>
+"""
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) < 3:
+        print("Usage: python html_export.py <song_file> <output_file.html> [--toc]")
+        sys.exit(1)
+
+    song_file = sys.argv[1]
+    output_file = sys.argv[2]
+    generate_toc = '--toc' in sys.argv
+
+    success, message, slide_count = generate_html_bundle(song_file, output_file, generate_toc)
+
+    if success:
+        print(f"✅ {message}")
+    else:
+        print(f"❌ {message}")
+        sys.exit(1)
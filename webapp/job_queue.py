@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Job Queue for the Web App
+Per-client rate limiting and fair scheduling of generation jobs, so one
+client submitting many uploads cannot starve everyone else.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+
+class TokenBucket:
+    """Classic token bucket: `capacity` burst, refilled at `rate` tokens per second."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def consume(self, tokens=1):
+        """Take tokens if available. Returns True if the request is allowed."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def is_full(self):
+        now = time.monotonic()
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class RateLimiter:
+    """One token bucket per client (IP address or session)."""
+
+    def __init__(self, per_minute, burst):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def allow(self, client_id):
+        with self._lock:
+            bucket = self._buckets.get(client_id)
+            if bucket is None:
+                bucket = self._buckets[client_id] = TokenBucket(self.rate, self.burst)
+            allowed = bucket.consume()
+            # Buckets that have refilled are indistinguishable from new ones
+            if len(self._buckets) > 1000:
+                for key in [k for k, b in self._buckets.items() if b.is_full()]:
+                    del self._buckets[key]
+            return allowed
+
+
+class FairScheduler:
+    """
+    Run jobs on a fixed pool of worker threads, sharing them fairly between clients.
+
+    Uses self-clocked fair queuing: every job gets a finish tag of
+    max(virtual time, client's previous finish tag) + cost, and the job with
+    the lowest tag runs next. Clients are interleaved, a client with many
+    queued jobs only competes with its own backlog, and small jobs overtake
+    large ones submitted at the same time.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._queue = []  # heap of (finish_tag, sequence, job_id, start_tag)
+        self._jobs = {}  # job_id -> (client_id, func, args)
+        self._client_finish = {}
+        self._pending = {}  # client_id -> number of queued jobs
+        self._virtual_time = 0
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._threads = []
+
+    def _start_workers(self):
+        # Started lazily so gunicorn forks before any threads exist
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, client_id, job_id, cost, func, *args):
+        """Queue func(*args) for client_id."""
+        with self._condition:
+            start = max(self._virtual_time, self._client_finish.get(client_id, 0))
+            finish = start + cost
+            self._client_finish[client_id] = finish
+            if len(self._client_finish) > 1000:
+                for key in [k for k, f in self._client_finish.items()
+                            if f <= self._virtual_time and k not in self._pending]:
+                    del self._client_finish[key]
+            self._jobs[job_id] = (client_id, func, args)
+            self._pending[client_id] = self._pending.get(client_id, 0) + 1
+            heapq.heappush(self._queue, (finish, next(self._sequence), job_id, start))
+            self._start_workers()
+            self._condition.notify()
+
+    def cancel(self, job_id):
+        """Remove a job that has not started yet. Returns True if it was still queued."""
+        with self._condition:
+            job = self._jobs.pop(job_id, None)
+            if job is None:
+                return False
+            client_id = job[0]
+            self._pending[client_id] -= 1
+            if not self._pending[client_id]:
+                del self._pending[client_id]
+            # The heap entry is skipped when it reaches the front
+            return True
+
+    def pending_jobs(self, client_id):
+        """Number of jobs client_id has waiting (not yet running)."""
+        with self._condition:
+            return self._pending.get(client_id, 0)
+
+    def queue_position(self, job_id):
+        """1-based position of a waiting job, or None if it is not queued."""
+        with self._condition:
+            if job_id not in self._jobs:
+                return None
+            ahead = sorted(entry for entry in self._queue if entry[2] in self._jobs)
+            for position, (_, _, queued_id, _) in enumerate(ahead, start=1):
+                if queued_id == job_id:
+                    return position
+            return None
+
+    def _next_job(self):
+        with self._condition:
+            while True:
+                while not self._queue:
+                    self._condition.wait()
+                _, _, job_id, start = heapq.heappop(self._queue)
+                if job_id in self._jobs:  # not cancelled
+                    break
+            self._virtual_time = max(self._virtual_time, start)
+            client_id, func, args = self._jobs.pop(job_id)
+            self._pending[client_id] -= 1
+            if not self._pending[client_id]:
+                del self._pending[client_id]
+                if self._client_finish.get(client_id, 0) <= self._virtual_time:
+                    del self._client_finish[client_id]
+            return func, args
+
+    def _work(self):
+        while True:
+            func, args = self._next_job()
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"Job failed: {e}")
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Load test for the web app.
+
+Starts app.py under gunicorn on localhost (or targets --url), then runs
+upload -> status polling -> download flows with synthetic song files and
+templates at increasing concurrency. Reports throughput, p50/p95/p99
+latency per endpoint and per-job generation time for every stage, and can
+save results as JSON to compare capacity changes run to run.
+"""
+
+import argparse
+import copy
+import json
+import math
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+WORDS = ("kasih", "tuhan", "yesus", "hidup", "damai", "sukacita", "anugerah", "terang", "jalan", "hati",
+         "grace", "love", "lord", "heart", "glory", "praise", "holy", "light", "Herr", "Gnade")
+SONG_SIZES = {'small': 10, 'medium': 60, 'large': 300}  # songs per synthetic file
+
+
+def make_song_file(path, song_count, seed):
+    """Write a synthetic song collection: 3-6 verses of 4 lines per song."""
+    rng = random.Random(seed)
+    songs = []
+    for number in range(song_count):
+        title = f"# Lagu {number + 1:04d} {rng.choice(WORDS).title()}"
+        verses = []
+        for _ in range(rng.randint(3, 6)):
+            verses.append('\n'.join(' '.join(rng.choice(WORDS) for _ in range(rng.randint(4, 8)))
+                                    for _ in range(4)))
+        songs.append(title + '\n' + '\n\n'.join(verses))
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('\n\n'.join(songs) + '\n')
+
+
+def make_template(path):
+    """Write a template with a red line under the title and a footer bar on its master."""
+    from pptx import Presentation
+    from pptx.dml.color import RGBColor
+    from pptx.enum.shapes import MSO_SHAPE
+    from pptx.util import Inches
+
+    prs = Presentation()
+    scratch = prs.slides.add_slide(prs.slide_layouts[6])
+    bands = (
+        (Inches(0.3), Inches(1.2), prs.slide_width - Inches(0.6), Inches(0.05), RGBColor(200, 0, 0)),
+        (0, prs.slide_height - Inches(0.5), prs.slide_width, Inches(0.5), RGBColor(60, 60, 60)),
+    )
+    for left, top, width, height, color in bands:
+        shape = scratch.shapes.add_shape(MSO_SHAPE.RECTANGLE, left, top, width, height)
+        shape.fill.solid()
+        shape.fill.fore_color.rgb = color
+        prs.slide_master.shapes._spTree.append(copy.deepcopy(shape._element))
+    # Masters have no add_shape; drop the scratch slide the bands were drawn on
+    prs.part.drop_rel(prs.slides._sldIdLst[0].rId)
+    del prs.slides._sldIdLst[0]
+    prs.save(path)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an unsorted list (None if empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+                     .encode('utf-8'))
+    for name, (filename, data, content_type) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: {content_type}\r\n\r\n'.encode('utf-8') + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode('utf-8'))
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # The app answers rejected uploads with a redirect; count those as failures
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+_opener = urllib.request.build_opener(_NoRedirect)
+
+
+class LoadStats:
+    """Latency samples per endpoint and generation times, shared by all virtual users."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.job_times = []
+        self.flows = 0
+        self.failed_flows = 0
+        self.failures = {}
+        self._lock = threading.Lock()
+
+    def request(self, endpoint, seconds, ok):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def flow(self, job_seconds=None, failure=None):
+        with self._lock:
+            if failure:
+                self.failed_flows += 1
+                self.failures[failure] = self.failures.get(failure, 0) + 1
+            else:
+                self.flows += 1
+                self.job_times.append(job_seconds)
+
+
+def _timed_request(stats, endpoint, url, data=None, headers=None):
+    """Send one request; returns (status, body) and records its latency."""
+    request = urllib.request.Request(url, data=data, headers=headers or {})
+    started = time.perf_counter()
+    try:
+        with _opener.open(request, timeout=600) as response:
+            status, body = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        status, body = e.code, e.read()
+    except OSError:
+        status, body = None, b''
+    stats.request(endpoint, time.perf_counter() - started, status is not None and status < 300)
+    return status, body
+
+
+def run_flow(base_url, client_ip, song_data, template_data, stats, options):
+    """One user: upload, poll status until the job finishes, download the result. Returns True on success."""
+    fields = {'output_filename': f"load_{uuid.uuid4().hex[:8]}.pptx", 'output_format': options.output_format}
+    if options.toc:
+        fields['generate_toc'] = 'on'
+    files = {'song_file': ('songs.txt', song_data, 'text/plain')}
+    if template_data is not None:
+        files['template_file'] = ('template.pptx', template_data,
+                                  'application/vnd.openxmlformats-officedocument.presentationml.presentation')
+    body, content_type = _multipart(fields, files)
+    headers = {'X-Load-Test-Client': client_ip}
+
+    status, page = _timed_request(stats, 'POST /upload', f"{base_url}/upload", body,
+                                  dict(headers, **{'Content-Type': content_type}))
+    match = re.search(rb'jobId = "([^"]+)"', page) if status == 200 else None
+    if not match:
+        stats.flow(failure=f"upload rejected ({status})")
+        return False
+    job_id = match.group(1).decode()
+    submitted = time.perf_counter()
+
+    while True:
+        status, payload = _timed_request(stats, 'GET /status', f"{base_url}/status/{job_id}", headers=headers)
+        if status != 200:
+            stats.flow(failure=f"status {status}")
+            return False
+        job = json.loads(payload)
+        if job['status'] == 'completed':
+            break
+        if job['status'] in ('error', 'cancelled'):
+            stats.flow(failure=f"job {job['status']}")
+            return False
+        time.sleep(options.poll_interval)
+    job_seconds = time.perf_counter() - submitted
+
+    status, _ = _timed_request(stats, 'GET /download', base_url + job['download_url'], headers=headers)
+    if status != 200:
+        stats.flow(failure=f"download {status}")
+        return False
+    stats.flow(job_seconds)
+    return True
+
+
+def run_stage(base_url, concurrency, song_files, template_data, options):
+    """Keep `concurrency` users looping over flows for options.duration seconds."""
+    stats = LoadStats()
+    deadline = time.perf_counter() + options.duration
+
+    def user(number):
+        rng = random.Random(number)
+        # A distinct client per user, so per-client rate limits and fair queuing behave as in production
+        client_ip = f"10.{number // 65536 % 256}.{number // 256 % 256}.{number % 256}"
+        while time.perf_counter() < deadline:
+            song_data = rng.choice(song_files)
+            template = template_data if template_data is not None and rng.random() < options.template_ratio else None
+            if not run_flow(base_url, client_ip, song_data, template, stats, options):
+                time.sleep(options.poll_interval)  # back off instead of hammering /upload
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=user, args=(number,), daemon=True) for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats.elapsed = time.perf_counter() - started
+    return stats
+
+
+def summarize(concurrency, stats):
+    """JSON-friendly summary of one stage (latencies in milliseconds)."""
+    def ms(value):
+        return None if value is None else round(value * 1000, 1)
+
+    endpoints = {}
+    for endpoint, samples in sorted(stats.latencies.items()):
+        endpoints[endpoint] = {
+            'requests': len(samples),
+            'errors': stats.errors.get(endpoint, 0),
+            'p50_ms': ms(percentile(samples, 0.50)),
+            'p95_ms': ms(percentile(samples, 0.95)),
+            'p99_ms': ms(percentile(samples, 0.99)),
+            'max_ms': ms(max(samples)),
+        }
+    requests = sum(len(samples) for samples in stats.latencies.values())
+    return {
+        'concurrency': concurrency,
+        'elapsed_s': round(stats.elapsed, 2),
+        'flows': stats.flows,
+        'failed_flows': stats.failed_flows,
+        'failures': stats.failures,
+        'flows_per_s': round(stats.flows / stats.elapsed, 3),
+        'requests_per_s': round(requests / stats.elapsed, 2),
+        'endpoints': endpoints,
+        'job_time_ms': {
+            'p50': ms(percentile(stats.job_times, 0.50)),
+            'p95': ms(percentile(stats.job_times, 0.95)),
+            'p99': ms(percentile(stats.job_times, 0.99)),
+        },
+    }
+
+
+def print_stage(summary):
+    def fmt(value):
+        return f"{value:>9.1f}" if value is not None else f"{'-':>9}"
+
+    print(f"\n👥 Concurrency {summary['concurrency']}: {summary['flows']} flows in {summary['elapsed_s']}s"
+          f" ({summary['flows_per_s']} flows/s, {summary['requests_per_s']} req/s)")
+    if summary['failed_flows']:
+        reasons = ', '.join(f"{reason} x{count}" for reason, count in sorted(summary['failures'].items()))
+        print(f"⚠️  {summary['failed_flows']} failed flows: {reasons}")
+    print(f"   {'endpoint':<16}{'requests':>9}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for endpoint, row in summary['endpoints'].items():
+        print(f"   {endpoint:<16}{row['requests']:>9}{row['errors']:>8}"
+              f"{fmt(row['p50_ms'])}{fmt(row['p95_ms'])}{fmt(row['p99_ms'])}{fmt(row['max_ms'])}")
+    job = summary['job_time_ms']
+    print(f"   {'generation':<16}{summary['flows']:>9}{'':>8}{fmt(job['p50'])}{fmt(job['p95'])}{fmt(job['p99'])}")
+
+
+def print_comparison(results, baseline):
+    """Throughput and p95 changes against an earlier --json run, stage by stage."""
+    previous = {stage['concurrency']: stage for stage in baseline['stages']}
+    print("\n📊 Compared with baseline")
+    print("-" * 50)
+    for stage in results['stages']:
+        before = previous.get(stage['concurrency'])
+        if before is None:
+            continue
+        change = stage['flows_per_s'] - before['flows_per_s']
+        print(f"👥 {stage['concurrency']}: flows/s {before['flows_per_s']} -> {stage['flows_per_s']} ({change:+.3f})")
+        for endpoint, row in stage['endpoints'].items():
+            old = before['endpoints'].get(endpoint)
+            if old and old['p95_ms'] is not None and row['p95_ms'] is not None:
+                print(f"   {endpoint:<16} p95 {old['p95_ms']:>8.1f} -> {row['p95_ms']:>8.1f} ms")
+        old_job, new_job = before['job_time_ms']['p95'], stage['job_time_ms']['p95']
+        if old_job is not None and new_job is not None:
+            print(f"   {'generation':<16} p95 {old_job:>8.1f} -> {new_job:>8.1f} ms")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers, work_dir, keep_rate_limits=False):
+    """Run app.py under gunicorn like the Procfile does, in a scratch directory."""
+    port = _free_port()
+    env = dict(os.environ)
+    env['LOAD_TEST_CLIENT_HEADER'] = '1'  # lets every virtual user be its own client
+    env['WEB_CONCURRENCY'] = str(workers)  # the app splits its per-client limits between workers
+    if not keep_rate_limits:
+        # Every virtual user is its own client, but a ramp still exceeds the per-minute limit
+        env.update({'RATE_LIMIT_PER_MINUTE': '100000', 'RATE_LIMIT_BURST': '100000'})
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}',
+         '--timeout', '300', '--workers', str(workers), '--pythonpath', app_dir, '--chdir', work_dir],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        if process.poll() is not None:
+            raise RuntimeError("gunicorn exited during startup (is it installed?)")
+        try:
+            with urllib.request.urlopen(base_url + '/', timeout=2):
+                return process, base_url
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("gunicorn did not start listening")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the song generator web app")
+    parser.add_argument('--url', help='Test an already running app instead of starting gunicorn '
+                        '(virtual users are separate clients only if it runs with LOAD_TEST_CLIENT_HEADER=1)')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers (default: 2, as in the Procfile)')
+    parser.add_argument('--concurrency', default='1,2,4,8',
+                        help='Comma-separated concurrent users per stage (default: 1,2,4,8)')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds per stage (default: 30)')
+    parser.add_argument('--songs', default='small,medium', help=f"Song file sizes to mix: {', '.join(SONG_SIZES)}")
+    parser.add_argument('--template-ratio', type=float, default=0.5,
+                        help='Fraction of uploads that include a template (default: 0.5)')
+    parser.add_argument('--output-format', choices=['pptx', 'html'], default='pptx')
+    parser.add_argument('--no-toc', dest='toc', action='store_false', help='Upload without a table of contents')
+    parser.add_argument('--poll-interval', type=float, default=2.0,
+                        help='Seconds between status polls; processing.html polls every 2 (default: 2)')
+    parser.add_argument('--keep-rate-limits', action='store_true',
+                        help="Keep the app's per-client rate limits when starting gunicorn")
+    parser.add_argument('--json', metavar='FILE', help='Save results as JSON')
+    parser.add_argument('--compare', metavar='FILE', help='Compare with results saved by an earlier --json run')
+    options = parser.parse_args()
+
+    levels = [int(level) for level in options.concurrency.split(',') if level.strip()]
+    sizes = [size.strip() for size in options.songs.split(',') if size.strip()]
+
+    print("🚦 Load testing the song generator web app...")
+    print("=" * 50)
+
+    data_dir = tempfile.mkdtemp(prefix='load_test_')
+    process = None
+    try:
+        song_files = []
+        for index, size in enumerate(sizes):
+            path = os.path.join(data_dir, f"{size}.txt")
+            make_song_file(path, SONG_SIZES[size], seed=index)
+            with open(path, 'rb') as file:
+                song_files.append(file.read())
+        template_data = None
+        if options.template_ratio > 0:
+            template_path = os.path.join(data_dir, 'template.pptx')
+            make_template(template_path)
+            with open(template_path, 'rb') as file:
+                template_data = file.read()
+
+        if options.url:
+            base_url = options.url.rstrip('/')
+        else:
+            server_dir = os.path.join(data_dir, 'server')
+            os.makedirs(server_dir)
+            process, base_url = start_server(options.workers, server_dir, options.keep_rate_limits)
+            print(f"🖥️  gunicorn with {options.workers} workers on {base_url}")
+        print(f"🎵 Song files: {', '.join(f'{size} ({SONG_SIZES[size]} songs)' for size in sizes)}")
+        print(f"⏱️  {options.duration:g}s per stage, concurrency {', '.join(map(str, levels))}")
+
+        results = {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'settings': {
+                'url': options.url, 'workers': None if options.url else options.workers,
+                'songs': sizes, 'template_ratio': options.template_ratio,
+                'output_format': options.output_format, 'toc': options.toc, 'duration': options.duration,
+            },
+            'stages': [],
+        }
+        for concurrency in levels:
+            summary = summarize(concurrency, run_stage(base_url, concurrency, song_files, template_data, options))
+            results['stages'].append(summary)
+            print_stage(summary)
+
+        if options.json:
+            with open(options.json, 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=2)
+            print(f"\n💾 Results saved to {options.json}")
+        if options.compare:
+            with open(options.compare, 'r', encoding='utf-8') as file:
+                print_comparison(results, json.load(file))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
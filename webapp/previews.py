@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Slide Previews - Web Version
+Renders low-resolution PNG thumbnails of song slides with Pillow, using the
+same text geometry as create_slide, so users can spot overflowing slides
+without downloading the deck. Thumbnails are cached on disk by content hash.
+"""
+
+import hashlib
+import io
+import os
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont
+from pptx.util import Inches, Pt
+
+DEFAULT_SLIDE_WIDTH = Inches(10)
+DEFAULT_SLIDE_HEIGHT = Inches(7.5)
+PREVIEW_WIDTH = 320  # px
+
+# Calibri first, then metric-compatible and common fallbacks
+_REGULAR_FONTS = ('calibri.ttf', 'Carlito-Regular.ttf', 'LiberationSans-Regular.ttf', 'Arial.ttf', 'DejaVuSans.ttf')
+_BOLD_FONTS = ('calibrib.ttf', 'Carlito-Bold.ttf', 'LiberationSans-Bold.ttf', 'Arial Bold.ttf', 'DejaVuSans-Bold.ttf')
+
+
+@lru_cache(maxsize=64)
+def _load_font(size_px, bold=False):
+    for name in (_BOLD_FONTS if bold else _REGULAR_FONTS):
+        try:
+            return ImageFont.truetype(name, size_px)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=size_px)
+
+
+def _wrap_line(draw, text, font, max_width):
+    """Word-wrap one paragraph the way a text box with word_wrap=True would."""
+    words = text.split(' ')
+    lines = []
+    current = ''
+    for word in words:
+        candidate = f"{current} {word}" if current else word
+        if current and draw.textlength(candidate, font=font) > max_width:
+            lines.append(current)
+            current = word
+        else:
+            current = candidate
+    lines.append(current)
+    return lines
+
+
+def preview_key(title, lines, slide_number, total_slides, slide_width, slide_height, width_px=PREVIEW_WIDTH,
+                top_offset=0, bottom_limit=None):
+    """Content hash identifying a rendered preview."""
+    digest = hashlib.sha1()
+    for value in (title, slide_number, total_slides, slide_width, slide_height, width_px, top_offset, bottom_limit):
+        digest.update(f"{value}\x1f".encode('utf-8'))
+    for line in lines:
+        digest.update(line.encode('utf-8') + b'\x1e')
+    return digest.hexdigest()
+
+
+def render_slide_preview(title, lines, slide_number=None, total_slides=None,
+                         slide_width=DEFAULT_SLIDE_WIDTH, slide_height=DEFAULT_SLIDE_HEIGHT,
+                         width_px=PREVIEW_WIDTH, top_offset=0, bottom_limit=None):
+    """
+    Render a song slide as PNG bytes.
+
+    Mirrors create_slide: title box at (0.5", 0.6") in 32pt bold, counter
+    top-right in 24pt brown, lyrics box from 1.4" down in 28pt with 16pt
+    after each line. top_offset and bottom_limit come from the template
+    analysis (load_template_info in generator.py): everything moves down
+    by top_offset and the lyrics box ends at bottom_limit, as on the
+    generated slide. Content that runs past the bottom of the lyrics box is
+    drawn anyway and the slide gets a red frame.
+
+    Returns:
+        tuple: (png: bytes, overflows: bool)
+    """
+    if bottom_limit is None:
+        bottom_limit = slide_height
+    scale = width_px / slide_width
+    height_px = max(1, round(slide_height * scale))
+
+    def px(emu):
+        return emu * scale
+
+    image = Image.new('RGB', (width_px, height_px), 'white')
+    draw = ImageDraw.Draw(image)
+    margin = px(Inches(0.2))
+    inset_top = px(Inches(0.05))
+
+    # Title
+    title_font = _load_font(max(1, round(px(Pt(32)))), bold=True)
+    title_left = px(Inches(0.5)) + margin
+    title_width = px(slide_width - Inches(1.8)) - 2 * margin
+    y = px(Inches(0.6) + top_offset) + inset_top
+    for line in _wrap_line(draw, title, title_font, title_width):
+        draw.text((title_left, y), line, font=title_font, fill=(0, 0, 0))
+        y += px(Pt(32)) * 1.2
+
+    # Slide counter
+    if slide_number is not None and total_slides is not None:
+        counter_font = _load_font(max(1, round(px(Pt(24)))), bold=True)
+        counter = f"{slide_number}/{total_slides}"
+        right = px(slide_width - Inches(0.3)) - px(Inches(0.1))
+        draw.text((right - draw.textlength(counter, font=counter_font), px(Inches(0.6) + top_offset) + inset_top),
+                  counter, font=counter_font, fill=(139, 69, 19))
+
+    # Lyrics
+    overflows = False
+    if lines:
+        content_font = _load_font(max(1, round(px(Pt(28)))))
+        content_left = px(Inches(0.5)) + margin
+        content_width = px(slide_width - Inches(1.0)) - 2 * margin
+        content_top = Inches(1.4) + top_offset
+        content_bottom = px(content_top + min(slide_height - Inches(1.9), bottom_limit - content_top))
+        line_height = px(Pt(28)) * 1.2
+        y = px(content_top) + inset_top
+        for paragraph in lines:
+            for line in _wrap_line(draw, paragraph, content_font, content_width):
+                draw.text((content_left, y), line, font=content_font, fill=(0, 0, 0))
+                y += line_height
+            y += px(Pt(16))
+        overflows = y - px(Pt(16)) > content_bottom
+
+    if overflows:
+        draw.rectangle([0, 0, width_px - 1, height_px - 1], outline=(220, 53, 69), width=3)
+
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG', optimize=True)
+    return buffer.getvalue(), overflows
+
+
+def cached_slide_preview(cache_folder, title, lines, slide_number=None, total_slides=None,
+                         slide_width=DEFAULT_SLIDE_WIDTH, slide_height=DEFAULT_SLIDE_HEIGHT,
+                         width_px=PREVIEW_WIDTH, top_offset=0, bottom_limit=None):
+    """Return the path of a preview PNG, rendering it only if not cached yet."""
+    key = preview_key(title, lines, slide_number, total_slides, slide_width, slide_height, width_px,
+                      top_offset, bottom_limit)
+    path = os.path.join(cache_folder, f"{key}.png")
+    if not os.path.exists(path):
+        png, _ = render_slide_preview(title, lines, slide_number, total_slides,
+                                      slide_width, slide_height, width_px, top_offset, bottom_limit)
+        # Write-then-rename so concurrent requests never see a partial file
+        temp_path = f"{path}.{os.getpid()}.{id(png)}.tmp"
+        with open(temp_path, 'wb') as file:
+            file.write(png)
+        os.replace(temp_path, path)
+    return path
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Generation Profiling - Web Version
+Profiles one generation run split into stages (parse, template, render,
+toc, save): a cProfile/pstats dump for call counts and cumulative times,
+and collapsed stacks from a stack sampler for flamegraph tools.
+"""
+
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+# Only one deterministic profiler can run per process at a time (Python
+# 3.12+ refuses a second one); later jobs fall back to sampling only
+_deterministic_lock = threading.Lock()
+
+
+def profile_stage(profiler, name):
+    """Start stage `name` on profiler, if generation is being profiled."""
+    if profiler is not None:
+        profiler.enter(name)
+
+
+class StageProfiler(object):
+    """
+    Profile the calling thread, split into named stages.
+
+    Call start(), then enter(stage) at each stage boundary (entering a stage
+    ends the previous one), then stop(). With deterministic=True every stage
+    gets its own cProfile.Profile; the stack sampler always runs and is
+    cheap enough to leave on for every job at a coarse interval.
+    """
+
+    def __init__(self, deterministic=True, sample_interval=0.001):
+        self.deterministic = deterministic
+        self.sample_interval = sample_interval
+        self.stage_times = {}  # stage -> seconds, in stage order
+        self.stacks = Counter()  # 'stage;outer;...;inner' -> samples
+        self._profiles = {}
+        self._stage = None
+        self._stage_started = None
+        self._thread_id = None
+        self._sampler = None
+        self._stopped = threading.Event()
+        self._owns_lock = False
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        if self.deterministic:
+            self._owns_lock = _deterministic_lock.acquire(blocking=False)
+            self.deterministic = self._owns_lock
+        self._sampler = threading.Thread(target=self._sample, name='stack-sampler', daemon=True)
+        self._sampler.start()
+        return self
+
+    def enter(self, name):
+        self._end_stage()
+        self._stage = name
+        self._stage_started = time.perf_counter()
+        if self.deterministic:
+            profile = self._profiles.get(name)
+            if profile is None:
+                profile = self._profiles[name] = cProfile.Profile()
+            profile.enable()
+
+    def stop(self):
+        self._end_stage()
+        self._stage = None
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        if self._owns_lock:
+            _deterministic_lock.release()
+            self._owns_lock = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def total_time(self):
+        return sum(self.stage_times.values())
+
+    def _end_stage(self):
+        if self._stage is None:
+            return
+        if self.deterministic:
+            self._profiles[self._stage].disable()
+        elapsed = time.perf_counter() - self._stage_started
+        self.stage_times[self._stage] = self.stage_times.get(self._stage, 0.0) + elapsed
+
+    def _sample(self):
+        own_file = __file__
+        while not self._stopped.wait(self.sample_interval):
+            stage = self._stage
+            frame = sys._current_frames().get(self._thread_id)
+            if stage is None or frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                if code.co_filename != own_file:
+                    names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            names.append(stage)
+            self.stacks[';'.join(reversed(names))] += 1
+
+    def write(self, base_path):
+        """
+        Write base_path.prof (all stages), base_path.<stage>.prof and
+        base_path.collapsed (one 'stage;frame;... count' line per stack, as
+        read by flamegraph.pl and speedscope). Returns the paths written.
+        """
+        paths = []
+        if self._profiles:
+            combined = None
+            for stage, profile in self._profiles.items():
+                stage_path = f"{base_path}.{stage}.prof"
+                pstats.Stats(profile).dump_stats(stage_path)
+                paths.append(stage_path)
+                if combined is None:
+                    combined = pstats.Stats(profile)
+                else:
+                    combined.add(profile)
+            combined.dump_stats(base_path + '.prof')
+            paths.insert(0, base_path + '.prof')
+
+        collapsed_path = base_path + '.collapsed'
+        with open(collapsed_path, 'w', encoding='utf-8') as file:
+            for stack, count in sorted(self.stacks.items()):
+                file.write(f"{stack} {count}\n")
+        paths.append(collapsed_path)
+        return paths
+
+    def format_summary(self, limit=15):
+        """Stage times, then the slowest functions by cumulative time."""
+        total = self.total_time or 1.0
+        lines = ["Stage times:"]
+        lines.extend(f"   {stage:<10} {seconds:8.3f}s {seconds / total:6.1%}"
+                     for stage, seconds in self.stage_times.items())
+        if self._profiles:
+            stats = None
+            for profile in self._profiles.values():
+                if stats is None:
+                    stats = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+            rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+            lines.append(f"Top {limit} functions by cumulative time:")
+            for (filename, line, name), (_, calls, _, cumulative, _) in rows[:limit]:
+                lines.append(f"   {cumulative:8.3f}s {calls:>9} calls  {os.path.basename(filename)}:{line}({name})")
+        return '\n'.join(lines)
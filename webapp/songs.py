@@ -0,0 +1,982 @@
+#!/usr/bin/env python3
+"""
+Song Parsing and Dry-Run Validation - Web Version
+Parses song files, splits lyrics into slides and plans the TOC without
+python-pptx, so songs can be checked in milliseconds before any rendering.
+"""
+
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import unicodedata
+import zlib
+from array import array
+
+# Geometry in EMU, the unit python-pptx uses (914400 per inch, 12700 per point)
+EMU_PER_INCH = 914400
+EMU_PER_POINT = 12700
+
+
+def inches(value):
+    return int(value * EMU_PER_INCH)
+
+
+def points(value):
+    return int(value * EMU_PER_POINT)
+
+
+DEFAULT_SLIDE_WIDTH = inches(10)  # python-pptx default 4:3 deck
+DEFAULT_SLIDE_HEIGHT = inches(7.5)
+
+
+def read_song_file(file_path):
+    """Read a song file, returning (content, encoding used)."""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            return file.read(), 'utf-8'
+    except UnicodeDecodeError:
+        # Try with different encoding
+        with open(file_path, 'r', encoding='latin-1') as file:
+            return file.read(), 'latin-1'
+
+
+def decode_song_bytes(data):
+    """Decode uploaded song file bytes the same way read_song_file reads files."""
+    try:
+        content, encoding = data.decode('utf-8'), 'utf-8'
+    except UnicodeDecodeError:
+        content, encoding = data.decode('latin-1'), 'latin-1'
+    # Universal newlines, as in text-mode open()
+    return content.replace('\r\n', '\n').replace('\r', '\n'), encoding
+
+
+def parse_songs(file_path):
+    """Parse songs from text file (or load them from a compiled .songs corpus)."""
+    if is_song_corpus(file_path):
+        return load_song_corpus(file_path).songs
+    content, _ = read_song_file(file_path)
+    return parse_song_text(content)
+
+
+def parse_song_text(content):
+    """Parse songs from the text of a song file."""
+    # Split by song markers (lines starting with #)
+    song_sections = re.split(r'\n(?=#)', content)
+    songs = []
+    
+    for section in song_sections:
+        if section.strip() and section.startswith('#'):
+            lines = section.split('\n')
+            
+            if lines:
+                # Extract title (remove #)
+                title = lines[0].replace('#', '').strip()
+                
+                # Get lyrics (everything after title), preserving empty lines
+                lyrics = lines[1:] if len(lines) > 1 else []
+                
+                if title:  # Only add if we have a title
+                    songs.append({
+                        'title': title,
+                        'lyrics': lyrics
+                    })
+    
+    return songs
+
+
+def split_lyrics_into_slides(lyrics):
+    """Split lyrics into slides at paragraph breaks (empty lines)."""
+    slides = []
+    current_slide = []
+    
+    for line in lyrics:
+        if line.strip():  # Non-empty line
+            current_slide.append(line)
+        else:  # Empty line - natural paragraph break
+            if current_slide:  # Only create slide if we have content
+                slides.append(current_slide.copy())
+                current_slide = []
+    
+    # Add remaining content if any
+    if current_slide:
+        slides.append(current_slide)
+    
+    return slides
+
+
+# Table of Contents layout
+TOC_FONT_SIZES = (20, 16, 14)  # pt, stepped down while it saves TOC pages
+TOC_SPACE_AFTER = 6  # pt between entries
+TOC_MAX_COLUMNS = 4
+TOC_COLUMN_GAP = inches(0.2)
+TOC_TEXT_MARGIN = inches(0.2)  # left/right inset inside each column
+TOC_ELLIPSIS = '\u2026'
+TOC_LEGACY_PER_PAGE = 20  # entries per page of the old fixed TOC, an upper bound on pages
+
+class _CharWidthTable(dict):
+    """Advance widths by character; other characters are filled in on first use."""
+
+    def __missing__(self, char):
+        width = self[char] = 590 if char.isupper() else 480
+        return width
+
+
+# Approximate Calibri advance widths (1/1000 em) used to measure titles
+_CHAR_WIDTHS = _CharWidthTable()
+for _chars, _width in (
+    (" ", 226), ("ijl|!.,:;'`", 230), ("frt()[]{}-/\"", 340), ("I", 252), ("J", 319),
+    ("mw", 780), ("MW", 870), ("0123456789", 507),
+):
+    for _char in _chars:
+        _CHAR_WIDTHS[_char] = _width
+
+
+def estimate_text_width(text, font_size):
+    """Estimate the rendered width of text in EMU for Calibri at font_size pt."""
+    return int(points(font_size) * sum(map(_CHAR_WIDTHS.__getitem__, text)) / 1000)
+
+
+def _toc_sort_key(title):
+    """Sort key that files accented titles with their base letter."""
+    decomposed = unicodedata.normalize('NFKD', title)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def toc_index_letter(title):
+    """Letter a title is filed under in the alphabetical index ('#' for non-letters)."""
+    for char in unicodedata.normalize('NFKD', title):
+        if char.isalpha():
+            return char.upper()
+        if char.isdigit():
+            return '#'
+    return '#'
+
+
+def _truncate_label(label, font_size, max_width):
+    """Shorten label with an ellipsis so it fits max_width EMU on one line."""
+    if estimate_text_width(label, font_size) <= max_width:
+        return label
+    budget = max_width * 1000 / points(font_size) - _CHAR_WIDTHS[TOC_ELLIPSIS]
+    used = 0
+    for length, char in enumerate(label):
+        used += _CHAR_WIDTHS[char]
+        if used > budget:
+            return label[:length].rstrip() + TOC_ELLIPSIS
+    return label
+
+
+def plan_toc_layout(titles, slide_width=DEFAULT_SLIDE_WIDTH, slide_height=DEFAULT_SLIDE_HEIGHT,
+                    alphabetical_index=False, font_sizes=TOC_FONT_SIZES, top_offset=0, bottom_limit=None):
+    """
+    Pack all TOC entries into pages and columns in one pass.
+
+    Every entry label is measured once; then each font size in font_sizes,
+    with long titles either wrapping over as many lines as they need or
+    cut to one line with an ellipsis, and each column count
+    (1..TOC_MAX_COLUMNS) is tried. The option needing the fewest TOC
+    pages wins; ties go to whole titles, then the larger font, then fewer,
+    wider columns. The plan never has more pages than the fixed 20 entries
+    per page (2 columns of 10) the TOC used to have.
+
+    Returns a dict with the pages (a list of columns, each a list of indexes
+    into titles), the label of every title, the column geometry, the font
+    size and, if alphabetical_index is set, the letters with the TOC page
+    each one starts on.
+
+    top_offset and bottom_limit keep the entries clear of template
+    decorations (see analyze_template in generator.py).
+    """
+    order = list(range(len(titles)))
+    if alphabetical_index:
+        order.sort(key=lambda i: _toc_sort_key(titles[i]))
+
+    labels = [f"{i + 1:2d}. {titles[i]}" for i in range(len(titles))]
+    # Widths in 1/1000 em scale with the font size, so they are summed once
+    ems = [sum(map(_CHAR_WIDTHS.__getitem__, labels[i])) for i in order]
+
+    content_left = inches(0.5)
+    content_top = inches(1.6) + top_offset
+    content_width = slide_width - inches(1.0)
+    content_bottom = slide_height - inches(1.2)  # leave space for bottom border
+    if bottom_limit is not None:
+        content_bottom = min(content_bottom, bottom_limit)
+    content_height = content_bottom - content_top
+
+    def pack(font_size, columns, truncate):
+        """Pages for one option: lists of columns of positions in order."""
+        column_width = int((content_width - TOC_COLUMN_GAP * (columns - 1)) / columns)
+        text_width = column_width - 2 * TOC_TEXT_MARGIN
+        line_height = points(font_size * 1.2)
+        space_after = points(TOC_SPACE_AFTER)
+        pages = []
+        page = [[]]
+        used_height = 0
+        for position, em in enumerate(ems):
+            lines = 1 if truncate else max(1, math.ceil(points(font_size) * em / 1000 / text_width))
+            height = min(content_height, lines * line_height + space_after)
+            if used_height + height > content_height and page[-1]:
+                if len(page) == columns:
+                    pages.append(page)
+                    page = []
+                page.append([])
+                used_height = 0
+            page[-1].append(position)
+            used_height += height
+        if page[-1]:
+            pages.append(page)
+        return pages, column_width
+
+    best = None
+    for truncate in (False, True):
+        for font_size in font_sizes:
+            for columns in range(1, TOC_MAX_COLUMNS + 1):
+                if (content_width - TOC_COLUMN_GAP * (columns - 1)) / columns <= 2 * TOC_TEXT_MARGIN:
+                    break
+                pages, column_width = pack(font_size, columns, truncate)
+                if best is None or len(pages) < len(best['pages']):
+                    best = {'pages': pages, 'columns': columns, 'column_width': column_width,
+                            'font_size': font_size, 'truncate': truncate}
+
+    # Never worse than the old fixed grid of 20 titles per page, 2 columns of 10
+    legacy_page_count = math.ceil(len(titles) / TOC_LEGACY_PER_PAGE)
+    if len(best['pages']) > legacy_page_count:
+        column_width = int((content_width - TOC_COLUMN_GAP) / 2)
+        half = TOC_LEGACY_PER_PAGE // 2
+        best = {
+            'pages': [[list(range(start, min(start + half, len(ems)))) for start in (first, first + half)
+                       if start < len(ems)] for first in range(0, len(ems), TOC_LEGACY_PER_PAGE)],
+            'columns': 2, 'column_width': column_width, 'font_size': min(font_sizes), 'truncate': True,
+        }
+
+    if best['truncate']:
+        text_width = best['column_width'] - 2 * TOC_TEXT_MARGIN
+        labels = [_truncate_label(label, best['font_size'], text_width) for label in labels]
+    best['labels'] = labels
+    del best['truncate']
+
+    best['pages'] = [[[order[p] for p in column] for column in page] for page in best['pages']]
+    best.update({
+        'left': content_left,
+        'top': content_top,
+        'height': content_height,
+        'index_letters': [],
+    })
+
+    if alphabetical_index:
+        # First TOC page each letter appears on, in alphabetical order
+        first_pages = {}
+        for page_index, page in enumerate(best['pages']):
+            for column in page:
+                for i in column:
+                    first_pages.setdefault(toc_index_letter(titles[i]), page_index)
+        best['index_letters'] = list(first_pages.items())
+
+    best['index_slide_count'] = 1 if best['index_letters'] else 0
+    best['slide_count'] = best['index_slide_count'] + len(best['pages'])
+    return best
+
+
+
+
+# Duplicate detection: exact duplicates share their normalized lyrics;
+# near duplicates are found with MinHash over word-pair shingles, bucketed
+# by LSH bands and confirmed with an exact Jaccard similarity
+DUPLICATE_THRESHOLD = 0.8  # Jaccard similarity of lyric shingles
+_MINHASH_SLOTS = 64
+_LSH_BANDS = 16  # 4 slots per band: pairs at 0.8 similarity collide with >99.9% probability
+
+
+def normalize_song_text(text):
+    """Casefold and drop accents, punctuation and extra whitespace, for comparing songs."""
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    if not decomposed.isascii():
+        decomposed = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(re.sub(r'[^\w\s]', ' ', decomposed).split())
+
+
+def _song_shingles(text):
+    """Hashes of every pair of adjacent words; a misspelt word changes only two of them."""
+    words = text.encode('utf-8').split()
+    if len(words) < 2:
+        return {zlib.crc32(b' '.join(words))}
+    return {zlib.crc32(first + b' ' + second) for first, second in zip(words, words[1:])}
+
+
+def _minhash_signature(shingles):
+    """One-permutation MinHash: each shingle hash lands in one slot and each slot keeps its minimum."""
+    slots = [None] * _MINHASH_SLOTS
+    for value in shingles:
+        slot, rest = value % _MINHASH_SLOTS, value // _MINHASH_SLOTS
+        if slots[slot] is None or rest < slots[slot]:
+            slots[slot] = rest
+    # Empty slots (short songs) borrow the next filled slot's value, offset by
+    # distance; walking the ring twice backwards finds it for every slot
+    if None in slots:
+        filled = [value is not None for value in slots]
+        nearest = None
+        for i in range(2 * _MINHASH_SLOTS - 1, -1, -1):
+            slot = i % _MINHASH_SLOTS
+            if filled[slot]:
+                nearest = (slots[slot], i)
+            elif i < _MINHASH_SLOTS and nearest is not None:
+                slots[slot] = nearest[0] + ((nearest[1] - i) << 32)
+    return slots
+
+
+def find_duplicate_songs(songs, threshold=DUPLICATE_THRESHOLD):
+    """
+    Group songs whose lyrics are identical or nearly identical.
+
+    Runs in roughly linear time: every song is hashed once and only songs
+    sharing an LSH bucket are compared. Songs without lyrics are compared
+    by title.
+
+    Returns:
+        list: groups in song order, each {'keep': index of the first song,
+        'duplicates': [{'index', 'similarity'}, ...]}
+    """
+    texts = [normalize_song_text(' '.join(song['lyrics'])) or normalize_song_text(song['title'])
+             for song in songs]
+    parent = list(range(len(songs)))
+    similarity = {}
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i, j, score):
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+        later = max(i, j)
+        similarity[later] = max(similarity.get(later, 0.0), score)
+
+    # Exact duplicates
+    first_by_text = {}
+    for i, text in enumerate(texts):
+        if text in first_by_text:
+            union(first_by_text[text], i, 1.0)
+        else:
+            first_by_text[text] = i
+
+    # Near duplicates among the distinct texts
+    rows = _MINHASH_SLOTS // _LSH_BANDS
+    shingle_sets = {}
+    signatures = {}
+    buckets = {}
+    candidates = set()
+    for i in first_by_text.values():
+        shingles = shingle_sets[i] = _song_shingles(texts[i])
+        signature = signatures[i] = _minhash_signature(shingles)
+        for band in range(_LSH_BANDS):
+            bucket = buckets.setdefault((band, tuple(signature[band * rows:(band + 1) * rows])), [])
+            candidates.update((j, i) for j in bucket)
+            bucket.append(i)
+
+    # Signatures estimate the similarity cheaply; only likely pairs get the exact check
+    min_matching_slots = int((threshold - 0.15) * _MINHASH_SLOTS)
+    for j, i in sorted(candidates):
+        if sum(x == y for x, y in zip(signatures[j], signatures[i])) < min_matching_slots:
+            continue
+        a, b = shingle_sets[j], shingle_sets[i]
+        score = len(a & b) / len(a | b)
+        if score >= threshold:
+            union(j, i, score)
+
+    groups = {}
+    for i in range(len(songs)):
+        root = find(i)
+        if root != i:
+            groups.setdefault(root, []).append({'index': i, 'similarity': round(similarity.get(i, threshold), 3)})
+    return [{'keep': keep, 'duplicates': duplicates} for keep, duplicates in sorted(groups.items())]
+
+
+def collapse_duplicate_songs(songs, groups):
+    """
+    Keep only the first song of each duplicate group.
+
+    Returns (unique_songs, toc_entries). toc_entries lists (title, index
+    into unique_songs) in song order; a duplicate keeps its own TOC entry,
+    linking to the song that is rendered, when its title differs from the
+    kept song's title.
+    """
+    kept_for = {}
+    for group in groups:
+        for duplicate in group['duplicates']:
+            kept_for[duplicate['index']] = group['keep']
+
+    unique_index = {}
+    unique_songs = []
+    for i, song in enumerate(songs):
+        if i not in kept_for:
+            unique_index[i] = len(unique_songs)
+            unique_songs.append(song)
+
+    toc_entries = []
+    for i, song in enumerate(songs):
+        kept = kept_for.get(i, i)
+        if kept != i and normalize_song_text(song['title']) == normalize_song_text(songs[kept]['title']):
+            continue
+        toc_entries.append((song['title'], unique_index[kept]))
+    return unique_songs, toc_entries
+
+
+# Song archive: random access to single songs of a large song file. A
+# sidecar index (<archive>.index.json) records each song's byte range and is
+# rebuilt only when the archive's size or mtime changes
+ARCHIVE_INDEX_VERSION = 1
+_SONG_BOUNDARY = re.compile(rb'(?:\r\n|\r|\n)(?=#)')
+
+
+class SongArchive(object):
+    """
+    Memory-mapped song file with a title -> (offset, length) index.
+
+    get_songs decodes only the byte ranges of the requested songs, so
+    picking a few songs costs the same for a small file as for a 20 MB
+    archive. Songs come back exactly as parse_songs would return them.
+    """
+
+    def __init__(self, archive_path, index_path=None):
+        self.archive_path = archive_path
+        self.index_path = index_path or archive_path + '.index.json'
+        self._file = None
+        self._map = None
+        self._stat = None
+        self._open()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self._refresh()['entries'])
+
+    def __contains__(self, title):
+        return self._lookup(title) is not None
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        if self._file is not None:
+            self._file.close()
+        self._map = self._file = None
+
+    def titles(self):
+        """Song titles in file order."""
+        return [entry[0] for entry in self._refresh()['entries']]
+
+    def get_song(self, title):
+        """Return the song with this title, or None. Titles match exactly first, then normalized."""
+        entry = self._lookup(title)
+        if entry is None:
+            return None
+        _, offset, length = entry
+        section = self._map[offset:offset + length].decode(self._index['encoding'])
+        songs = parse_song_text(section.replace('\r\n', '\n').replace('\r', '\n'))
+        return songs[0] if songs else None
+
+    def get_songs(self, titles):
+        """Return (songs in the requested order, titles that were not found)."""
+        songs = []
+        missing = []
+        for title in titles:
+            song = self.get_song(title)
+            if song is None:
+                missing.append(title)
+            else:
+                songs.append(song)
+        return songs, missing
+
+    def _lookup(self, title):
+        self._refresh()
+        entry = self._by_title.get(title.strip())
+        if entry is None:
+            if self._by_normalized_title is None:
+                # Only needed for near-miss titles, so built on first use
+                self._by_normalized_title = {}
+                for candidate in self._index['entries']:
+                    self._by_normalized_title.setdefault(normalize_song_text(candidate[0]), candidate)
+            entry = self._by_normalized_title.get(normalize_song_text(title))
+        return entry
+
+    def _refresh(self):
+        """Reopen and reindex the archive if it changed on disk since it was mapped."""
+        stat = os.stat(self.archive_path)
+        if (stat.st_size, stat.st_mtime_ns) != self._stat:
+            self.close()
+            self._open()
+        return self._index
+
+    def _open(self):
+        self._file = open(self.archive_path, 'rb')
+        stat = os.fstat(self._file.fileno())
+        self._stat = (stat.st_size, stat.st_mtime_ns)
+        # mmap refuses empty files; an empty archive simply has no songs
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+
+        index = self._load_index()
+        if index is None:
+            index = self._build_index()
+            self._save_index(index)
+        self._index = index
+
+        self._by_title = {}
+        self._by_normalized_title = None
+        for entry in reversed(index['entries']):
+            self._by_title[entry[0]] = entry
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if (index.get('version') != ARCHIVE_INDEX_VERSION
+                or (index.get('size'), index.get('mtime_ns')) != self._stat):
+            return None
+        return index
+
+    def _build_index(self):
+        """Scan the whole archive once, splitting it where parse_song_text would."""
+        data = self._map[:]
+        try:
+            data.decode('utf-8')
+            encoding = 'utf-8'
+        except UnicodeDecodeError:
+            encoding = 'latin-1'
+
+        boundaries = [(match.start(), match.end()) for match in _SONG_BOUNDARY.finditer(data)]
+        starts = [0] + [end for _, end in boundaries]
+        ends = [start for start, _ in boundaries] + [len(data)]
+        entries = []
+        for start, end in zip(starts, ends):
+            if data[start:start + 1] != b'#':
+                continue
+            title_line = re.split(rb'\r|\n', data[start:end], 1)[0]
+            title = title_line.decode(encoding).replace('#', '').strip()
+            if title:
+                entries.append([title, start, end - start])
+
+        return {
+            'version': ARCHIVE_INDEX_VERSION,
+            'size': self._stat[0],
+            'mtime_ns': self._stat[1],
+            'encoding': encoding,
+            'entries': entries,
+        }
+
+    def _save_index(self, index):
+        # Best effort: a read-only folder just means the index is rebuilt next time
+        temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                json.dump(index, file, ensure_ascii=False, separators=(',', ':'))
+            os.replace(temp_path, self.index_path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+# Compiled song corpus (.songs): the parsed and pre-split form of a song
+# file, loaded with array reads instead of text parsing. Layout after the
+# 16-byte header (magic, version, CRC-32 of everything after the header):
+#   source encoding (16 bytes), counts of strings, songs, lines and slides,
+#   then little-endian uint32 arrays: title string per song, first line per
+#   song (+1), string per line, first slide per song (+1), (first line, end
+#   line) per slide, and finally every distinct string once, as UTF-8 joined
+#   by newlines (lines and titles never contain one)
+SONG_CORPUS_MAGIC = b'SONGCORP'
+SONG_CORPUS_VERSION = 1
+SONG_CORPUS_EXTENSION = '.songs'
+_CORPUS_HEADER = struct.Struct('<8sII')
+_CORPUS_COUNTS = struct.Struct('<16sIIII')
+
+
+def _uint32_array(values=()):
+    numbers = array('I', values)
+    if numbers.itemsize != 4:
+        numbers = array('L', values)
+    return numbers
+
+
+def compile_song_corpus(song_file_path, corpus_path):
+    """Compile a song text file into a .songs corpus. Returns the number of songs."""
+    content, encoding = read_song_file(song_file_path)
+    songs = parse_song_text(content)
+
+    string_ids = {}
+    strings = []
+
+    def intern(text):
+        string_id = string_ids.get(text)
+        if string_id is None:
+            string_id = string_ids[text] = len(strings)
+            strings.append(text)
+        return string_id
+
+    titles = _uint32_array()
+    line_starts = _uint32_array([0])
+    lines = _uint32_array()
+    slide_starts = _uint32_array([0])
+    slide_bounds = _uint32_array()
+    for song in songs:
+        titles.append(intern(song['title']))
+        # A slide is a run of non-blank lines, exactly as split_lyrics_into_slides cuts them
+        start = None
+        for line in song['lyrics']:
+            if line.strip():
+                if start is None:
+                    start = len(lines)
+            elif start is not None:
+                slide_bounds.extend((start, len(lines)))
+                start = None
+            lines.append(intern(line))
+        if start is not None:
+            slide_bounds.extend((start, len(lines)))
+        line_starts.append(len(lines))
+        slide_starts.append(len(slide_bounds) // 2)
+
+    arrays = (titles, line_starts, lines, slide_starts, slide_bounds)
+    if sys.byteorder == 'big':
+        for numbers in arrays:
+            numbers.byteswap()
+    payload = b''.join(
+        [_CORPUS_COUNTS.pack(encoding.encode('ascii'), len(strings), len(songs), len(lines),
+                             len(slide_bounds) // 2)]
+        + [numbers.tobytes() for numbers in arrays]
+        + ['\n'.join(strings).encode('utf-8')]
+    )
+    header = _CORPUS_HEADER.pack(SONG_CORPUS_MAGIC, SONG_CORPUS_VERSION, zlib.crc32(payload))
+
+    temp_path = f"{corpus_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(header + payload)
+    os.replace(temp_path, corpus_path)
+    return len(songs)
+
+
+def is_song_corpus(file_path):
+    """True if file_path is a compiled .songs corpus rather than song text."""
+    try:
+        with open(file_path, 'rb') as file:
+            return file.read(len(SONG_CORPUS_MAGIC)) == SONG_CORPUS_MAGIC
+    except OSError:
+        return False
+
+
+def load_song_corpus(file_path):
+    """Load and verify a compiled .songs corpus."""
+    with open(file_path, 'rb') as file:
+        return SongCorpus(file.read())
+
+
+def open_song_archive(file_path):
+    """Random access to the songs of a song file: SongCorpus or SongArchive (text)."""
+    if is_song_corpus(file_path):
+        return load_song_corpus(file_path)
+    return SongArchive(file_path)
+
+
+def song_slides(song):
+    """A song's lyric slides: pre-split for corpus songs, split_lyrics_into_slides otherwise."""
+    slides = song.get('slides')
+    if slides is None:
+        slides = split_lyrics_into_slides(song['lyrics'])
+    return slides
+
+
+class SongCorpus(object):
+    """
+    A loaded .songs corpus.
+
+    songs is the list parse_songs returns for the source file, with each
+    song's pre-split slides under 'slides'. Raises ValueError if the data is
+    not a corpus, is from another format version, or fails its checksum.
+    Has the same lookup methods as SongArchive.
+    """
+
+    def __init__(self, data):
+        if len(data) < _CORPUS_HEADER.size + _CORPUS_COUNTS.size:
+            raise ValueError("Not a song corpus (file too short)")
+        magic, version, checksum = _CORPUS_HEADER.unpack_from(data)
+        if magic != SONG_CORPUS_MAGIC:
+            raise ValueError("Not a song corpus")
+        if version != SONG_CORPUS_VERSION:
+            raise ValueError(f"Song corpus format {version} is not supported, recompile it")
+        payload = memoryview(data)[_CORPUS_HEADER.size:]
+        if zlib.crc32(payload) != checksum:
+            raise ValueError("Song corpus is corrupt (checksum mismatch), recompile it")
+
+        encoding, string_count, song_count, line_count, slide_count = _CORPUS_COUNTS.unpack_from(payload)
+        self.encoding = encoding.rstrip(b'\0').decode('ascii')
+        offset = _CORPUS_COUNTS.size
+        arrays = []
+        for length in (song_count, song_count + 1, line_count, song_count + 1, 2 * slide_count):
+            numbers = _uint32_array()
+            numbers.frombytes(payload[offset:offset + 4 * length])
+            if sys.byteorder == 'big':
+                numbers.byteswap()
+            arrays.append(numbers)
+            offset += 4 * length
+        titles, line_starts, lines, slide_starts, slide_bounds = arrays
+
+        strings = str(payload[offset:], 'utf-8').split('\n') if string_count else []
+        if len(strings) != string_count:
+            raise ValueError("Song corpus is corrupt (string table), recompile it")
+        # Every line and slide is a slice of one list, so loading is a few C-level passes
+        all_lines = list(map(strings.__getitem__, lines))
+        bounds = slide_bounds.tolist()
+        all_slides = list(map(all_lines.__getitem__, map(slice, bounds[::2], bounds[1::2])))
+        line_starts = line_starts.tolist()
+        slide_starts = slide_starts.tolist()
+
+        self.songs = [
+            {'title': strings[title],
+             'lyrics': all_lines[line_start:line_end],
+             'slides': all_slides[slide_start:slide_end]}
+            for title, line_start, line_end, slide_start, slide_end
+            in zip(titles, line_starts, line_starts[1:], slide_starts, slide_starts[1:])
+        ]
+
+        self._by_title = {}
+        self._by_normalized_title = None
+        for song in reversed(self.songs):
+            self._by_title[song['title']] = song
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.songs)
+
+    def __contains__(self, title):
+        return self.get_song(title) is not None
+
+    def close(self):
+        pass
+
+    def titles(self):
+        """Song titles in file order."""
+        return [song['title'] for song in self.songs]
+
+    def get_song(self, title):
+        """Return the song with this title, or None. Titles match exactly first, then normalized."""
+        song = self._by_title.get(title.strip())
+        if song is None:
+            if self._by_normalized_title is None:
+                self._by_normalized_title = {}
+                for candidate in self.songs:
+                    self._by_normalized_title.setdefault(normalize_song_text(candidate['title']), candidate)
+            song = self._by_normalized_title.get(normalize_song_text(title))
+        return song
+
+    def get_songs(self, titles):
+        """Return (songs in the requested order, titles that were not found)."""
+        songs = []
+        missing = []
+        for title in titles:
+            song = self.get_song(title)
+            if song is None:
+                missing.append(title)
+            else:
+                songs.append(song)
+        return songs, missing
+
+
+VALIDATION_SAMPLE_LIMIT = 50  # problems listed per category
+
+
+def validate_song_file(file_path, generate_toc=True, alphabetical_index=False,
+                       slide_width=DEFAULT_SLIDE_WIDTH, slide_height=DEFAULT_SLIDE_HEIGHT, find_duplicates=False,
+                       template=None):
+    """Dry-run a song file (or compiled .songs corpus) on disk; see validate_songs."""
+    if is_song_corpus(file_path):
+        corpus = load_song_corpus(file_path)
+        return validate_songs(corpus.songs, corpus.encoding, generate_toc, alphabetical_index,
+                              slide_width, slide_height, find_duplicates, template)
+    content, encoding = read_song_file(file_path)
+    return validate_song_text(content, encoding, generate_toc, alphabetical_index,
+                              slide_width, slide_height, find_duplicates, template)
+
+
+def validate_song_text(content, encoding='utf-8', generate_toc=True, alphabetical_index=False,
+                       slide_width=DEFAULT_SLIDE_WIDTH, slide_height=DEFAULT_SLIDE_HEIGHT, find_duplicates=False,
+                       template=None):
+    """Dry-run song file text; see validate_songs."""
+    return validate_songs(parse_song_text(content), encoding, generate_toc, alphabetical_index,
+                          slide_width, slide_height, find_duplicates, template)
+
+
+def validate_songs(songs, encoding='utf-8', generate_toc=True, alphabetical_index=False,
+                   slide_width=DEFAULT_SLIDE_WIDTH, slide_height=DEFAULT_SLIDE_HEIGHT, find_duplicates=False,
+                   template=None):
+    """
+    Dry-run parsed songs: split them exactly like generation would, without
+    python-pptx, and report what the deck would contain.
+
+    Lines are measured against create_slide's lyrics box (28pt, 0.5" + 0.2"
+    insets each side) and slides whose wrapped lines would not fit in the
+    box height are reported as overfull. template is the template analysis
+    the deck will be built with (load_template_info in generator.py): its
+    slide size, text offset and bottom limit move and shorten the lyrics
+    box and the TOC as create_slide does. Without it geometry assumes a
+    plain slide_width x slide_height slide. With find_duplicates the report
+    also lists duplicate songs (see find_duplicate_songs).
+
+    Returns:
+        dict: songs, slides, toc_slides, encoding, per-song slide counts and
+        problem lists (empty_songs, overlong_lines, overfull_slides)
+    """
+    top_offset, bottom_limit = 0, slide_height
+    if template is not None:
+        slide_width, slide_height = template['slide_width'], template['slide_height']
+        top_offset, bottom_limit = template['top_offset'], template['bottom_limit']
+    line_width = slide_width - inches(1.0) - 2 * inches(0.2)
+    line_height = points(28 * 1.2)
+    paragraph_gap = points(16)
+    box_height = min(slide_height - inches(1.9), bottom_limit - inches(1.4) - top_offset) - 2 * inches(0.05)
+    # Lines this short cannot wrap even if every character were the widest one
+    safe_length = int(line_width // (points(28) * max(_CHAR_WIDTHS.values()) / 1000))
+
+    per_song = []
+    empty_songs = []
+    overlong_lines = []
+    overfull_slides = []
+    wrapped_rows = {}
+    total_slides = 0
+
+    for song in songs:
+        lyric_slides = song_slides(song)
+        per_song.append({'title': song['title'], 'slides': len(lyric_slides)})
+        total_slides += len(lyric_slides)
+        if not lyric_slides:
+            empty_songs.append(song['title'])
+
+        for slide_index, slide_lines in enumerate(lyric_slides):
+            rows = 0
+            for line in slide_lines:
+                wrapped = 1
+                if len(line) > safe_length:
+                    wrapped = wrapped_rows.get(line)
+                    if wrapped is None:
+                        # Choruses repeat, so each distinct line is measured once
+                        wrapped = wrapped_rows[line] = max(1, math.ceil(estimate_text_width(line, 28) / line_width))
+                    if wrapped > 1:
+                        overlong_lines.append({'song': song['title'], 'slide': slide_index + 1, 'line': line})
+                rows += wrapped
+            height = rows * line_height + (len(slide_lines) - 1) * paragraph_gap
+            if height > box_height:
+                overfull_slides.append({'song': song['title'], 'slide': slide_index + 1,
+                                        'lines': len(slide_lines)})
+
+    toc_slides = 0
+    if generate_toc and songs:
+        layout = plan_toc_layout([song['title'] for song in songs], slide_width, slide_height,
+                                 alphabetical_index, top_offset=top_offset, bottom_limit=bottom_limit)
+        toc_slides = layout['slide_count']
+
+    report = {
+        'songs': len(songs),
+        'slides': total_slides,
+        'toc_slides': toc_slides,
+        'total_slides': total_slides + toc_slides,
+        'encoding': encoding,
+        'per_song': per_song,
+        'empty_songs': empty_songs,
+        'overlong_lines': overlong_lines[:VALIDATION_SAMPLE_LIMIT],
+        'overlong_line_count': len(overlong_lines),
+        'overfull_slides': overfull_slides[:VALIDATION_SAMPLE_LIMIT],
+        'overfull_slide_count': len(overfull_slides),
+    }
+
+    if find_duplicates:
+        groups = find_duplicate_songs(songs)
+        duplicates = [duplicate['index'] for group in groups for duplicate in group['duplicates']]
+        report.update({
+            'duplicates': [
+                {'keep': songs[group['keep']]['title'],
+                 'duplicates': [{'title': songs[duplicate['index']]['title'],
+                                 'similarity': duplicate['similarity']} for duplicate in group['duplicates']]}
+                for group in groups[:VALIDATION_SAMPLE_LIMIT]
+            ],
+            'duplicate_group_count': len(groups),
+            'duplicate_song_count': len(duplicates),
+            'duplicate_slide_count': sum(per_song[i]['slides'] for i in duplicates),
+        })
+
+    return report
+
+
+def format_validation_report(report):
+    """Human-readable summary of validate_song_file output."""
+    lines = [
+        f"Songs: {report['songs']}",
+        f"Slides: {report['slides']} song slides + {report['toc_slides']} TOC slides"
+        f" = {report['total_slides']}",
+        f"Encoding: {report['encoding']}" + (" (not UTF-8, fell back to latin-1)"
+                                            if report['encoding'] != 'utf-8' else ""),
+    ]
+    if not report['songs']:
+        lines.append("❌ No songs found. Make sure song titles start with #")
+    if report['empty_songs']:
+        lines.append(f"⚠️  {len(report['empty_songs'])} songs without lyrics:")
+        lines.extend(f"   - {title}" for title in report['empty_songs'][:VALIDATION_SAMPLE_LIMIT])
+    if report['overlong_line_count']:
+        lines.append(f"⚠️  {report['overlong_line_count']} lines wrap on the slide:")
+        lines.extend(f"   - {item['song']} (slide {item['slide']}): {item['line']}"
+                     for item in report['overlong_lines'])
+    if report['overfull_slide_count']:
+        lines.append(f"⚠️  {report['overfull_slide_count']} slides have more text than fits:")
+        lines.extend(f"   - {item['song']} (slide {item['slide']}, {item['lines']} lines)"
+                     for item in report['overfull_slides'])
+    if report.get('duplicate_song_count'):
+        lines.append(f"⚠️  {report['duplicate_song_count']} duplicate songs"
+                     f" ({report['duplicate_slide_count']} slides) in {report['duplicate_group_count']} groups:")
+        for group in report['duplicates']:
+            lines.append(f"   - {group['keep']}")
+            for duplicate in group['duplicates']:
+                label = ("identical" if duplicate['similarity'] == 1.0
+                         else f"{duplicate['similarity']:.0%} similar")
+                lines.append(f"       = {duplicate['title']} ({label})")
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python songs.py <song_file> [--no-toc] [--toc-index] [--duplicates] [--json]")
+        print("       python songs.py <song_file> --compile=<corpus.songs>")
+        sys.exit(1)
+
+    for arg in sys.argv:
+        if arg.startswith('--compile='):
+            corpus_path = arg.split('=', 1)[1]
+            song_count = compile_song_corpus(sys.argv[1], corpus_path)
+            print(f"✅ Compiled {song_count} songs into {corpus_path}")
+            sys.exit(0)
+
+    report = validate_song_file(
+        sys.argv[1],
+        generate_toc='--no-toc' not in sys.argv,
+        alphabetical_index='--toc-index' in sys.argv,
+        find_duplicates='--duplicates' in sys.argv
+    )
+
+    if '--json' in sys.argv:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(format_validation_report(report))
+
+    if not report['songs']:
+        sys.exit(1)
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+File Storage - Web Version
+Where uploaded and generated files live: a local folder (one instance) or
+an S3-compatible bucket (AWS S3, MinIO, Cloudflare R2, ...) shared by every
+instance, so any of them can serve any job's output. Files are streamed in
+chunks both ways; large ones go to S3 as multipart uploads.
+"""
+
+import hashlib
+import hmac
+import http.client
+import io
+import os
+import shutil
+import time
+import urllib.parse
+from collections import namedtuple
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from xml.etree import ElementTree as ET
+
+CHUNK_SIZE = 1024 * 1024
+MULTIPART_PART_SIZE = 8 * 1024 * 1024  # S3 parts must be at least 5 MiB, except the last
+ETAG_METADATA = 'x-amz-meta-content-sha256'  # content hash kept with each S3 object
+
+# key: 'generated/songs.pptx'; modified: unix time; etag: content hash (None from list())
+StoredFile = namedtuple('StoredFile', 'key size modified etag')
+
+
+class StorageError(OSError):
+    """A storage request failed (status is the HTTP status for S3)."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def file_content_hash(file_path):
+    """Content hash used as the ETag of a stored file."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+
+class LocalStorage(object):
+    """
+    Files under a local folder; a key like 'generated/x.pptx' is that path
+    below root. Content hashes are computed on first use and kept until the
+    file's size or modification time changes.
+    """
+
+    is_local = True
+
+    def __init__(self, root='.'):
+        self.root = root
+        self._etags = {}  # path -> (size, mtime_ns, content hash)
+
+    def path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def put_file(self, key, file_path):
+        """Store a local file under key (nothing to copy if it already is there)."""
+        target = self.path(key)
+        if os.path.abspath(file_path) != os.path.abspath(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            temp_path = f"{target}.{os.getpid()}.tmp"
+            shutil.copyfile(file_path, temp_path)
+            os.replace(temp_path, target)
+        return self.stat(key)
+
+    def put_bytes(self, key, data):
+        """Store small contents (job records) under key, replacing it atomically."""
+        target = self.path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temp_path = f"{target}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, target)
+
+    def get_bytes(self, key):
+        """Contents stored under key, or None."""
+        try:
+            with open(self.path(key), 'rb') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def fetch(self, key, file_path):
+        """Make the file available at file_path, which is returned."""
+        source = self.path(key)
+        if os.path.abspath(file_path) != os.path.abspath(source):
+            shutil.copyfile(source, file_path)
+        return file_path
+
+    def stat(self, key):
+        """StoredFile for key, or None if there is no such file."""
+        path = self.path(key)
+        if not os.path.isfile(path):
+            return None
+        stat = os.stat(path)
+        cached = self._etags.get(path)
+        if not cached or cached[:2] != (stat.st_size, stat.st_mtime_ns):
+            cached = self._etags[path] = (stat.st_size, stat.st_mtime_ns, file_content_hash(path))
+        return StoredFile(key, stat.st_size, stat.st_mtime, cached[2])
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def delete(self, key):
+        path = self.path(key)
+        self._etags.pop(path, None)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix):
+        """StoredFiles (without etags) directly below the folder prefix, e.g. 'uploads/'."""
+        folder = self.path(prefix.rstrip('/'))
+        try:
+            entries = list(os.scandir(folder))
+        except FileNotFoundError:
+            return []
+        return [StoredFile(prefix + entry.name, entry.stat().st_size, entry.stat().st_mtime, None)
+                for entry in entries if entry.is_file()]
+
+
+class _S3ObjectReader(io.RawIOBase):
+    """
+    Seekable, read-only view of an S3 object. Nothing is requested until the
+    first read; each read after a seek starts a new ranged GET, so serving a
+    byte range only transfers that range.
+    """
+
+    def __init__(self, storage, key):
+        super().__init__()
+        self._storage = storage
+        self._key = key
+        self._position = 0
+        self._connection = None
+        self._response = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._storage.stat(self._key).size
+        if offset != self._position:
+            self._drop()
+            self._position = offset
+        return offset
+
+    def readinto(self, buffer):
+        if self._response is None:
+            self._connection, self._response = self._storage._request(
+                'GET', self._key, headers={'Range': f'bytes={self._position}-'}, stream=True,
+                accept=(200, 206, 416))
+        if self._response.status == 416:
+            return 0  # at or past the end
+        count = self._response.readinto(buffer)
+        self._position += count
+        return count
+
+    def _drop(self):
+        if self._connection is not None:
+            self._connection.close()
+        self._connection = self._response = None
+
+    def close(self):
+        self._drop()
+        super().close()
+
+
+class S3Storage(object):
+    """
+    Files in an S3-compatible bucket, addressed path-style (endpoint/bucket/key)
+    so MinIO and other stand-ins work as well as AWS. Requests are signed
+    with AWS Signature Version 4 using only the standard library; every
+    call opens its own connection, so one instance is safe to share
+    between threads.
+    """
+
+    is_local = False
+
+    def __init__(self, bucket, endpoint_url=None, region='us-east-1', access_key='', secret_key='', prefix='',
+                 timeout=60):
+        self.bucket = bucket
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.prefix = prefix
+        self.timeout = timeout
+        url = urllib.parse.urlsplit(endpoint_url or f"https://s3.{region}.amazonaws.com")
+        self._https = url.scheme == 'https'
+        self._host = url.netloc
+        self._base_path = url.path.rstrip('/')
+
+    def _sign(self, method, path, query, headers, payload_hash, now):
+        """Add the x-amz-* and Authorization headers of a Signature Version 4 request."""
+        amz_date = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(now))
+        date = amz_date[:8]
+        headers['x-amz-date'] = amz_date
+        headers['x-amz-content-sha256'] = payload_hash
+        signed = sorted((name.lower(), ' '.join(str(value).split())) for name, value in headers.items())
+        signed_names = ';'.join(name for name, _ in signed)
+        canonical_query = '&'.join(
+            f"{urllib.parse.quote(name, safe='~')}={urllib.parse.quote(value, safe='~')}"
+            for name, value in sorted(query.items())
+        )
+        canonical_request = '\n'.join([
+            method, urllib.parse.quote(path, safe='/~'), canonical_query,
+            ''.join(f"{name}:{value}\n" for name, value in signed), signed_names, payload_hash
+        ])
+        scope = f"{date}/{self.region}/s3/aws4_request"
+        string_to_sign = '\n'.join([
+            'AWS4-HMAC-SHA256', amz_date, scope, hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()
+        ])
+        key = ('AWS4' + self.secret_key).encode('utf-8')
+        for part in (date, self.region, 's3', 'aws4_request'):
+            key = hmac.new(key, part.encode('utf-8'), hashlib.sha256).digest()
+        signature = hmac.new(key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+        headers['Authorization'] = (f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+                                    f"SignedHeaders={signed_names}, Signature={signature}")
+        return headers
+
+    def _request(self, method, key, query=None, headers=None, body=b'', stream=False, accept=(200,)):
+        """
+        Send one signed request for key ('' for the bucket itself). Returns
+        the response body, or (connection, response) with stream=True for
+        the caller to read and close. Raises StorageError on other statuses.
+        """
+        path = f"{self._base_path}/{self.bucket}"
+        if key:
+            path += '/' + self.prefix + key
+        query = query or {}
+        headers = dict(headers or {})
+        headers['Host'] = self._host
+        if body:
+            headers['Content-Length'] = str(len(body))
+        self._sign(method, path, query, headers, hashlib.sha256(body).hexdigest(), time.time())
+
+        target = urllib.parse.quote(path, safe='/~')
+        if query:
+            target += '?' + urllib.parse.urlencode(sorted(query.items()), quote_via=urllib.parse.quote, safe='~')
+        connection_class = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+        connection = connection_class(self._host, timeout=self.timeout)
+        try:
+            connection.request(method, target, body=body or None, headers=headers)
+            response = connection.getresponse()
+            if response.status not in accept:
+                message = response.read(2048).decode('utf-8', 'replace')
+                raise StorageError(f"S3 {method} {key or self.bucket} failed with {response.status}: {message}",
+                                   response.status)
+        except BaseException:
+            connection.close()
+            raise
+        if stream:
+            return connection, response
+        try:
+            return response.read()
+        finally:
+            connection.close()
+
+    def put_file(self, key, file_path):
+        """Upload a local file, as one PUT or in MULTIPART_PART_SIZE parts."""
+        etag = file_content_hash(file_path)
+        metadata = {ETAG_METADATA: etag}
+        with open(file_path, 'rb') as file:
+            part = file.read(MULTIPART_PART_SIZE)
+            if len(part) < MULTIPART_PART_SIZE:
+                self._request('PUT', key, headers=metadata, body=part)
+            else:
+                upload_id = ET.fromstring(self._request('POST', key, {'uploads': ''}, metadata)).findtext(
+                    '{http://s3.amazonaws.com/doc/2006-03-01/}UploadId')
+                try:
+                    parts = []
+                    while part:
+                        connection, response = self._request(
+                            'PUT', key, {'partNumber': str(len(parts) + 1), 'uploadId': upload_id},
+                            body=part, stream=True)
+                        response.read()
+                        connection.close()
+                        parts.append(response.getheader('ETag'))  # needed to complete the upload
+                        part = file.read(MULTIPART_PART_SIZE)
+                    self._request('POST', key, {'uploadId': upload_id}, body=(
+                        '<CompleteMultipartUpload>' + ''.join(
+                            f'<Part><PartNumber>{number}</PartNumber><ETag>{part_etag}</ETag></Part>'
+                            for number, part_etag in enumerate(parts, 1)
+                        ) + '</CompleteMultipartUpload>').encode('utf-8'))
+                except BaseException:
+                    try:
+                        self._request('DELETE', key, {'uploadId': upload_id}, accept=(204, 404))
+                    except OSError:
+                        pass
+                    raise
+        return self.stat(key)
+
+    def put_bytes(self, key, data):
+        """Store small contents (job records) under key with one PUT."""
+        self._request('PUT', key, body=data)
+
+    def get_bytes(self, key):
+        """Contents stored under key, or None."""
+        connection, response = self._request('GET', key, stream=True, accept=(200, 404))
+        try:
+            data = response.read()
+        finally:
+            connection.close()
+        return data if response.status == 200 else None
+
+    def fetch(self, key, file_path):
+        """Download key to file_path (streamed), which is returned."""
+        connection, response = self._request('GET', key, stream=True)
+        temp_path = f"{file_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'wb') as file:
+                shutil.copyfileobj(response, file, CHUNK_SIZE)
+            os.replace(temp_path, file_path)
+        finally:
+            connection.close()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return file_path
+
+    def stat(self, key):
+        """StoredFile for key, or None if there is no such object."""
+        connection, response = self._request('HEAD', key, stream=True, accept=(200, 404))
+        connection.close()
+        if response.status == 404:
+            return None
+        etag = response.getheader(ETAG_METADATA) or response.getheader('ETag', '').strip('"')
+        modified = parsedate_to_datetime(response.getheader('Last-Modified')).timestamp()
+        return StoredFile(key, int(response.getheader('Content-Length', 0)), modified, etag)
+
+    def open(self, key):
+        return _S3ObjectReader(self, key)
+
+    def delete(self, key):
+        self._request('DELETE', key, accept=(200, 204, 404))
+
+    def list(self, prefix):
+        """StoredFiles (without content hashes) whose keys start with prefix."""
+        namespace = '{http://s3.amazonaws.com/doc/2006-03-01/}'
+        files = []
+        query = {'list-type': '2', 'prefix': self.prefix + prefix}
+        while True:
+            result = ET.fromstring(self._request('GET', '', query))
+            for item in result.iter(f'{namespace}Contents'):
+                modified = datetime.fromisoformat(item.findtext(f'{namespace}LastModified').replace('Z', '+00:00'))
+                files.append(StoredFile(item.findtext(f'{namespace}Key')[len(self.prefix):],
+                                        int(item.findtext(f'{namespace}Size')), modified.timestamp(), None))
+            token = result.findtext(f'{namespace}NextContinuationToken')
+            if result.findtext(f'{namespace}IsTruncated') != 'true' or not token:
+                return files
+            query['continuation-token'] = token
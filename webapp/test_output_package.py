@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""Test script for the saved .pptx packages (compression profiles, setlists and TOC links)."""
+
+import io
+import os
+import re
+import tempfile
+import zipfile
+from PIL import Image
+from pptx import Presentation
+from pptx.util import Inches
+from generator import (
+    create_slide, extract_setlist, generate_presentation, save_presentation,
+    COMPRESSION_PROFILES
+)
+
+SONGS = """# Amazing Grace
+
+Amazing grace how sweet the sound
+That saved a wretch like me
+
+I once was lost but now am found
+Was blind but now I see
+
+# Be Thou My Vision
+
+Be thou my vision O Lord of my heart
+Naught be all else to me save that thou art
+
+# Come Thou Fount
+
+Come thou fount of every blessing
+Tune my heart to sing thy grace
+
+Streams of mercy never ceasing
+Call for songs of loudest praise
+
+Teach me some melodious sonnet
+Sung by flaming tongues above
+"""
+
+
+def write_song_file(folder):
+    """Write the sample songs and return the file path."""
+    song_file = os.path.join(folder, "songs.txt")
+    with open(song_file, "w", encoding="utf-8") as f:
+        f.write(SONGS)
+    return song_file
+
+
+def open_package(path):
+    """Check the zip is intact and reopen it with python-pptx."""
+    with zipfile.ZipFile(path) as package:
+        assert package.testzip() is None, f"Corrupt member in {path}"
+    return Presentation(path)
+
+
+def slide_title(slide):
+    """Text of the first text box (the title on generated slides)."""
+    return next(shape.text_frame.text for shape in slide.shapes if shape.has_text_frame)
+
+
+def check_toc_links(prs):
+    """Every numbered TOC entry must link to the first slide of its song; returns the targets."""
+    slides = list(prs.slides)
+    links = []
+    for slide in slides:
+        for shape in slide.shapes:
+            if not shape.has_text_frame:
+                continue
+            for paragraph in shape.text_frame.paragraphs:
+                for run in paragraph.runs:
+                    address = run.hyperlink.address
+                    entry = re.match(r'\s*\d+\. (.*)', run.text)
+                    if not address or not entry:
+                        continue
+                    target = int(address.lstrip('#'))
+                    assert 1 <= target <= len(slides), f"TOC link {address} is out of range"
+                    assert slide_title(slides[target - 1]) == entry.group(1), \
+                        f"TOC entry '{run.text}' links to '{slide_title(slides[target - 1])}'"
+                    links.append(target)
+    return links
+
+
+def test_save_profiles():
+    """Save with every compression profile and reopen the result."""
+    print("🧪 Testing compression profiles...")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as folder:
+        # Deck with lyric slides and a picture, so media members are written too
+        prs = Presentation()
+        for n in range(1, 4):
+            create_slide(prs, "Sample Song", ["La la la", "Na na na"], n, 3)
+        picture = io.BytesIO()
+        Image.new("RGB", (64, 48), (200, 30, 30)).save(picture, "PNG")
+        picture.seek(0)
+        prs.slides.add_slide(prs.slide_layouts[6]).shapes.add_picture(
+            picture, Inches(1), Inches(1)
+        )
+
+        song_file = write_song_file(folder)
+
+        for profile in COMPRESSION_PROFILES:
+            output_file = os.path.join(folder, f"deck_{profile}.pptx")
+            save_presentation(prs, output_file, compression=profile)
+            reopened = open_package(output_file)
+            assert len(reopened.slides) == 4, f"{profile}: expected 4 slides"
+
+            toc_file = os.path.join(folder, f"toc_{profile}.pptx")
+            success, message, slide_count = generate_presentation(
+                song_file, toc_file, generate_toc=True, compression=profile
+            )
+            assert success, message
+            reopened = open_package(toc_file)
+            assert len(reopened.slides) == slide_count, \
+                f"{profile}: {len(reopened.slides)} slides, reported {slide_count}"
+            links = check_toc_links(reopened)
+            assert len(links) == 3, f"{profile}: expected 3 TOC links, found {len(links)}"
+
+            size = os.path.getsize(output_file) / 1024
+            print(f"✅ {profile}: {slide_count} slides, {len(links)} TOC links, {size:.1f} KB")
+
+
+def test_setlist_with_repeated_song():
+    """Extract a setlist that repeats a song and reopen the result."""
+    print("🧪 Testing setlist extraction...")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as folder:
+        song_file = write_song_file(folder)
+        master_file = os.path.join(folder, "master.pptx")
+        success, message, _ = generate_presentation(song_file, master_file, generate_toc=True)
+        assert success, message
+
+        setlist = ["Come Thou Fount", "Amazing Grace", "Come Thou Fount"]
+        setlist_file = os.path.join(folder, "setlist.pptx")
+        success, message, slide_count = extract_setlist(
+            master_file, setlist, setlist_file, generate_toc=True
+        )
+        assert success, message
+
+        # 1 TOC slide + Come Thou Fount (3) + Amazing Grace (2) + Come Thou Fount (3)
+        reopened = open_package(setlist_file)
+        assert slide_count == 9, f"Expected 9 slides, reported {slide_count}"
+        assert len(reopened.slides) == slide_count, \
+            f"{len(reopened.slides)} slides, reported {slide_count}"
+        titles = [slide_title(slide) for slide in reopened.slides][1:]
+        assert titles == ["Come Thou Fount"] * 3 + ["Amazing Grace"] * 2 + ["Come Thou Fount"] * 3, \
+            f"Unexpected slide order: {titles}"
+        # The repeated song gets its own entry pointing at its second copy
+        links = check_toc_links(reopened)
+        assert links == [2, 5, 7], f"Unexpected TOC link targets: {links}"
+
+        print(f"✅ {message}")
+        print(f"🔗 TOC links: {', '.join(f'#{target}' for target in links)}")
+
+
+if __name__ == "__main__":
+    test_save_profiles()
+    test_setlist_with_repeated_song()